@@ -0,0 +1,326 @@
+"""Analytics module: usage reports over the whole ledger (``!analytics``).
+
+``!stats`` only sees the current process. This module answers where
+time went across weeks of use by loading ``kernel_call``, ``command``
+and finished ``job`` events into NumPy columns and aggregating them
+with vectorized operations:
+
+- Model latency percentiles and generation speed per model.
+- Throughput over time (calls, generated tokens, tokens/s), per day,
+  or per hour for spans under two days.
+- Failure rates by command, grouped by the program (first word).
+- The slowest model calls.
+
+Speculative prefetches (``kernel_call`` events marked ``speculative``)
+get a summary line of their own and are left out of every other figure,
+which describe requests someone waited on.
+
+Lines of other kinds are skipped before JSON decoding, and
+categorical fields (model, program) are interned into integer codes
+as they are read, so millions of events load in seconds. Events
+written before the ledger recorded durations and token counts load
+as NaN and are left out of those figures.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger("orchestrator")
+
+_KERNEL_CALL = b'"kind": "kernel_call"'
+_COMMAND = b'"kind": "command"'
+_JOB = b'"kind": "job"'
+_NAN = float("nan")
+
+
+class _Interner:
+    """Maps strings to dense integer codes."""
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, int] = {}
+        self.names: List[str] = []
+
+    def __call__(self, name: str) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+
+@dataclass
+class KernelColumns:
+    time: np.ndarray  # epoch seconds
+    duration_ms: np.ndarray
+    prompt_tokens: np.ndarray
+    completion_tokens: np.ndarray
+    failed: np.ndarray  # bool: cancelled, deadline, ...
+    cached: np.ndarray  # bool: served from the daemon's completion cache or recalled from semantic memory
+    speculative: np.ndarray  # bool: prefetch generated before it was requested
+    model: np.ndarray  # codes into ``models``
+    models: List[str]
+    prompt_hash: List[str]
+
+    def select(self, rows: np.ndarray) -> "KernelColumns":
+        return KernelColumns(
+            time=self.time[rows],
+            duration_ms=self.duration_ms[rows],
+            prompt_tokens=self.prompt_tokens[rows],
+            completion_tokens=self.completion_tokens[rows],
+            failed=self.failed[rows],
+            cached=self.cached[rows],
+            speculative=self.speculative[rows],
+            model=self.model[rows],
+            models=self.models,
+            prompt_hash=[h for h, keep in zip(self.prompt_hash, rows) if keep],
+        )
+
+
+@dataclass
+class CommandColumns:
+    time: np.ndarray
+    duration_ms: np.ndarray
+    exit_code: np.ndarray  # NaN when unknown
+    program: np.ndarray  # codes into ``programs``
+    programs: List[str]
+
+
+def _timestamps(values: List[str]) -> np.ndarray:
+    """ISO timestamps to epoch seconds; NumPy parses the UTC ones in bulk."""
+
+    if not values:
+        return np.empty(0)
+    try:
+        stamps = np.array([v[:-6] if v.endswith("+00:00") else v for v in values], dtype="datetime64[us]")
+        return stamps.astype(np.int64) / 1e6
+    except ValueError:  # another offset somewhere; parse one by one
+        return np.array([datetime.fromisoformat(v).timestamp() for v in values])
+
+
+def _number(value: Any) -> float:
+    return _NAN if value is None else float(value)
+
+
+def load_columns(ledger_path: Path) -> Tuple[KernelColumns, CommandColumns]:
+    """Read the ledger into column arrays."""
+
+    k_time: List[str] = []
+    k_duration: List[float] = []
+    k_prompt: List[float] = []
+    k_completion: List[float] = []
+    k_failed: List[bool] = []
+    k_cached: List[bool] = []
+    k_speculative: List[bool] = []
+    k_model: List[int] = []
+    k_hash: List[str] = []
+    models = _Interner()
+    c_time: List[str] = []
+    c_duration: List[float] = []
+    c_exit: List[float] = []
+    c_program: List[int] = []
+    programs = _Interner()
+
+    with ledger_path.open("rb") as f:
+        for line in f:
+            if _KERNEL_CALL in line:
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                p = event["payload"]
+                k_time.append(event["timestamp"])
+                k_duration.append(_number(p.get("duration_ms")))
+                k_prompt.append(_number(p.get("prompt_tokens")))
+                k_completion.append(_number(p.get("completion_tokens")))
+                k_failed.append("status" in p)
+                k_cached.append("cached" in p or "recalled_from" in p)
+                k_speculative.append("speculative" in p)
+                k_model.append(models(p.get("model") or "-"))
+                k_hash.append(p.get("prompt_hash") or "")
+            elif _COMMAND in line or (_JOB in line and b'"action": "finish"' in line):
+                try:
+                    event = json.loads(line)
+                except ValueError:
+                    continue
+                p = event["payload"]
+                words = p.get("command", "").split()
+                c_time.append(event["timestamp"])
+                c_duration.append(_number(p.get("duration_ms")))
+                c_exit.append(_number(p.get("exit_code")))
+                c_program.append(programs(words[0] if words else "-"))
+
+    kernel = KernelColumns(
+        time=_timestamps(k_time),
+        duration_ms=np.array(k_duration, dtype=np.float64),
+        prompt_tokens=np.array(k_prompt, dtype=np.float64),
+        completion_tokens=np.array(k_completion, dtype=np.float64),
+        failed=np.array(k_failed, dtype=bool),
+        cached=np.array(k_cached, dtype=bool),
+        speculative=np.array(k_speculative, dtype=bool),
+        model=np.array(k_model, dtype=np.int32),
+        models=models.names,
+        prompt_hash=k_hash,
+    )
+    commands = CommandColumns(
+        time=_timestamps(c_time),
+        duration_ms=np.array(c_duration, dtype=np.float64),
+        exit_code=np.array(c_exit, dtype=np.float64),
+        program=np.array(c_program, dtype=np.int32),
+        programs=programs.names,
+    )
+    return kernel, commands
+
+
+def group_percentiles(groups: np.ndarray, values: np.ndarray, quantiles: List[float]) -> Dict[int, List[float]]:
+    """Per-group nearest-rank percentiles of ``values``, ignoring NaN, in one sort."""
+
+    keep = ~np.isnan(values)
+    groups, values = groups[keep], values[keep]
+    if not len(values):
+        return {}
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    counts = np.diff(np.r_[starts, len(values)])
+    picks = [values[starts + np.floor(q * (counts - 1)).astype(np.int64)] for q in quantiles]
+    return {int(g): [float(p[i]) for p in picks] for i, g in enumerate(groups[starts])}
+
+
+def _seconds(ms: float) -> str:
+    return "-" if math.isnan(ms) else f"{ms / 1000:.2f}s"
+
+
+def _when(epoch: float, fmt: str = "%Y-%m-%d %H:%M") -> str:
+    return datetime.fromtimestamp(epoch, timezone.utc).strftime(fmt)
+
+
+def _kernel_lines(k: KernelColumns, top: int) -> List[str]:
+    # Prefetches are reported on their own line; everything else covers requests someone waited on.
+    spec = k.select(k.speculative)
+    k = k.select(~k.speculative)
+    lines = []
+    if len(k.time):
+        lines.append(
+            f"model calls: {len(k.time)}, failed/cancelled {int(k.failed.sum())} ({k.failed.mean():.1%}), "
+            f"cached/recalled {int(k.cached.sum())}"
+        )
+    else:
+        lines.append("model calls: none recorded")
+    if len(spec.time):
+        lines.append(
+            f"speculative prefetches: {len(spec.time)}, discarded/failed {int(spec.failed.sum())}, "
+            f"{int(np.nan_to_num(spec.completion_tokens).sum())} tokens generated"
+        )
+    if not len(k.time):
+        return lines
+    with np.errstate(divide="ignore", invalid="ignore"):
+        speed = k.completion_tokens / (k.duration_ms / 1000.0)
+    speed[~np.isfinite(speed)] = _NAN
+    latency = group_percentiles(k.model, k.duration_ms, [0.5, 0.9, 0.99])
+    rates = group_percentiles(k.model, speed, [0.5])
+    calls = np.bincount(k.model, minlength=len(k.models))
+    tokens = np.bincount(k.model, weights=np.nan_to_num(k.completion_tokens), minlength=len(k.models))
+    lines.append("  model                 calls  p50/p90/p99 latency      tokens  tok/s p50")
+    for code in map(int, np.argsort(-calls, kind="stable")):
+        if code not in latency:
+            continue
+        p50, p90, p99 = latency[code]
+        rate = rates.get(code, [_NAN])[0]
+        lines.append(
+            f"  {k.models[code][:20]:<20} {calls[code]:>6}  {_seconds(p50)}/{_seconds(p90)}/{_seconds(p99):<9}"
+            f" {int(tokens[code]):>10}  {'-' if math.isnan(rate) else f'{rate:.1f}':>9}"
+        )
+
+    # Throughput per day, or per hour for short spans.
+    span = k.time.max() - k.time.min()
+    width, fmt = (3600.0, "%m-%d %H:00") if span < 2 * 86400 else (86400.0, "%Y-%m-%d")
+    starts, bucket = np.unique(np.floor(k.time / width).astype(np.int64), return_inverse=True)
+    calls = np.bincount(bucket)
+    tokens = np.bincount(bucket, weights=np.nan_to_num(k.completion_tokens))
+    rates = group_percentiles(bucket, speed, [0.5])
+    lines.append("throughput:")
+    for b in range(len(starts))[-top:]:
+        rate = rates.get(b, [_NAN])[0]
+        lines.append(
+            f"  {_when(starts[b] * width, fmt):<16} {calls[b]:>6} calls {int(tokens[b]):>9} tokens"
+            f"  {'-' if math.isnan(rate) else f'{rate:.1f}'} tok/s"
+        )
+
+    timed = np.flatnonzero(~np.isnan(k.duration_ms))
+    slowest = timed[np.argsort(-k.duration_ms[timed], kind="stable")[:top]]
+    if len(slowest):
+        lines.append("slowest model calls:")
+        for i in slowest:
+            tokens_text = "-" if math.isnan(k.completion_tokens[i]) else f"{int(k.completion_tokens[i])} tokens"
+            lines.append(
+                f"  {_seconds(k.duration_ms[i]):>8}  {_when(k.time[i])}  {k.models[k.model[i]]}  "
+                f"prompt {k.prompt_hash[i][:12]}  {tokens_text}{'  (failed)' if k.failed[i] else ''}"
+            )
+    return lines
+
+
+def _command_lines(c: CommandColumns, top: int) -> List[str]:
+    if not len(c.time):
+        return ["commands: none recorded"]
+    known = ~np.isnan(c.exit_code)
+    failed = known & (c.exit_code != 0)
+    runs = np.bincount(c.program, minlength=len(c.programs))
+    failures = np.bincount(c.program, weights=failed, minlength=len(c.programs))
+    durations = group_percentiles(c.program, c.duration_ms, [0.5, 0.95])
+    lines = [f"commands: {len(c.time)}, failed {int(failed.sum())} ({failed.sum() / max(1, known.sum()):.1%})"]
+    lines.append("  program               runs  failed    p50/p95 run time")
+    # Most failures first, then most runs.
+    for code in map(int, np.lexsort((-runs, -failures))[:top]):
+        if not runs[code]:
+            continue
+        p50, p95 = durations.get(code, [_NAN, _NAN])
+        lines.append(
+            f"  {c.programs[code][:20]:<20} {runs[code]:>5}  {failures[code] / runs[code]:>6.1%}"
+            f"    {_seconds(p50)}/{_seconds(p95)}"
+        )
+    return lines
+
+
+def analytics_report(ledger_path: Path, *, days: Optional[float] = None, top: int = 10) -> str:
+    """Text report for ``!analytics [DAYS]`` over the last ``days`` (default: all)."""
+
+    if not ledger_path.exists():
+        return "No ledger yet."
+    start = time.perf_counter()
+    kernel, commands = load_columns(ledger_path)
+    if days is not None:
+        cutoff = time.time() - days * 86400.0
+        k_rows, c_rows = kernel.time >= cutoff, commands.time >= cutoff
+        kernel = kernel.select(k_rows)
+        commands = CommandColumns(
+            time=commands.time[c_rows],
+            duration_ms=commands.duration_ms[c_rows],
+            exit_code=commands.exit_code[c_rows],
+            program=commands.program[c_rows],
+            programs=commands.programs,
+        )
+    lines = _kernel_lines(kernel, top) + _command_lines(commands, top)
+    scope = f"last {days:g} day(s)" if days is not None else "all time"
+    lines.append(f"({scope}; analysed in {time.perf_counter() - start:.2f}s)")
+    return "\n".join(lines)
+
+
+def analytics_command(ledger_path: Path, argument: str) -> str:
+    """Handle ``!analytics [DAYS]`` for either dashboard."""
+
+    argument = argument.strip()
+    try:
+        days = float(argument) if argument else None
+    except ValueError:
+        return f"Usage: !analytics [DAYS], got '{argument}'"
+    return analytics_report(ledger_path, days=days)
@@ -11,9 +11,11 @@ The tone of all messages follows the Deterministic Imperative.
 from __future__ import annotations
 
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Set, Tuple
 
 from rich.console import Console
 from rich.layout import Layout
@@ -22,8 +24,18 @@ from rich.panel import Panel
 from rich.table import Table
 
 from entropy_shield import EntropyShield
-from law_core import law_guarded_completion
+from kernel import CancelToken, GenerationCancelled
+from law_core import DEFAULT_DEADLINES, DEFAULT_TOKEN_BUDGETS, describe_fix, law_guarded_completion
+from prefetch import SpeculativePrefetcher, complete_with_prefetch
 from deterministic_agent import DeterministicAgent
+from diagnostics import CommandProfiler, collect_stats
+from history import CommandHistory
+from jobs import Job, JobError, JobTable, background_command, parse_job_id
+from router import route_kernel
+from session_resume import ResumedSession, resume_session
+
+if TYPE_CHECKING:
+    from semantic_index import SemanticMemory
 
 logger = logging.getLogger("orchestrator")
 
@@ -42,6 +54,8 @@ class UIState:
 
     thought_stream: List[ThoughtEvent] = field(default_factory=list)
     last_command: Optional[str] = None
+    # !explain and !fix refer to the last shell command, not to themselves.
+    last_shell_command: Optional[str] = None
     last_stdout: Optional[str] = None
     last_stderr: Optional[str] = None
     last_exit_code: Optional[int] = None
@@ -93,11 +107,11 @@ def _render_command_view(state: UIState) -> Panel:
         status_parts.append("stderr✖")
     status = " (" + ", ".join(status_parts) + ")" if status_parts else ""
     body = f"Last command: [bold]{cmd}[/bold]{status}\n"
-    body += "Type [bold]!ai[/bold] for chat, [bold]!explain[/bold] to explain last command, [bold]!fix[/bold] to diagnose errors."
+    body += "Type [bold]!ai[/bold] for chat, [bold]!explain[/bold] to explain last command, [bold]!fix[/bold] to diagnose errors, [bold]!search[/bold] to search the workspace, [bold]!bg[/bold] / [bold]!jobs[/bold] for background jobs, [bold]!stats[/bold] / [bold]!profile[/bold] for diagnostics."
     return Panel(body, title="Command Line", border_style="yellow")
 
 
-def build_layout(state: UIState, shield: EntropyShield) -> Layout:
+def _build_skeleton() -> Layout:
     layout = Layout()
     layout.split_column(
         Layout(name="upper", ratio=3),
@@ -107,6 +121,11 @@ def build_layout(state: UIState, shield: EntropyShield) -> Layout:
         Layout(name="thoughts"),
         Layout(name="source_of_truth", size=40),
     )
+    return layout
+
+
+def build_layout(state: UIState, shield: EntropyShield) -> Layout:
+    layout = _build_skeleton()
 
     layout["thoughts"].update(_render_thought_stream(state))
     layout["source_of_truth"].update(_render_source_of_truth(shield))
@@ -115,81 +134,318 @@ def build_layout(state: UIState, shield: EntropyShield) -> Layout:
     return layout
 
 
-def run_dashboard(shield: EntropyShield, kernel, agent: DeterministicAgent) -> None:
+class RenderPipeline:
+    """Cached, dirty-tracked, frame-limited rendering of the dashboard.
+
+    The layout skeleton is built once. Each panel's renderable is cached
+    and only rebuilt after ``invalidate`` names it. The Source of Truth
+    panel is invalidated automatically when the ledger file's size or
+    mtime changes, so the ledger is re-read only after a real append.
+    ``request_frame`` coalesces bursts of updates into at most
+    ``max_fps`` redraws per second; ``force=True`` flushes immediately.
+    """
+
+    PANELS = ("thoughts", "source_of_truth", "lower")
+
+    def __init__(self, state: UIState, shield: EntropyShield, *, max_fps: float = 15.0) -> None:
+        self.layout = _build_skeleton()
+        self._renderers: Dict[str, Callable[[], Panel]] = {
+            "thoughts": lambda: _render_thought_stream(state),
+            "source_of_truth": lambda: _render_source_of_truth(shield),
+            "lower": lambda: _render_command_view(state),
+        }
+        self._shield = shield
+        self._dirty: Set[str] = set(self.PANELS)
+        self._ledger_signature: Optional[Tuple[int, int]] = None
+        self._min_interval = 1.0 / max_fps
+        self._last_frame = float("-inf")
+        self.frames = 0
+        self.panel_renders: Dict[str, int] = {name: 0 for name in self.PANELS}
+
+    def invalidate(self, *names: str) -> None:
+        self._dirty.update(names or self.PANELS)
+
+    def _check_ledger(self) -> None:
+        try:
+            stat = self._shield.ledger_path.stat()
+            signature = (stat.st_size, stat.st_mtime_ns)
+        except OSError:
+            signature = None
+        if signature != self._ledger_signature:
+            self._ledger_signature = signature
+            self._dirty.add("source_of_truth")
+
+    def render(self) -> bool:
+        """Rebuild dirty panels into the layout. Return True if anything changed."""
+
+        self._check_ledger()
+        if not self._dirty:
+            return False
+        for name in self.PANELS:
+            if name in self._dirty:
+                self.layout[name].update(self._renderers[name]())
+                self.panel_renders[name] += 1
+        self._dirty.clear()
+        return True
+
+    def request_frame(self, live: Live, *, force: bool = False) -> bool:
+        """Redraw if something is dirty and the frame budget allows it."""
+
+        now = time.monotonic()
+        if not force and now - self._last_frame < self._min_interval:
+            return False
+        if not self.render():
+            return False
+        live.refresh()
+        self._last_frame = now
+        self.frames += 1
+        return True
+
+
+def _explain_prompt(state: UIState) -> Optional[str]:
+    if not state.last_shell_command:
+        return None
+    prompt = (
+        "You are a deterministic terminal assistant. Explain the following shell command "
+        "and its most recent result in clear, concise language."
+        f"\n\nCommand:\n{state.last_shell_command}\n"
+    )
+    if state.last_stdout:
+        prompt += f"\nLast stdout:\n{state.last_stdout}\n"
+    if state.last_stderr:
+        prompt += f"\nLast stderr (may indicate an error):\n{state.last_stderr}\n"
+    return prompt
+
+
+def _fix_prompt(state: UIState) -> Optional[str]:
+    if not state.last_shell_command:
+        return None
+    prompt = (
+        "You are a deterministic terminal assistant. The user ran this command and it did not "
+        "behave as expected. Analyze any errors and reply with JSON: \"command\" is a single corrected "
+        "command (no pipes or chaining) and \"explanation\" says briefly why it works."
+        f"\n\nCommand:\n{state.last_shell_command}\n"
+    )
+    if state.last_stdout:
+        prompt += f"\nLast stdout:\n{state.last_stdout}\n"
+    if state.last_stderr:
+        prompt += f"\nLast stderr (error details):\n{state.last_stderr}\n"
+    return prompt
+
+
+def _foreground_job(state: UIState, job: Job) -> List[ThoughtEvent]:
+    """Events for ``!fg``; a finished job becomes the target of !explain/!fix."""
+
+    if job.active:
+        output = job.text().strip() or "<no output yet>"
+        return [ThoughtEvent(source=f"job[{job.id}]", content=f"{job.describe()} (still in background)\n{output}")]
+    state.last_shell_command = job.command
+    state.last_stdout = job.text()
+    state.last_stderr = None
+    state.last_exit_code = job.exit_code
+    return [ThoughtEvent(source=f"job[{job.id}]", content=f"{job.describe()}\n{job.text().strip()}")]
+
+
+def _apply_resumed(state: UIState, session: ResumedSession) -> None:
+    state.thought_stream.extend(ThoughtEvent(source=source, content=content) for source, content in session.events)
+    state.last_shell_command = session.last_shell_command
+    state.last_stdout = session.last_stdout
+    state.last_stderr = session.last_stderr
+    state.last_exit_code = session.last_exit_code
+
+
+def _install_readline(history: CommandHistory) -> None:
+    """Up/down recall and Tab completion for ``console.input`` via readline, if present."""
+
+    try:
+        import readline
+    except ImportError:  # e.g. Windows without pyreadline
+        return
+    readline.clear_history()
+    for command in history.recent():
+        readline.add_history(command)
+    matches: List[str] = []
+
+    def complete(text: str, index: int) -> Optional[str]:
+        if index == 0:
+            matches[:] = history.fuzzy(readline.get_line_buffer())
+        return matches[index] if index < len(matches) else None
+
+    readline.set_completer_delims("")  # complete whole lines, not words
+    readline.set_completer(complete)
+    readline.parse_and_bind("tab: complete")
+
+
+def _run_cancellable(fn: Callable[[], Any], cancel: CancelToken, profiler: CommandProfiler) -> Any:
+    """Run a generation on a worker thread so Ctrl+C cancels it, not the session."""
+
+    pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="generation")
+    try:
+        future = pool.submit(profiler.wrap(fn))
+        while True:
+            try:
+                wait([future], timeout=0.1)
+            except KeyboardInterrupt:
+                cancel.cancel()
+                # Give the worker a moment to close the stream and record
+                # the cancel; a proxied call may only notice later.
+                wait([future], timeout=1.0)
+                if not future.done():
+                    raise GenerationCancelled(cancel.reason or "cancelled") from None
+            if future.done():
+                return future.result()
+    finally:
+        cancel.finish()
+        pool.shutdown(wait=False)
+
+
+def run_dashboard(
+    shield: EntropyShield,
+    kernel,
+    agent: DeterministicAgent,
+    memory: Optional["SemanticMemory"] = None,
+    reuse_threshold: Optional[float] = None,
+    deadlines: Optional[Dict[str, float]] = None,
+    prefetch: bool = False,
+    token_budgets: Optional[Dict[str, int]] = None,
+    resume: int = 0,
+) -> None:
     """Run an interactive dashboard loop.
 
     The loop is intentionally simple: it reads commands from stdin,
     updates observable state, and redraws the layout. Integration with
     the DeterministicAgent and Kernel is done by the caller, which
     appends ThoughtEvents.
+
+    ``memory`` opts into semantic memory: completions and command
+    outputs are stored, ``!fix`` shows similar past fixes, and with
+    ``reuse_threshold`` a close enough past fix is returned directly.
+
+    ``!ai``, ``!explain`` and ``!fix`` run under per-request
+    ``deadlines`` (default ``law_core.DEFAULT_DEADLINES``); Ctrl+C while
+    one is generating cancels just that request. Each also has a
+    generation budget, ``token_budgets`` (default
+    ``law_core.DEFAULT_TOKEN_BUDGETS``), and ``!fix`` asks for a
+    structured ``{command, explanation}`` reply whose command is checked
+    with ``DeterministicAgent.verify_command`` before it is shown.
+
+    With ``prefetch``, ``!fix`` (after a failure) and ``!explain`` are
+    generated speculatively while the prompt waits for input, and served
+    from that if asked for next (see prefetch.py).
+
+    ``!bg <command>`` or ``<command> &`` runs a shell command as a
+    background job (see jobs.py); ``!jobs`` lists jobs, ``!fg N`` waits
+    for one (Ctrl+C stops waiting) and ``!kill N`` stops it.
+
+    Up/down recalls earlier commands, including those of past sessions
+    in the ledger, and Tab completes from them (see history.py); both
+    need the ``readline`` module.
+
+    With ``resume`` the Thought Stream and the last command's context
+    are restored from that many of the ledger's last events (see
+    session_resume.py).
     """
 
+    deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+    token_budgets = {**DEFAULT_TOKEN_BUDGETS, **(token_budgets or {})}
     state = UIState()
+    if resume:
+        _apply_resumed(state, resume_session(shield, limit=resume, blobs=agent.blobs))
+    history = CommandHistory(shield.ledger_path)
+    _install_readline(history)
+    search_tool = None
+    profiler = CommandProfiler(shield.ledger_path.parent)
+    prefetcher = (
+        SpeculativePrefetcher(
+            kernel=kernel, shield=shield, memory=memory, deadlines=deadlines, token_budgets=token_budgets
+        )
+        if prefetch
+        else None
+    )
+    jobs = JobTable(agent, shield)
+    pipeline = RenderPipeline(state, shield)
+    pipeline.render()
 
     console.print("[bold]AxiomUIXV Deterministic Dashboard[/bold]")
     console.print("Type commands or 'exit' to leave. Execution wiring can be added in main.py.")
 
-    with Live(build_layout(state, shield), console=console, refresh_per_second=4) as live:
-        while True:
-            try:
-                command = console.input("[yellow]axiom> [/yellow]")
-            except (EOFError, KeyboardInterrupt):
-                console.print("\n[red]Session terminated by user.[/red]")
-                break
-
-            command = command.strip()
-            if not command:
-                continue
-
-            if command.lower() in {"exit", "quit"}:
-                console.print("[green]Deterministic session closed.[/green]")
-                break
-
-            state.last_command = command
-            state.thought_stream.append(ThoughtEvent(source="user", content=command))
-
-            # Command routing:
-            # - commands starting with "!ai " go to the Lambda-Lambda Core (chat-style).
-            # - "!explain" explains the last command and its output.
-            # - "!fix" diagnoses the last error and proposes a corrected command.
-            # - everything else is treated as a shell command executed via DeterministicAgent.
-            if command.startswith("!ai "):
-                query = command[4:].strip()
+    try:
+        with Live(pipeline.layout, console=console, auto_refresh=False) as live:
+            while True:
                 try:
-                    envelope = law_guarded_completion(kernel=kernel, shield=shield, user_content=query)
-                    text = str(envelope.get("payload", {}).get("text", "<no text>"))
-                    status = envelope.get("status", "UNKNOWN")
-                    state.thought_stream.append(
-                        ThoughtEvent(
-                            source=f"model[{status}]",
-                            content=text,
-                        )
-                    )
-                except Exception as exc:  # deterministic failure is surfaced, not hidden
-                    state.thought_stream.append(
-                        ThoughtEvent(
-                            source="error",
-                            content=f"law_core failure: {exc}",
+                    command = console.input("[yellow]axiom> [/yellow]")
+                except (EOFError, KeyboardInterrupt):
+                    console.print("\n[red]Session terminated by user.[/red]")
+                    break
+
+                command = command.strip()
+                if not command:
+                    continue
+
+                if command.lower() in {"exit", "quit"}:
+                    console.print("[green]Deterministic session closed.[/green]")
+                    break
+
+                state.last_command = command
+                if command.startswith("!") and background_command(command) is None:
+                    history.add(command)  # shell commands and jobs reach it through the ledger
+                for job in jobs.finished_since_last_call():
+                    state.thought_stream.append(ThoughtEvent(source=f"job[{job.id}]", content=job.describe()))
+                state.thought_stream.append(ThoughtEvent(source="user", content=command))
+                pipeline.invalidate("thoughts", "lower")
+                pipeline.request_frame(live)
+                if prefetcher is not None and command not in {"!explain", "!fix", "!stats", "!analytics"}:
+                    prefetcher.discard()
+
+                # Command routing:
+                # - commands starting with "!ai " go to the Lambda-Lambda Core (chat-style).
+                # - "!explain" explains the last command and its output.
+                # - "!fix" diagnoses the last error and proposes a corrected command.
+                # - "!bg <command>" or "<command> &" starts a background job; "!jobs", "!fg N", "!kill N".
+                # - everything else is treated as a shell command executed via DeterministicAgent.
+                background = background_command(command)
+                if background is not None:
+                    try:
+                        job = jobs.start(background, cwd=Path.cwd())
+                        state.thought_stream.append(ThoughtEvent(source=f"job[{job.id}]", content=job.describe()))
+                    except Exception as exc:
+                        state.thought_stream.append(
+                            ThoughtEvent(source="error", content=f"deterministic agent failure: {exc}"),
                         )
-                    )
 
-            elif command == "!explain":
-                if not state.last_command:
-                    state.thought_stream.append(
-                        ThoughtEvent(source="error", content="No previous command to explain."),
-                    )
-                else:
-                    explain_prompt = (
-                        "You are a deterministic terminal assistant. Explain the following shell command "
-                        "and its most recent result in clear, concise language."
-                        f"\n\nCommand:\n{state.last_command}\n"
-                    )
-                    if state.last_stdout:
-                        explain_prompt += f"\nLast stdout:\n{state.last_stdout}\n"
-                    if state.last_stderr:
-                        explain_prompt += f"\nLast stderr (may indicate an error):\n{state.last_stderr}\n"
+                elif command == "!jobs":
+                    state.thought_stream.append(ThoughtEvent(source="jobs", content=jobs.describe()))
+
+                elif command.startswith("!fg ") or command.startswith("!kill "):
+                    verb, _, argument = command.partition(" ")
+                    try:
+                        job_id = parse_job_id(argument)
+                        if verb == "!kill":
+                            job = jobs.kill(job_id)
+                            state.thought_stream.append(ThoughtEvent(source=f"job[{job.id}]", content=job.describe()))
+                        else:
+                            cancel = CancelToken()
+                            job = _run_cancellable(lambda: jobs.wait(job_id, cancel), cancel, profiler)
+                            state.thought_stream.extend(_foreground_job(state, job))
+                    except JobError as exc:
+                        state.thought_stream.append(ThoughtEvent(source="error", content=str(exc)))
+
+                elif command.startswith("!ai "):
+                    query = command[4:].strip()
+                    cancel = CancelToken(deadline=deadlines.get("ai"))
                     try:
-                        envelope = law_guarded_completion(kernel=kernel, shield=shield, user_content=explain_prompt)
+                        envelope = _run_cancellable(
+                            lambda: law_guarded_completion(
+                                kernel=route_kernel(kernel, "ai"),
+                                shield=shield,
+                                user_content=query,
+                                memory=memory,
+                                cancel=cancel,
+                                max_tokens=token_budgets.get("ai"),
+                            ),
+                            cancel,
+                            profiler,
+                        )
                         text = str(envelope.get("payload", {}).get("text", "<no text>"))
                         status = envelope.get("status", "UNKNOWN")
                         state.thought_stream.append(
@@ -198,78 +454,218 @@ def run_dashboard(shield: EntropyShield, kernel, agent: DeterministicAgent) -> N
                                 content=text,
                             )
                         )
-                    except Exception as exc:
+                    except GenerationCancelled as exc:
+                        state.thought_stream.append(ThoughtEvent(source="cancelled", content=f"!ai {exc}"))
+                    except Exception as exc:  # deterministic failure is surfaced, not hidden
                         state.thought_stream.append(
                             ThoughtEvent(
                                 source="error",
-                                content=f"law_core failure during !explain: {exc}",
+                                content=f"law_core failure: {exc}",
                             )
                         )
 
-            elif command == "!fix":
-                if not state.last_command:
-                    state.thought_stream.append(
-                        ThoughtEvent(source="error", content="No previous command to fix."),
-                    )
-                else:
-                    fix_prompt = (
-                        "You are a deterministic terminal assistant. The user ran this command and it did not "
-                        "behave as expected. Analyze any errors and propose a single corrected command plus a short "
-                        "explanation."
-                        f"\n\nCommand:\n{state.last_command}\n"
-                    )
-                    if state.last_stdout:
-                        fix_prompt += f"\nLast stdout:\n{state.last_stdout}\n"
-                    if state.last_stderr:
-                        fix_prompt += f"\nLast stderr (error details):\n{state.last_stderr}\n"
-                    try:
-                        envelope = law_guarded_completion(kernel=kernel, shield=shield, user_content=fix_prompt)
-                        text = str(envelope.get("payload", {}).get("text", "<no text>"))
-                        status = envelope.get("status", "UNKNOWN")
+                elif command == "!explain":
+                    explain_prompt = _explain_prompt(state)
+                    if explain_prompt is None:
                         state.thought_stream.append(
-                            ThoughtEvent(
-                                source=f"model[{status}]",
-                                content=text,
+                            ThoughtEvent(source="error", content="No previous command to explain."),
+                        )
+                    else:
+                        cancel = CancelToken(deadline=deadlines.get("explain"))
+                        try:
+                            envelope, origin = _run_cancellable(
+                                lambda: complete_with_prefetch(
+                                    "explain",
+                                    explain_prompt,
+                                    kernel=kernel,
+                                    shield=shield,
+                                    prefetcher=prefetcher,
+                                    memory=memory,
+                                    cancel=cancel,
+                                    max_tokens=token_budgets.get("explain"),
+                                ),
+                                cancel,
+                                profiler,
+                            )
+                            text = str(envelope.get("payload", {}).get("text", "<no text>"))
+                            status = envelope.get("status", "UNKNOWN")
+                            state.thought_stream.append(
+                                ThoughtEvent(
+                                    source=f"{origin}[{status}]",
+                                    content=text,
+                                )
+                            )
+                        except GenerationCancelled as exc:
+                            state.thought_stream.append(ThoughtEvent(source="cancelled", content=f"!explain {exc}"))
+                        except Exception as exc:
+                            state.thought_stream.append(
+                                ThoughtEvent(
+                                    source="error",
+                                    content=f"law_core failure during !explain: {exc}",
+                                )
+                            )
+
+                elif command == "!fix":
+                    fix_prompt = _fix_prompt(state)
+                    if fix_prompt is None:
+                        state.thought_stream.append(
+                            ThoughtEvent(source="error", content="No previous command to fix."),
+                        )
+                    else:
+                        cancel = CancelToken(deadline=deadlines.get("fix"))
+                        try:
+                            if memory is not None:
+                                from semantic_index import describe_hit
+
+                                for hit in memory.search(fix_prompt, k=3, kind="fix"):
+                                    state.thought_stream.append(
+                                        ThoughtEvent(source=f"memory[{hit.score:.2f}]", content=describe_hit(hit))
+                                    )
+                            envelope, origin = _run_cancellable(
+                                lambda: complete_with_prefetch(
+                                    "fix",
+                                    fix_prompt,
+                                    kernel=kernel,
+                                    shield=shield,
+                                    prefetcher=prefetcher,
+                                    memory=memory,
+                                    reuse_threshold=reuse_threshold,
+                                    cancel=cancel,
+                                    max_tokens=token_budgets.get("fix"),
+                                ),
+                                cancel,
+                                profiler,
+                            )
+                            text = describe_fix(envelope.get("payload", {}), agent)
+                            status = envelope.get("status", "UNKNOWN")
+                            state.thought_stream.append(
+                                ThoughtEvent(
+                                    source=f"{origin}[{status}]",
+                                    content=text,
+                                )
+                            )
+                        except GenerationCancelled as exc:
+                            state.thought_stream.append(ThoughtEvent(source="cancelled", content=f"!fix {exc}"))
+                        except Exception as exc:
+                            state.thought_stream.append(
+                                ThoughtEvent(
+                                    source="error",
+                                    content=f"law_core failure during !fix: {exc}",
+                                )
                             )
+
+                elif command.startswith("!search "):
+                    # "!search text" is a literal search; "!search re:pattern" a regex.
+                    query = command[8:].strip()
+                    regex = query.startswith("re:")
+                    if regex:
+                        query = query[3:]
+                    try:
+                        if search_tool is None:
+                            from search_index import SearchTool
+
+                            search_tool = SearchTool(
+                                root=Path.cwd(), shield=shield, index_dir=shield.ledger_path.parent / "search"
+                            )
+                        from search_index import format_matches
+
+                        matches = search_tool.search(query, regex=regex)
+                        state.thought_stream.append(
+                            ThoughtEvent(source=f"search[{len(matches)}]", content=format_matches(matches))
                         )
                     except Exception as exc:
                         state.thought_stream.append(
-                            ThoughtEvent(
-                                source="error",
-                                content=f"law_core failure during !fix: {exc}",
-                            )
+                            ThoughtEvent(source="error", content=f"search failure: {exc}"),
                         )
 
-            else:
-                # Treat everything else as a shell command to be executed deterministically.
-                try:
-                    completed = agent.execute_command(command, cwd=Path.cwd())
-                    state.last_stdout = completed.stdout
-                    state.last_stderr = completed.stderr
-                    state.last_exit_code = completed.returncode
+                elif command == "!stats":
+                    try:
+                        report = collect_stats(shield=shield, kernel=kernel, prefetcher=prefetcher, profiler=profiler)
+                        state.thought_stream.append(ThoughtEvent(source="stats", content=report))
+                    except Exception as exc:
+                        state.thought_stream.append(ThoughtEvent(source="error", content=f"stats failure: {exc}"))
 
-                    if completed.stdout:
+                elif command == "!analytics" or command.startswith("!analytics "):
+                    try:
+                        from analytics import analytics_command
+
+                        report = analytics_command(shield.ledger_path, command[10:])
+                        state.thought_stream.append(ThoughtEvent(source="analytics", content=report))
+                    except Exception as exc:
+                        state.thought_stream.append(ThoughtEvent(source="error", content=f"analytics failure: {exc}"))
+
+                elif command == "!profile" or command.startswith("!profile "):
+                    state.thought_stream.append(ThoughtEvent(source="profile", content=profiler.command(command[8:])))
+
+                elif command == "!snapshot":
+                    # Merkle snapshot of the working directory, diffed against the
+                    # previous one and checked against the ledger's file events.
+                    try:
+                        from workspace_snapshot import SnapshotStore, check_ledger, describe
+
+                        snapshot, diff = SnapshotStore(shield.ledger_path.parent).resnapshot(Path.cwd())
+                        drift = check_ledger(snapshot, shield.ledger_path)
                         state.thought_stream.append(
-                            ThoughtEvent(
-                                source="shell[stdout]",
-                                content=completed.stdout.strip(),
-                            )
+                            ThoughtEvent(source="snapshot", content=describe(snapshot, diff, drift))
                         )
-                    if completed.stderr:
+                    except Exception as exc:
+                        state.thought_stream.append(
+                            ThoughtEvent(source="error", content=f"snapshot failure: {exc}"),
+                        )
+
+                else:
+                    # Treat everything else as a shell command to be executed deterministically.
+                    state.last_shell_command = command
+                    try:
+                        completed = agent.execute_command(command, cwd=Path.cwd())
+                        state.last_stdout = completed.stdout
+                        state.last_stderr = completed.stderr
+                        state.last_exit_code = completed.returncode
+                        if memory is not None:
+                            memory.remember_command(
+                                command=command,
+                                output=(completed.stdout or "") + (completed.stderr or ""),
+                                exit_code=completed.returncode,
+                            )
+
+                        if completed.stdout:
+                            state.thought_stream.append(
+                                ThoughtEvent(
+                                    source="shell[stdout]",
+                                    content=completed.stdout.strip(),
+                                )
+                            )
+                        if completed.stderr:
+                            state.thought_stream.append(
+                                ThoughtEvent(
+                                    source="shell[stderr]",
+                                    content=completed.stderr.strip(),
+                                )
+                            )
+                    except Exception as exc:
+                        state.last_stderr = str(exc)
+                        state.last_exit_code = None
                         state.thought_stream.append(
                             ThoughtEvent(
-                                source="shell[stderr]",
-                                content=completed.stderr.strip(),
+                                source="error",
+                                content=f"deterministic agent failure: {exc}",
                             )
                         )
-                except Exception as exc:
-                    state.last_stderr = str(exc)
-                    state.last_exit_code = None
-                    state.thought_stream.append(
-                        ThoughtEvent(
-                            source="error",
-                            content=f"deterministic agent failure: {exc}",
-                        )
-                    )
-
-            live.update(build_layout(state, shield))
+                    if prefetcher is not None:
+                        # Idle until the next input: guess the likely follow-up.
+                        if state.last_exit_code != 0:
+                            prefetcher.speculate("fix", _fix_prompt(state))
+                        prefetcher.speculate("explain", _explain_prompt(state))
+
+                if command != "!profile" and not command.startswith("!profile "):
+                    report = profiler.command_finished()
+                    if report is not None:
+                        state.thought_stream.append(ThoughtEvent(source="profile", content=report))
+
+                pipeline.invalidate("thoughts", "lower")
+                pipeline.request_frame(live, force=True)
+    finally:
+        jobs.close()
+        profiler.stop()
+        if prefetcher is not None:
+            prefetcher.close()
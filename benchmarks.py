@@ -0,0 +1,135 @@
+"""Microbenchmarks for AxiomUIXV hot paths.
+
+Run ``python benchmarks.py <name>`` (or no name for all). Each benchmark
+prints a short, fixed-format report so results can be diffed between
+revisions. Nothing here talks to Ollama; all inputs are synthetic.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict
+
+
+def _timeit(fn: Callable[[], object], *, repeat: int) -> float:
+    """Return mean seconds per call over ``repeat`` calls."""
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+def bench_render(repeat: int = 200) -> None:
+    """Compare full ``build_layout`` redraws with the cached RenderPipeline."""
+
+    from rich.console import Console
+
+    from axiom_ui import RenderPipeline, ThoughtEvent, UIState, build_layout
+    from entropy_shield import EntropyShield, EntropyShieldConfig
+
+    with tempfile.TemporaryDirectory() as tmp:
+        shield = EntropyShield(EntropyShieldConfig(root_dir=Path(tmp)))
+        for i in range(5000):
+            shield.record_command(command=f"echo {i}", cwd=tmp, exit_code=0)
+
+        state = UIState()
+        for i in range(200):
+            state.thought_stream.append(ThoughtEvent(source="shell[stdout]", content=f"line {i} " * 8))
+        state.last_command = "echo 199"
+
+        console = Console(file=io.StringIO(), width=160, height=48, force_terminal=True)
+        pipeline = RenderPipeline(state, shield, max_fps=1e9)
+
+        def full() -> None:
+            console.print(build_layout(state, shield))
+
+        def command_panel_only() -> None:
+            pipeline.invalidate("lower")
+            pipeline.render()
+            console.print(pipeline.layout)
+
+        def rebuild_only_full() -> None:
+            build_layout(state, shield)
+
+        def rebuild_only_dirty() -> None:
+            pipeline.invalidate("lower")
+            pipeline.render()
+
+        results = {
+            "build_layout+print": _timeit(full, repeat=repeat),
+            "pipeline(lower)+print": _timeit(command_panel_only, repeat=repeat),
+            "build_layout": _timeit(rebuild_only_full, repeat=repeat),
+            "pipeline(lower)": _timeit(rebuild_only_dirty, repeat=repeat),
+        }
+
+    print("render benchmark (ledger=5000 events, stream=200 events)")
+    for name, seconds in results.items():
+        print(f"  {name:<24} {seconds * 1e3:8.3f} ms/frame")
+
+
+def bench_serialization(count: int = 50_000) -> None:
+    """Ledger event encoding, before vs after."""
+
+    import json
+    from dataclasses import asdict, dataclass
+    from typing import Any
+
+    from entropy_shield import LedgerEvent
+
+    @dataclass
+    class DataclassEvent:  # the previous LedgerEvent shape
+        timestamp: str
+        kind: str
+        payload: Dict[str, Any]
+
+    payload = {
+        "prompt_hash": "a" * 64,
+        "response_hash": "b" * 64,
+        "command": "python -m pytest -q tests/test_kernel.py",
+        "cwd": "/home/operator/workspace",
+        "exit_code": 0,
+    }
+    ts = "2026-01-07T00:06:18.104000+00:00"
+
+    def events_before() -> None:
+        for _ in range(count):
+            event = DataclassEvent(timestamp=ts, kind="command", payload=payload)
+            json.dumps(asdict(event), sort_keys=True, ensure_ascii=False)
+
+    def events_after() -> None:
+        for _ in range(count):
+            LedgerEvent(timestamp=ts, kind="command", payload=payload).to_json()
+
+    print(f"serialization benchmark ({count} iterations each)")
+    for name, fn in (
+        ("events/sec before", events_before),
+        ("events/sec after", events_after),
+    ):
+        seconds = _timeit(fn, repeat=1)
+        print(f"  {name:<24} {count / seconds:12,.0f}")
+
+
+BENCHMARKS: Dict[str, Callable[[], None]] = {
+    "render": bench_render,
+    "serialization": bench_serialization,
+}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="AxiomUIXV microbenchmarks")
+    parser.add_argument("names", nargs="*", help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    args = parser.parse_args()
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    for name in args.names or BENCHMARKS:
+        BENCHMARKS[name]()
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
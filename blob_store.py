@@ -0,0 +1,197 @@
+"""Blob_Store module: content-addressed, compressed storage for command outputs.
+
+The ledger records ``command``, ``cwd`` and ``exit_code``; stdout and
+stderr used to live only in dashboard memory and were lost at exit,
+while storing them inline would bloat the JSONL. The BlobStore keeps
+them next to the ledger instead:
+
+- A blob is addressed by the SHA-256 of its uncompressed content, so
+  identical outputs are stored once; ``command`` events reference
+  them by hash (``stdout_hash``/``stderr_hash``, ``output_hash`` for
+  background jobs).
+- Blobs are compressed with zstd when the optional ``zstandard``
+  package is installed and zlib otherwise; the file suffix records
+  which, so a store may hold both.
+- Files are sharded by the first two hex digits of the hash
+  (``blobs/ab/abcdef....zst``) to keep directories small.
+- Writes and reads both stream: ``writer()`` hashes and compresses as
+  data arrives, and ``open()`` decompresses incrementally, so
+  multi-GB outputs never have to fit in memory.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import zlib
+from pathlib import Path
+from typing import BinaryIO, Iterator, Optional
+
+try:
+    import zstandard
+except ImportError:  # optional; zlib is used instead
+    zstandard = None
+
+logger = logging.getLogger("tools")
+
+CHUNK_SIZE = 1 << 20
+_SUFFIXES = (".zst", ".zz")
+
+
+class BlobNotFound(RuntimeError):
+    """Raised when no blob with the requested hash is stored."""
+
+
+class _ZlibReader(io.RawIOBase):
+    """Incremental zlib decompression as a readable stream."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self._raw = raw
+        self._inflater = zlib.decompressobj()
+        self._buffer = b""
+        self._eof = False
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:  # type: ignore[override]
+        while not self._buffer and not self._eof:
+            # Output is capped per call; input it did not get to is fed back first.
+            data = self._inflater.unconsumed_tail or self._raw.read(CHUNK_SIZE)
+            if not data:
+                self._buffer = self._inflater.flush()
+                self._eof = True
+            else:
+                self._buffer = self._inflater.decompress(data, CHUNK_SIZE)
+        count = min(len(target), len(self._buffer))
+        target[:count] = self._buffer[:count]
+        self._buffer = self._buffer[count:]
+        return count
+
+    def close(self) -> None:
+        self._raw.close()
+        super().close()
+
+
+class BlobWriter:
+    """Streaming writer returned by ``BlobStore.writer``; ``close()`` returns the hash."""
+
+    def __init__(self, store: "BlobStore") -> None:
+        self._store = store
+        self._digest = hashlib.sha256()
+        self.size = 0
+        fd, tmp = tempfile.mkstemp(dir=str(store.root), prefix=".blob.", suffix=".tmp")
+        self._tmp = Path(tmp)
+        self._file = os.fdopen(fd, "wb")
+        if zstandard is not None:
+            self._compressor = zstandard.ZstdCompressor(level=store.level).compressobj()
+        else:
+            self._compressor = zlib.compressobj(store.level)
+        self.digest: Optional[str] = None
+
+    def write(self, data: bytes) -> None:
+        self._digest.update(data)
+        self.size += len(data)
+        self._file.write(self._compressor.compress(data))
+
+    def close(self) -> str:
+        if self.digest is not None:
+            return self.digest
+        try:
+            self._file.write(self._compressor.flush())
+            self._file.close()
+            self.digest = self._digest.hexdigest()
+            self._store._commit(self._tmp, self.digest)
+        finally:
+            self._tmp.unlink(missing_ok=True)
+        return self.digest
+
+    def abort(self) -> None:
+        self._file.close()
+        self._tmp.unlink(missing_ok=True)
+
+
+class BlobStore:
+    """Deduplicating blob directory, usually ``<log_dir>/blobs``."""
+
+    def __init__(self, root: Path, *, level: int = 3) -> None:
+        self.root = root
+        self.level = level
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @property
+    def _suffix(self) -> str:
+        return ".zst" if zstandard is not None else ".zz"
+
+    def _path(self, digest: str, suffix: str) -> Path:
+        return self.root / digest[:2] / f"{digest}{suffix}"
+
+    def _find(self, digest: str) -> Optional[Path]:
+        for suffix in _SUFFIXES:
+            path = self._path(digest, suffix)
+            if path.exists():
+                return path
+        return None
+
+    def _commit(self, tmp: Path, digest: str) -> None:
+        if self._find(digest) is not None:
+            return  # already stored; the duplicate is discarded
+        target = self._path(digest, self._suffix)
+        target.parent.mkdir(exist_ok=True)
+        os.replace(tmp, target)
+
+    # Writing ------------------------------------------------------------------
+
+    def writer(self) -> BlobWriter:
+        return BlobWriter(self)
+
+    def put(self, data: bytes) -> str:
+        """Store ``data`` and return its SHA-256."""
+
+        digest = hashlib.sha256(data).hexdigest()
+        if self._find(digest) is not None:
+            return digest
+        writer = self.writer()
+        try:
+            writer.write(data)
+        except BaseException:
+            writer.abort()
+            raise
+        return writer.close()
+
+    def put_text(self, text: Optional[str]) -> Optional[str]:
+        """Store a command output; empty or missing output is not stored."""
+
+        return self.put(text.encode("utf-8")) if text else None
+
+    # Reading ------------------------------------------------------------------
+
+    def exists(self, digest: str) -> bool:
+        return self._find(digest) is not None
+
+    def open(self, digest: str) -> BinaryIO:
+        """Return a stream of the blob's uncompressed content."""
+
+        path = self._find(digest)
+        if path is None:
+            raise BlobNotFound(f"No blob {digest}")
+        raw = path.open("rb")
+        if path.suffix == ".zst":
+            if zstandard is None:
+                raw.close()
+                raise BlobNotFound(f"Blob {digest} is zstd-compressed; install zstandard to read it")
+            return zstandard.ZstdDecompressor().stream_reader(raw, closefd=True)  # type: ignore[return-value]
+        return io.BufferedReader(_ZlibReader(raw), CHUNK_SIZE)
+
+    def iter_chunks(self, digest: str) -> Iterator[bytes]:
+        with self.open(digest) as stream:
+            for chunk in iter(lambda: stream.read(CHUNK_SIZE), b""):
+                yield chunk
+
+    def read_text(self, digest: str) -> str:
+        """Whole blob as text; for small outputs (use ``open`` for large ones)."""
+
+        return b"".join(self.iter_chunks(digest)).decode("utf-8", errors="replace")
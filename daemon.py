@@ -0,0 +1,664 @@
+"""Daemon module: one shared substrate for many operator terminals.
+
+Without the daemon every launch of ``main.py`` / ``launch.py`` builds its
+own Kernel, EntropyShield and DeterministicAgent. Several terminals then
+open several HTTP pools and race on appends to the same ledger file.
+
+The daemon owns exactly one Kernel client, one serialized ledger writer
+and one completion cache. Dashboards connect over a local Unix socket
+and receive thin proxies (``RemoteKernel``, ``RemoteEntropyShield``) that
+are drop-in replacements for the local objects. Model calls from all
+sessions go through the kernel's priority scheduler (see scheduler.py);
+a kernel without one is given one. An interactive call from any terminal
+preempts background work, and within a priority class the sessions take
+turns, so one busy terminal cannot starve the others.
+
+Wire format: newline-delimited JSON. Each request is
+``{"id": n, "op": "...", "args": {...}}`` and each response is
+``{"id": n, "ok": true, "result": ...}`` or ``{"id": n, "ok": false,
+"error": "..."}``. ``generate`` requests run on their own thread and may
+be answered out of order; every other request is answered in order, so
+ledger appends from one session keep their order. ``{"op": "cancel",
+"args": {"id": n}}`` stops generate request ``n`` of the same session.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import itertools
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, InvalidStateError
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from entropy_shield import EntropyShield, LedgerEvent
+from kernel import CancelToken, GenerationCancelled, Kernel
+from router import ModelRouter, route_kernel
+from scheduler import PriorityScheduler, ScheduledKernel, SchedulerConfig, for_session, prioritized
+
+logger = logging.getLogger("orchestrator")
+
+
+def _require_unix_sockets() -> None:
+    if not hasattr(socket, "AF_UNIX"):
+        raise RuntimeError("Daemon mode requires Unix domain sockets, which this platform does not provide")
+
+
+# ---------------------------------------------------------------------------
+# Shared state owned by the daemon
+# ---------------------------------------------------------------------------
+
+
+class CompletionCache:
+    """Bounded LRU cache of deterministic completions.
+
+    Only temperature-zero calls are cached: anything else is, by
+    definition, not reproducible and must reach the kernel.
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self._max_entries = max_entries
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key_for(
+        *,
+        model: str,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        max_tokens: Optional[int],
+        response_schema: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        material = json.dumps(
+            {
+                "model": model,
+                "system": system_prompt,
+                "messages": messages,
+                "max_tokens": max_tokens,
+                "response_schema": response_schema,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def put(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+
+@dataclass
+class DaemonConfig:
+    socket_path: Path
+    max_concurrent_calls: int = 1
+    cache_entries: int = 256
+
+
+class AxiomDaemon:
+    """Owns the shared Kernel, EntropyShield and caches for all sessions."""
+
+    def __init__(self, *, config: DaemonConfig, kernel: Union[Kernel, ModelRouter], shield: EntropyShield) -> None:
+        _require_unix_sockets()
+        self.config = config
+        self.shield = shield
+        self.cache = CompletionCache(max_entries=config.cache_entries)
+        self._own_scheduler: Optional[PriorityScheduler] = None
+        if getattr(kernel, "scheduler", None) is None:
+            self._own_scheduler = PriorityScheduler(SchedulerConfig(max_concurrent=config.max_concurrent_calls))
+            kernel = ScheduledKernel(kernel, self._own_scheduler, owner=False)
+        self.kernel = kernel
+        self._session_ids = itertools.count(1)
+        self._server: Optional[socketserver.ThreadingUnixStreamServer] = None
+        # (session id, request id) -> token of a generate call in flight
+        self._calls: Dict[Tuple[str, Any], CancelToken] = {}
+        self._calls_lock = threading.Lock()
+
+    # Operations ---------------------------------------------------------------
+
+    def _generate(self, session_id: str, args: Dict[str, Any], request_id: Any = None) -> Any:
+        """Generate for a client; with ``with_usage`` the reply is ``{"text", "usage"}``.
+
+        The call can be stopped by a ``cancel`` op naming ``request_id``,
+        while queued or while generating.
+        """
+
+        target = route_kernel(self.kernel, args.get("route") or "ai")
+        target = for_session(prioritized(target, args.get("priority") or "interactive"), session_id)
+        temperature = float(args.get("temperature", 0.0))
+        key = None
+        if temperature == 0.0:
+            key = CompletionCache.key_for(
+                model=target.config.model,
+                system_prompt=args["system_prompt"],
+                messages=args["messages"],
+                max_tokens=args.get("max_tokens"),
+                response_schema=args.get("response_schema"),
+            )
+            cached = self.cache.get(key)
+            if cached is not None:
+                logger.debug("Daemon cache hit for session=%s", session_id)
+                if args.get("with_usage"):
+                    return {"text": cached, "usage": {"model": target.config.model, "cached": True}}
+                return cached
+
+        # The client's deadline is enforced here; it also covers time spent
+        # queued in the scheduler. A deadline of 0 has already passed.
+        deadline = args.get("deadline")
+        cancel = CancelToken(deadline=deadline)
+        if deadline is not None and deadline <= 0:
+            cancel.cancel("deadline")
+        call_key = (session_id, request_id)
+        with self._calls_lock:
+            self._calls[call_key] = cancel
+        usage: Optional[Dict[str, Any]] = {} if args.get("with_usage") else None
+
+        def call() -> str:
+            return target.generate(
+                system_prompt=args["system_prompt"],
+                messages=args["messages"],
+                temperature=temperature,
+                max_tokens=args.get("max_tokens"),
+                cancel=cancel,
+                response_schema=args.get("response_schema"),
+                usage=usage,
+            )
+
+        try:
+            text = call()
+        finally:
+            cancel.finish()
+            with self._calls_lock:
+                self._calls.pop(call_key, None)
+        if key is not None:
+            self.cache.put(key, text)
+        if usage is not None:
+            return {"text": text, "usage": usage}
+        return text
+
+    def cancel_calls(self, session_id: str, request_id: Any = None) -> int:
+        """Cancel one generate call of a session, or all of them; returns how many."""
+
+        with self._calls_lock:
+            tokens = [
+                token
+                for (session, request), token in self._calls.items()
+                if session == session_id and (request_id is None or request == request_id)
+            ]
+        for token in tokens:
+            token.cancel()
+        return len(tokens)
+
+    def dispatch(self, session_id: str, op: str, args: Dict[str, Any], request_id: Any = None) -> Any:
+        if op == "ping":
+            return "pong"
+        if op == "cancel":
+            return self.cancel_calls(session_id, args["id"])
+        if op == "stats":
+            scheduler = getattr(self.kernel, "scheduler", None)
+            return {
+                "cache": {"entries": len(self.cache), "hits": self.cache.hits, "misses": self.cache.misses},
+                "scheduler": scheduler.stats() if scheduler is not None else None,
+            }
+        if op == "ledger_path":
+            return str(self.shield.ledger_path)
+        if op == "latest_timestamp":
+            return self.shield.latest_timestamp()
+        if op == "tail_events":
+            return [event.to_dict() for event in self.shield.tail_events(int(args["limit"]))]
+        if op == "generate":
+            return self._generate(session_id, args, request_id)
+        if op == "record_command":
+            self.shield.record_command(
+                command=args["command"],
+                cwd=args["cwd"],
+                exit_code=args.get("exit_code"),
+                stdout_hash=args.get("stdout_hash"),
+                stderr_hash=args.get("stderr_hash"),
+                duration_ms=args.get("duration_ms"),
+                usage=args.get("usage"),
+                profile=args.get("profile"),
+            )
+            return None
+        if op == "record_job":
+            self.shield.record_job(**args)
+            return None
+        if op == "record_file_change":
+            self.shield.record_file_change(
+                path=Path(args["path"]),
+                before_hash=args.get("before_hash"),
+                after_hash=args.get("after_hash"),
+                patch=args.get("patch"),
+            )
+            return None
+        if op == "record_kernel_call":
+            self.shield.record_kernel_call(**args)
+            return None
+        if op == "record_file_batch":
+            self.shield.record_file_batch(changes=args["changes"])
+            return None
+        if op == "record_search":
+            self.shield.record_search(**args)
+            return None
+        if op == "record_kernel_resilience":
+            self.shield.record_kernel_resilience(action=args["action"], details=args.get("details", {}))
+            return None
+        if op == "merge_events":
+            self.shield.merge_events(
+                [LedgerEvent(timestamp=e["timestamp"], kind=e["kind"], payload=e["payload"]) for e in args["events"]],
+                worker=args["worker"],
+            )
+            return None
+        raise RuntimeError(f"Unknown daemon operation: {op}")
+
+    # Socket server ------------------------------------------------------------
+
+    def _make_handler(self) -> type:
+        daemon = self
+
+        class _SessionHandler(socketserver.StreamRequestHandler):
+            def handle(self) -> None:
+                session_id = f"session-{next(daemon._session_ids)}"
+                write_lock = threading.Lock()
+                logger.info("Daemon session opened: %s", session_id)
+
+                def answer(request_id: Any, op: str, args: Dict[str, Any]) -> None:
+                    try:
+                        result = daemon.dispatch(session_id, op, args, request_id)
+                        response = {"id": request_id, "ok": True, "result": result}
+                    except GenerationCancelled as exc:
+                        response = {"id": request_id, "ok": False, "error": str(exc), "cancelled": exc.reason}
+                    except Exception as exc:  # deterministic failure is surfaced, not hidden
+                        logger.warning("Daemon request failed in %s: %s", session_id, exc)
+                        response = {"id": request_id, "ok": False, "error": str(exc)}
+                    line = (json.dumps(response, ensure_ascii=False) + "\n").encode("utf-8")
+                    try:
+                        with write_lock:
+                            self.wfile.write(line)
+                            self.wfile.flush()
+                    except (OSError, ValueError) as exc:  # client went away, stream closed
+                        logger.debug("Daemon reply to %s dropped: %s", session_id, exc)
+
+                try:
+                    for raw in self.rfile:
+                        if not raw.strip():
+                            continue
+                        try:
+                            request = json.loads(raw)
+                            request_id, op, args = request.get("id"), request["op"], request.get("args") or {}
+                        except (ValueError, KeyError, AttributeError) as exc:
+                            logger.warning("Malformed daemon request in %s: %s", session_id, exc)
+                            continue
+                        if op == "generate":
+                            # Model calls must not hold up this session's other requests.
+                            threading.Thread(
+                                target=answer, args=(request_id, op, args), name=f"{session_id}-generate", daemon=True
+                            ).start()
+                        else:
+                            answer(request_id, op, args)
+                finally:
+                    daemon.cancel_calls(session_id)
+                    logger.info("Daemon session closed: %s", session_id)
+
+        return _SessionHandler
+
+    def serve_forever(self) -> None:
+        path = self.config.socket_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            path.unlink()
+        self._server = socketserver.ThreadingUnixStreamServer(str(path), self._make_handler())
+        self._server.daemon_threads = True
+        os.chmod(path, 0o600)
+        logger.info("AxiomUIXV daemon listening on %s", path)
+        try:
+            self._server.serve_forever()
+        finally:
+            self._server.server_close()
+            if path.exists():
+                path.unlink()
+
+    def shutdown(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+        if self._own_scheduler is not None:
+            self._own_scheduler.close()
+
+
+# ---------------------------------------------------------------------------
+# Thin client side
+# ---------------------------------------------------------------------------
+
+
+class DaemonClient:
+    """Client for one daemon session; calls from several threads share the socket.
+
+    A reader thread matches replies to requests by ``id``, so a long
+    ``generate`` does not hold up ledger appends or other calls.
+    """
+
+    def __init__(self, socket_path: Path) -> None:
+        _require_unix_sockets()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._sock.connect(str(socket_path))
+        self._rfile = self._sock.makefile("rb")
+        self._ids = itertools.count(1)
+        self._send_lock = threading.Lock()
+        self._pending: Dict[int, "Future[Any]"] = {}
+        self._pending_lock = threading.Lock()
+        self._closed = False
+        self._reader = threading.Thread(target=self._read_replies, name="axiomd-client", daemon=True)
+        self._reader.start()
+
+    def submit(self, op: str, **args: Any) -> Tuple[int, "Future[Any]"]:
+        """Send a request; returns its id and a future for the result."""
+
+        future: "Future[Any]" = Future()
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError("Daemon closed the connection")
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+        line = json.dumps({"id": request_id, "op": op, "args": args}, ensure_ascii=False) + "\n"
+        try:
+            with self._send_lock:
+                self._sock.sendall(line.encode("utf-8"))
+        except OSError as exc:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+            raise RuntimeError(f"Daemon connection failed: {exc}") from exc
+        return request_id, future
+
+    def call(self, op: str, **args: Any) -> Any:
+        return self.submit(op, **args)[1].result()
+
+    def _read_replies(self) -> None:
+        try:
+            for raw in self._rfile:
+                try:
+                    response = json.loads(raw)
+                except ValueError:
+                    logger.warning("Undecodable daemon reply: %r", raw[:200])
+                    continue
+                with self._pending_lock:
+                    future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():  # e.g. already failed by a local cancel
+                    continue
+                if response.get("ok"):
+                    future.set_result(response.get("result"))
+                elif response.get("cancelled"):
+                    future.set_exception(GenerationCancelled(response["cancelled"]))
+                else:
+                    future.set_exception(RuntimeError(f"Daemon error: {response.get('error')}"))
+        except (OSError, ValueError):  # socket closed under the reader
+            pass
+        finally:
+            with self._pending_lock:
+                self._closed = True
+                pending, self._pending = list(self._pending.values()), {}
+            for future in pending:
+                if not future.done():
+                    future.set_exception(RuntimeError("Daemon closed the connection"))
+
+    def close(self) -> None:
+        try:
+            self._sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self._sock.close()
+        self._reader.join(timeout=1.0)
+        self._rfile.close()
+
+
+class RemoteKernel:
+    """Kernel stand-in that forwards generation to the daemon."""
+
+    def __init__(self, client: DaemonClient, route: Optional[str] = None, priority: Optional[str] = None) -> None:
+        self._client = client
+        self._route = route
+        self._priority = priority
+
+    def close(self) -> None:
+        self._client.close()
+
+    def for_route(self, route: str) -> "RemoteKernel":
+        """Bind a route; the daemon resolves it if it runs a ModelRouter."""
+
+        return RemoteKernel(self._client, route, self._priority)
+
+    def daemon_stats(self) -> Dict[str, Any]:
+        """Completion cache and scheduler counters of the shared daemon."""
+
+        return self._client.call("stats")
+
+    def with_priority(self, priority: str) -> "RemoteKernel":
+        """Bind a priority class for the daemon's scheduler."""
+
+        return RemoteKernel(self._client, self._route, priority)
+
+    def generate(
+        self,
+        *,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        cancel: Optional[CancelToken] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Forward a generation; a ``cancel`` deadline is enforced by the daemon.
+
+        Cancelling locally raises GenerationCancelled at once and sends a
+        ``cancel`` op, so the daemon stops the call too.
+        """
+
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        request_id, future = self._client.submit(
+            "generate",
+            route=self._route,
+            priority=self._priority,
+            system_prompt=system_prompt,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            response_schema=response_schema,
+            deadline=cancel.remaining() if cancel is not None else None,
+            with_usage=usage is not None,
+        )
+        unregister = None
+        if cancel is not None:
+            unregister = cancel.on_cancel(lambda: self._cancel(request_id, future, cancel))
+        try:
+            reply = future.result()
+        except RuntimeError:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            raise
+        finally:
+            if unregister is not None:
+                unregister()
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        if usage is not None:
+            usage.update(reply["usage"])
+            return reply["text"]
+        return reply
+
+    def _cancel(self, request_id: int, future: "Future[Any]", cancel: CancelToken) -> None:
+        try:
+            future.set_exception(GenerationCancelled(cancel.reason or "cancelled"))
+        except InvalidStateError:  # the reply won the race
+            return
+        try:
+            self._client.submit("cancel", id=request_id)
+        except RuntimeError as exc:
+            logger.debug("Could not forward cancel of request %d: %s", request_id, exc)
+
+
+class RemoteEntropyShield:
+    """EntropyShield stand-in whose appends are serialized by the daemon."""
+
+    def __init__(self, client: DaemonClient) -> None:
+        self._client = client
+        self._ledger_path = Path(client.call("ledger_path"))
+
+    @property
+    def ledger_path(self) -> Path:
+        return self._ledger_path
+
+    def record_command(
+        self,
+        *,
+        command: str,
+        cwd: str,
+        exit_code: Optional[int] = None,
+        stdout_hash: Optional[str] = None,
+        stderr_hash: Optional[str] = None,
+        duration_ms: Optional[float] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        profile: Optional[str] = None,
+    ) -> None:
+        self._client.call(
+            "record_command",
+            command=command,
+            cwd=cwd,
+            exit_code=exit_code,
+            stdout_hash=stdout_hash,
+            stderr_hash=stderr_hash,
+            duration_ms=duration_ms,
+            usage=usage,
+            profile=profile,
+        )
+
+    def record_job(
+        self,
+        *,
+        action: str,
+        job_id: int,
+        command: str,
+        cwd: str,
+        pid: Optional[int] = None,
+        exit_code: Optional[int] = None,
+        state: Optional[str] = None,
+        output_hash: Optional[str] = None,
+        duration_ms: Optional[float] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        profile: Optional[str] = None,
+    ) -> None:
+        self._client.call(
+            "record_job",
+            action=action,
+            job_id=job_id,
+            command=command,
+            cwd=cwd,
+            pid=pid,
+            exit_code=exit_code,
+            state=state,
+            output_hash=output_hash,
+            duration_ms=duration_ms,
+            usage=usage,
+            profile=profile,
+        )
+
+    def record_file_change(
+        self,
+        *,
+        path: Path,
+        before_hash: Optional[str],
+        after_hash: Optional[str],
+        patch: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self._client.call(
+            "record_file_change", path=str(path), before_hash=before_hash, after_hash=after_hash, patch=patch
+        )
+
+    def record_file_batch(self, *, changes: List[Dict[str, Optional[str]]]) -> None:
+        self._client.call("record_file_batch", changes=changes)
+
+    def record_kernel_call(
+        self,
+        *,
+        prompt_hash: str,
+        response_hash: Optional[str] = None,
+        status: Optional[str] = None,
+        duration_ms: Optional[float] = None,
+        model: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        tokens_estimated: bool = False,
+        cached: bool = False,
+        recalled_from: Optional[int] = None,
+        similarity: Optional[float] = None,
+        speculative: bool = False,
+    ) -> None:
+        self._client.call(
+            "record_kernel_call",
+            prompt_hash=prompt_hash,
+            response_hash=response_hash,
+            status=status,
+            duration_ms=duration_ms,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            tokens_estimated=tokens_estimated,
+            cached=cached,
+            recalled_from=recalled_from,
+            similarity=similarity,
+            speculative=speculative,
+        )
+
+    def record_search(
+        self, *, query: str, root: str, regex: bool, match_count: int, duration_ms: Optional[float] = None
+    ) -> None:
+        self._client.call(
+            "record_search", query=query, root=root, regex=regex, match_count=match_count, duration_ms=duration_ms
+        )
+
+    def record_kernel_resilience(self, *, action: str, details: Dict[str, Any]) -> None:
+        self._client.call("record_kernel_resilience", action=action, details=details)
+
+    def merge_events(self, events: List[LedgerEvent], *, worker: str) -> None:
+        self._client.call("merge_events", events=[event.to_dict() for event in events], worker=worker)
+
+    def latest_timestamp(self) -> Optional[str]:
+        return self._client.call("latest_timestamp")
+
+    def tail_events(self, limit: int) -> List[LedgerEvent]:
+        return [
+            LedgerEvent(timestamp=e["timestamp"], kind=e["kind"], payload=e["payload"])
+            for e in self._client.call("tail_events", limit=limit)
+        ]
+
+
+def connect(socket_path: Path) -> Tuple[RemoteEntropyShield, RemoteKernel]:
+    """Open a daemon session and return ``(shield, kernel)`` proxies."""
+
+    client = DaemonClient(socket_path)
+    return RemoteEntropyShield(client), RemoteKernel(client)
@@ -7,17 +7,47 @@ in free-form suggestions.
 
 from __future__ import annotations
 
+import hashlib
 import logging
+import os
 import shlex
+import shutil
+import stat
 import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Iterable, List, Protocol
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+)
 
 from entropy_shield import EntropyShield
+from resource_limits import wait_with_usage
+
+if TYPE_CHECKING:
+    from blob_store import BlobStore
+    from file_watch import FileWatcher
+    from resource_limits import ResourceGovernor
+    from workers import WorkerPool
 
 logger = logging.getLogger("agent")
 
+_PATCH_CHUNK = 1 << 20
+
 
 class Invariant(Protocol):
     """Protocol for safety invariants applied to shell commands."""
@@ -37,6 +67,43 @@ class ForbiddenCommandInvariant:
                 raise RuntimeError(f"Command violates deterministic safety invariant: token '{forbidden}' is forbidden")
 
 
+@dataclass
+class FileChange:
+    path: Path
+    before_hash: Optional[str]
+    after_hash: Optional[str]
+    patch: Optional[Dict[str, Any]] = None
+
+    def as_payload(self) -> Dict[str, Any]:
+        payload: Dict[str, Any] = {
+            "path": str(self.path),
+            "before_hash": self.before_hash,
+            "after_hash": self.after_hash,
+        }
+        if self.patch is not None:
+            payload["patch"] = self.patch
+        return payload
+
+
+@dataclass
+class FilePatch:
+    """Replace ``length`` bytes at byte ``offset`` with ``data``.
+
+    ``length=0`` inserts and empty ``data`` deletes. Offsets refer to the
+    file before any patch of the same call is applied.
+    """
+
+    offset: int
+    length: int
+    data: bytes = b""
+
+
+def serialize_patches(patches: Sequence[FilePatch]) -> bytes:
+    """Canonical form hashed for ``patch.hash``: ``b"<offset> <length> <size>\\n" + data`` per patch."""
+
+    return b"".join(b"%d %d %d\n" % (p.offset, p.length, len(p.data)) + p.data for p in patches)
+
+
 class DeterministicAgent:
     """Agent that only executes commands after invariant verification.
 
@@ -52,8 +119,16 @@ class DeterministicAgent:
         *,
         entropy_shield: EntropyShield,
         invariants: Iterable[Invariant] | None = None,
+        watcher: Optional["FileWatcher"] = None,
+        blobs: Optional["BlobStore"] = None,
+        governor: Optional["ResourceGovernor"] = None,
+        workers: Optional["WorkerPool"] = None,
     ) -> None:
         self._entropy_shield = entropy_shield
+        self._watcher = watcher
+        self.blobs = blobs
+        self.governor = governor
+        self.workers = workers
         self._invariants: List[Invariant] = list(invariants or [
             ForbiddenCommandInvariant(forbidden_tokens=["rm", "rm -rf", "shutdown", "reboot", "format"]),
         ])
@@ -104,46 +179,383 @@ class DeterministicAgent:
 
         The Zero Entropy Law is enforced at this layer: if verification
         fails, execution is blocked and no side effects occur.
+
+        With a ``watcher`` (see file_watch.py), files the command changed
+        under ``cwd`` are recorded as ``file_change`` events after the
+        ``command`` event. With ``blobs``, stdout and stderr are kept in
+        the blob store and referenced from the ``command`` event by hash.
+
+        With a ``governor`` the agent's resource profile (niceness,
+        rlimits, cgroup) applies to the command (see resource_limits.py).
+        Its CPU time and peak memory are recorded as ``usage`` where the
+        platform reports them.
+
+        With ``workers`` the verified command runs on an executor worker
+        that has a free slot, and the worker's events are merged into the
+        ledger (see workers.py). It runs here only when none is free.
         """
 
         tokens = self.verify_command(command)
+        if self.workers is not None:
+            completed = self.workers.execute(command, cwd)
+            if completed is not None:
+                return completed
         logger.info("Executing verified command: %s", command)
 
-        completed = subprocess.run(
+        if self._watcher is not None:
+            self._watcher.begin(cwd)
+        start = time.perf_counter()
+        try:
+            completed, usage = self._run(tokens, cwd)
+        finally:
+            duration_ms = round((time.perf_counter() - start) * 1000.0, 1)
+            changes = self._watcher.finish() if self._watcher is not None else []
+
+        stdout_hash = stderr_hash = None
+        if self.blobs is not None:
+            stdout_hash = self.blobs.put_text(completed.stdout)
+            stderr_hash = self.blobs.put_text(completed.stderr)
+        self._entropy_shield.record_command(
+            command=command,
+            cwd=str(cwd),
+            exit_code=completed.returncode,
+            stdout_hash=stdout_hash,
+            stderr_hash=stderr_hash,
+            duration_ms=duration_ms,
+            usage=usage,
+            profile=self.governor.profile.name if self.governor is not None else None,
+        )
+        for path, before_hash, after_hash in changes:
+            self._entropy_shield.record_file_change(path=path, before_hash=before_hash, after_hash=after_hash)
+
+        logger.debug("Command stdout=%s", completed.stdout)
+        logger.debug("Command stderr=%s", completed.stderr)
+        return completed
+
+    def _run(self, tokens: List[str], cwd: Path) -> Tuple[subprocess.CompletedProcess[str], Optional[Dict[str, Any]]]:
+        """``subprocess.run`` with capture, resource limits and usage accounting."""
+
+        process = subprocess.Popen(
             tokens,
             cwd=str(cwd),
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
             text=True,
             shell=False,
+            **(self.governor.popen_kwargs() if self.governor is not None else {}),
         )
+        if self.governor is not None:
+            self.governor.after_spawn(process.pid)
+        # Pipes are drained on threads so the main thread can reap with
+        # wait4, which reports the command's resource usage.
+        output: Dict[str, str] = {}
+        readers = [
+            threading.Thread(target=lambda name=name, pipe=pipe: output.__setitem__(name, pipe.read()), daemon=True)
+            for name, pipe in (("stdout", process.stdout), ("stderr", process.stderr))
+        ]
+        for reader in readers:
+            reader.start()
+        try:
+            returncode, usage = wait_with_usage(process)
+        except BaseException:
+            process.kill()
+            process.wait()
+            raise
+        finally:
+            for reader in readers:
+                reader.join()
+            process.stdout.close()  # type: ignore[union-attr]
+            process.stderr.close()  # type: ignore[union-attr]
+        completed = subprocess.CompletedProcess(tokens, returncode, output.get("stdout", ""), output.get("stderr", ""))
+        return completed, usage
+
+    def spawn_command(self, command: str, cwd: Path) -> subprocess.Popen[str]:
+        """Start a verified command without waiting for it.
+
+        Verification is the same as ``execute_command``. stdout and
+        stderr are merged into one pipe, and on POSIX the process leads
+        its own session so it and its children can be killed together.
+        The agent's resource profile applies as in ``execute_command``.
+        The caller records the outcome once the process exits (see jobs.py).
+        """
 
-        self._entropy_shield.record_command(command=command, cwd=str(cwd), exit_code=completed.returncode)
+        tokens = self.verify_command(command)
+        logger.info("Spawning verified command: %s", command)
 
-        logger.debug("Command stdout=%s", completed.stdout)
-        logger.debug("Command stderr=%s", completed.stderr)
-        return completed
+        process = subprocess.Popen(
+            tokens,
+            cwd=str(cwd),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            errors="replace",
+            bufsize=1,
+            shell=False,
+            start_new_session=os.name == "posix",
+            **(self.governor.popen_kwargs() if self.governor is not None else {}),
+        )
+        if self.governor is not None:
+            self.governor.after_spawn(process.pid)
+        return process
 
     # File mutation path -------------------------------------------------------
 
     def write_file(self, path: Path, content: str) -> None:
         """Write a file deterministically and record the change.
 
-        This helper computes hashes before and after, and routes the
-        event into the Entropy Shield.
+        The content is written as UTF-8 bytes without newline
+        translation and ``after_hash`` is computed from those bytes, so
+        the file is not read back. For small edits to large files use
+        ``patch_file``.
         """
 
+        data = content.encode("utf-8")
         before_hash = self._safe_hash(path)
         path.parent.mkdir(parents=True, exist_ok=True)
-        path.write_text(content, encoding="utf-8")
-        after_hash = self._safe_hash(path)
+        path.write_bytes(data)
+        after_hash = hashlib.sha256(data).hexdigest()
 
         self._entropy_shield.record_file_change(path=path, before_hash=before_hash, after_hash=after_hash)
 
+    def patch_file(
+        self, path: Path, patches: Sequence[FilePatch], *, in_place: bool = False, fsync: bool = True
+    ) -> FileChange:
+        """Apply byte-range edits to an existing file and record the change.
+
+        The file is read once: the before and after hashes are computed
+        in the same pass, with the patched ranges substituted as the
+        pass goes.
+
+        - By default the patched file is streamed to a temp file next to
+          the target, which is then renamed over it. The edit is atomic,
+          and the file's permission bits are kept.
+        - With ``in_place=True`` only the patched ranges are written
+          into the existing file, so a one-line edit to a large file
+          writes a few bytes instead of the whole file. Every patch must
+          keep its length. The edit is not atomic: a crash while the
+          ranges are written can leave some of them applied.
+
+        The ``file_change`` event carries ``patch``: the SHA-256 of
+        ``serialize_patches(patches)``, the number of ranges and the
+        mode. With ``blobs`` the serialized patch is also stored, under
+        that hash.
+        """
+
+        path = Path(path)
+        ordered = sorted(patches, key=lambda p: p.offset)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            raise RuntimeError(f"patch_file: {path} does not exist; use write_file to create it") from None
+        end = 0
+        for patch in ordered:
+            if patch.offset < end or patch.length < 0 or patch.offset + patch.length > size:
+                raise RuntimeError(
+                    f"patch_file: range {patch.offset}+{patch.length} overlaps another patch "
+                    f"or lies outside {path} ({size} bytes)"
+                )
+            if in_place and len(patch.data) != patch.length:
+                raise RuntimeError("patch_file: in_place patches must keep their length; use copy-on-write instead")
+            end = patch.offset + patch.length
+
+        before = hashlib.sha256()
+        after = hashlib.sha256()
+        if in_place:
+            with path.open("r+b") as f:
+                _splice(f, ordered, before.update, after.update)
+                for patch in ordered:
+                    if patch.data:
+                        f.seek(patch.offset)
+                        f.write(patch.data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+        else:
+            fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".axiom-tmp")
+            try:
+                with os.fdopen(fd, "wb") as out, path.open("rb") as f:
+                    os.chmod(tmp, stat.S_IMODE(os.fstat(f.fileno()).st_mode))
+
+                    def emit(data: bytes) -> None:
+                        after.update(data)
+                        out.write(data)
+
+                    _splice(f, ordered, before.update, emit)
+                    if fsync:
+                        out.flush()
+                        os.fsync(out.fileno())
+                os.replace(tmp, path)
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+
+        serialized = serialize_patches(ordered)
+        patch_hash = self.blobs.put(serialized) if self.blobs is not None else hashlib.sha256(serialized).hexdigest()
+        change = FileChange(
+            path=path,
+            before_hash=before.hexdigest(),
+            after_hash=after.hexdigest(),
+            patch={"hash": patch_hash, "ranges": len(ordered), "in_place": in_place},
+        )
+        self._entropy_shield.record_file_change(
+            path=path, before_hash=change.before_hash, after_hash=change.after_hash, patch=change.patch
+        )
+        return change
+
+    def write_files(
+        self, files: Mapping[Path, str], *, max_workers: Optional[int] = None, fsync: bool = True
+    ) -> List[FileChange]:
+        """Write many files as one transaction and record one grouped event.
+
+        Contents are staged to temp files next to their targets while a
+        thread pool hashes the previous and new contents. Only when every
+        file is staged are the temp files renamed into place, each with a
+        single rename, so no target is ever missing. If any step fails,
+        files already renamed are restored from hard-linked backups,
+        staged temp files are removed, and nothing is recorded.
+
+        Contents are written as UTF-8 bytes without newline translation,
+        so ``after_hash`` is the hash of exactly what is on disk. Existing
+        files keep their permission bits; new ones get the umask default.
+        """
+
+        targets = [(Path(path), content.encode("utf-8")) for path, content in files.items()]
+        if not targets:
+            return []
+        # Read once here: the umask is process-wide, so the staging threads must not touch it.
+        new_file_mode = 0o666 & ~_current_umask()
+
+        def stage(item: Tuple[Path, bytes]) -> Tuple[Path, Optional[str], str, str]:
+            path, data = item
+            before_hash = self._safe_hash(path)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=str(path.parent), prefix=f".{path.name}.", suffix=".axiom-tmp")
+            try:
+                # mkstemp creates 0600; give the file the mode a plain write would leave.
+                os.chmod(tmp, _existing_mode(path, new_file_mode))
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                    if fsync:
+                        f.flush()
+                        os.fsync(f.fileno())
+            except BaseException:
+                Path(tmp).unlink(missing_ok=True)
+                raise
+            return path, before_hash, hashlib.sha256(data).hexdigest(), tmp
+
+        staged: List[Tuple[Path, Optional[str], str, str]] = []
+        errors: List[BaseException] = []
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="write-files") as pool:
+            for future in [pool.submit(stage, item) for item in targets]:
+                try:
+                    staged.append(future.result())
+                except BaseException as exc:
+                    errors.append(exc)
+        if errors:
+            for _, _, _, tmp in staged:
+                Path(tmp).unlink(missing_ok=True)
+            raise RuntimeError(f"write_files: staging failed, no files changed: {errors[0]}") from errors[0]
+
+        # Commit: keep a second name for each original, then rename the staged
+        # file over it, so every target path exists at all times.
+        committed: List[Tuple[Path, Optional[str]]] = []
+        try:
+            for path, before_hash, _, tmp in staged:
+                backup = None
+                if before_hash is not None:
+                    backup = f"{tmp}.bak"
+                    _link_or_copy(path, backup)
+                committed.append((path, backup))
+                os.replace(tmp, path)
+        except BaseException as exc:
+            for path, backup in reversed(committed):
+                if backup is not None:
+                    os.replace(backup, path)
+                    # A no-op if the staged rename never happened (both names are one inode).
+                    Path(backup).unlink(missing_ok=True)
+                else:
+                    path.unlink(missing_ok=True)
+            for _, _, _, tmp in staged:
+                Path(tmp).unlink(missing_ok=True)
+            logger.error("write_files rolled back %d file(s): %s", len(committed), exc)
+            raise RuntimeError(f"write_files: commit failed and was rolled back: {exc}") from exc
+
+        for _, backup in committed:
+            if backup is not None:
+                Path(backup).unlink(missing_ok=True)
+
+        changes = [FileChange(path=path, before_hash=before, after_hash=after) for path, before, after, _ in staged]
+        self._entropy_shield.record_file_batch(changes=[change.as_payload() for change in changes])
+        return changes
+
     @staticmethod
     def _safe_hash(path: Path) -> str | None:
-        import hashlib
-
         if not path.exists():
             return None
-        data = path.read_bytes()
-        return hashlib.sha256(data).hexdigest()
+        digest = hashlib.sha256()
+        with path.open("rb") as f:
+            for chunk in iter(lambda: f.read(_PATCH_CHUNK), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+def _link_or_copy(source: Path, target: str) -> None:
+    """Hard-link ``source`` as ``target``, copying on filesystems without links."""
+
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copy2(source, target)
+
+
+def _current_umask() -> int:
+    """The process umask, read without changing it where the OS allows."""
+
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("Umask:"):
+                    return int(line.split()[1], 8)
+    except (OSError, ValueError, IndexError):
+        pass
+    # No /proc (macOS, old kernels): the only portable read is set-and-restore.
+    umask = os.umask(0o022)
+    os.umask(umask)
+    return umask
+
+
+def _existing_mode(path: Path, new_file_mode: int) -> int:
+    """Permission bits of ``path``, or ``new_file_mode`` if it does not exist yet."""
+
+    try:
+        return stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        return new_file_mode
+
+
+def _splice(
+    source: BinaryIO, patches: Sequence[FilePatch], original: Callable[[bytes], Any], patched: Callable[[bytes], Any]
+) -> None:
+    """Stream ``source`` from its start: every byte goes to ``original``, the patched content to ``patched``."""
+
+    source.seek(0)
+
+    def copy(count: Optional[int], *, keep: bool) -> None:
+        while count is None or count > 0:
+            chunk = source.read(_PATCH_CHUNK if count is None else min(count, _PATCH_CHUNK))
+            if not chunk:
+                return
+            original(chunk)
+            if keep:
+                patched(chunk)
+            if count is not None:
+                count -= len(chunk)
+
+    position = 0
+    for patch in patches:
+        copy(patch.offset - position, keep=True)
+        copy(patch.length, keep=False)
+        patched(patch.data)
+        position = patch.offset + patch.length
+    copy(None, keep=True)
@@ -0,0 +1,250 @@
+"""Diagnostics module: the ``!stats`` and ``!profile`` dashboard commands.
+
+Both dashboards delegate to this module so the two commands behave the
+same everywhere:
+
+- ``!stats`` reports ledger size, cache hit rates and model latency
+  percentiles from whatever layers the kernel is built from (priority
+  scheduler, resilience wrapper, model router, Ollama replicas, shared
+  daemon).
+- ``!profile [N]`` runs cProfile and tracemalloc for the next N
+  commands (default 5), then shows the hottest functions and the top
+  allocation sites and dumps both to ``<log_dir>/profiles``.
+  ``!profile off`` stops early.
+
+Model calls run on worker threads; the dashboards pass those callables
+through ``CommandProfiler.wrap`` so their time is included.
+"""
+
+from __future__ import annotations
+
+import cProfile
+import logging
+import pstats
+import threading
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, TypeVar
+
+logger = logging.getLogger("orchestrator")
+
+T = TypeVar("T")
+
+DEFAULT_PROFILE_COMMANDS = 5
+
+
+def _fmt_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value * 1000:.0f}ms"
+
+
+def _rate(hits: int, misses: int) -> str:
+    total = hits + misses
+    return f"{hits}/{total} ({hits / total:.0%})" if total else "0/0"
+
+
+def _kernel_layers(kernel: Any) -> Iterator[Any]:
+    """The kernel and every wrapper's ``inner`` kernel, outermost first."""
+
+    seen = set()
+    while kernel is not None and id(kernel) not in seen:
+        seen.add(id(kernel))
+        yield kernel
+        kernel = getattr(kernel, "inner", None)
+
+
+def _scheduler_lines(stats: Dict[str, Dict[str, Any]]) -> List[str]:
+    lines = []
+    for priority, s in stats.items():
+        if not s["calls"] and not s["queued"] and not s["rejected"]:
+            continue
+        lines.append(
+            f"  {priority}: calls={s['calls']} errors={s['errors']} queued={s['queued']} "
+            f"rejected={s['rejected']} preempted={s['preempted']} promoted={s['promoted']} "
+            f"wait p50/p95={_fmt_seconds(s['wait_p50_s'])}/{_fmt_seconds(s['wait_p95_s'])} "
+            f"run p50/p95={_fmt_seconds(s['run_p50_s'])}/{_fmt_seconds(s['run_p95_s'])}"
+        )
+    return lines or ["  no model calls yet"]
+
+
+def collect_stats(
+    *,
+    shield: Any,
+    kernel: Any,
+    prefetcher: Any = None,
+    profiler: Optional["CommandProfiler"] = None,
+) -> str:
+    """Text report for ``!stats``."""
+
+    lines = []
+    ledger = Path(shield.ledger_path)
+    size = ledger.stat().st_size if ledger.exists() else 0
+    lines.append(f"ledger: {ledger} {size / (1 << 20):.2f} MiB, last event {shield.latest_timestamp() or '-'}")
+
+    for layer in _kernel_layers(kernel):
+        scheduler = getattr(layer, "scheduler", None)
+        if scheduler is not None:
+            lines.append("scheduler (queue wait / model run time):")
+            lines.extend(_scheduler_lines(scheduler.stats()))
+        breaker = getattr(layer, "breaker", None)
+        if breaker is not None:
+            lines.append(f"circuit breaker: {breaker.state}")
+        router_stats = getattr(layer, "stats", None)
+        if callable(router_stats):
+            for route, s in router_stats().items():
+                lines.append(
+                    f"route {route}: calls={s['calls']} errors={s['errors']} fallbacks={s['fallbacks']} "
+                    f"p50/p95={_fmt_seconds(s['p50_s'])}/{_fmt_seconds(s['p95_s'])}"
+                )
+        endpoint_stats = getattr(layer, "endpoint_stats", None)
+        if callable(endpoint_stats):
+            for endpoint, s in endpoint_stats().items():
+                lines.append(
+                    f"endpoint {endpoint}: {'up' if s['healthy'] else 'DOWN'} calls={s['calls']} errors={s['errors']} "
+                    f"running={s['outstanding']} sticky={s['sticky_hits']} "
+                    f"p50/p95={_fmt_seconds(s['p50_s'])}/{_fmt_seconds(s['p95_s'])}"
+                )
+        daemon_stats = getattr(layer, "daemon_stats", None)
+        if callable(daemon_stats):
+            remote = daemon_stats()
+            cache = remote["cache"]
+            lines.append(
+                f"daemon completion cache: {cache['entries']} entries, hits {_rate(cache['hits'], cache['misses'])}"
+            )
+            if remote.get("scheduler"):
+                lines.append("daemon scheduler (queue wait / model run time):")
+                lines.extend(_scheduler_lines(remote["scheduler"]))
+
+    if prefetcher is not None:
+        lines.append(
+            f"prefetch: launched={prefetcher.launched} served {_rate(prefetcher.hits, prefetcher.misses)}"
+        )
+    if profiler is not None and profiler.active:
+        lines.append(f"profiling: {profiler.remaining} command(s) left")
+    return "\n".join(lines)
+
+
+class CommandProfiler:
+    """cProfile + tracemalloc over the next N dashboard commands."""
+
+    def __init__(self, log_dir: Path, *, top: int = 15) -> None:
+        self._dir = log_dir / "profiles"
+        self._top = top
+        self._lock = threading.Lock()
+        self._main: Optional[cProfile.Profile] = None
+        self._workers: List[cProfile.Profile] = []
+        self._baseline: Optional[tracemalloc.Snapshot] = None
+        self._started_tracemalloc = False
+        self.remaining = 0
+
+    @property
+    def active(self) -> bool:
+        return self._main is not None
+
+    def start(self, commands: int = DEFAULT_PROFILE_COMMANDS) -> str:
+        """Start profiling in the calling (UI) thread."""
+
+        if self.active:
+            return f"Already profiling; {self.remaining} command(s) left."
+        self.remaining = max(1, commands)
+        self._workers = []
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(10)
+            self._started_tracemalloc = True
+        self._baseline = tracemalloc.take_snapshot()
+        self._main = cProfile.Profile()
+        self._main.enable()
+        return f"Profiling the next {self.remaining} command(s)."
+
+    def command(self, argument: str) -> str:
+        """Handle ``!profile [N|off]``; returns the text to show."""
+
+        argument = argument.strip().lower()
+        if argument == "off":
+            return self.stop() or "Profiling is not running."
+        try:
+            commands = int(argument) if argument else DEFAULT_PROFILE_COMMANDS
+        except ValueError:
+            return "Usage: !profile [N|off]"
+        return self.start(commands)
+
+    def wrap(self, fn: Callable[[], T]) -> Callable[[], T]:
+        """Profile ``fn`` on whichever worker thread runs it, if profiling."""
+
+        if not self.active:
+            return fn
+
+        def profiled() -> T:
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError:  # another profiler already covers this thread
+                return fn()
+            try:
+                return fn()
+            finally:
+                profile.disable()
+                with self._lock:
+                    self._workers.append(profile)
+
+        return profiled
+
+    def command_finished(self) -> Optional[str]:
+        """Count one command; returns the report once the last one finishes."""
+
+        if not self.active:
+            return None
+        self.remaining -= 1
+        return self.stop() if self.remaining <= 0 else None
+
+    def stop(self) -> Optional[str]:
+        """Stop profiling, dump the results and return the report."""
+
+        if self._main is None:
+            return None
+        self._main.disable()
+        with self._lock:
+            profiles, self._workers = [self._main, *self._workers], []
+        self._main = None
+        self.remaining = 0
+
+        snapshot = tracemalloc.take_snapshot()
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        allocations = snapshot.compare_to(self._baseline, "lineno") if self._baseline is not None else []
+        self._baseline = None
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+        self._dir.mkdir(parents=True, exist_ok=True)
+        prof_path = self._dir / f"profile-{stamp}.prof"
+        stats.dump_stats(str(prof_path))
+        alloc_text = "\n".join(str(diff) for diff in allocations[:100])
+        (self._dir / f"alloc-{stamp}.txt").write_text(alloc_text + "\n", encoding="utf-8")
+        logger.info("Profile written to %s", prof_path)
+
+        return "\n".join(
+            [
+                f"hot functions (cumulative), {len(profiles)} profiled thread run(s):",
+                *self._hot_functions(stats),
+                "top allocation sites (growth since start):",
+                *[
+                    f"  {diff.size_diff / 1024:+.1f} KiB {diff.count_diff:+d} blocks  {diff.traceback[0]}"
+                    for diff in allocations[: self._top]
+                    if diff.size_diff
+                ],
+                f"dumped to {prof_path} (open with: python -m pstats {prof_path.name})",
+            ]
+        )
+
+    def _hot_functions(self, stats: pstats.Stats) -> List[str]:
+        # stats.stats maps (file, line, name) -> (prim calls, calls, own time, cumulative, callers)
+        entries = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)  # type: ignore[attr-defined]
+        return [
+            f"  cum {cumulative:8.3f}s  own {own:8.3f}s  calls {calls:7d}  {Path(filename).name}:{line}({name})"
+            for (filename, line, name), (_, calls, own, cumulative, _) in entries[: self._top]
+        ]
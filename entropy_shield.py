@@ -9,21 +9,62 @@ from __future__ import annotations
 
 import json
 import logging
-from dataclasses import dataclass, asdict
+import os
+import threading
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, Literal, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 logger = logging.getLogger("tools")
 
-EventKind = Literal["command", "file_change", "kernel_call"]
+EventKind = Literal["command", "job", "file_change", "file_batch", "kernel_call", "kernel_resilience", "search"]
+
+
+# One shared encoder: ``json.dumps`` with non-default options builds a new
+# JSONEncoder on every call. The separators are the json.dumps defaults,
+# so lines are byte-identical to the previous ``json.dumps(asdict(...))``.
+# Public so other writers of canonical ledger JSON share this one encoder.
+CANONICAL_JSON = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(", ", ": "))
+
+# Block size for reading the ledger backward from its end.
+_TAIL_BLOCK = 64 * 1024
 
 
-@dataclass
 class LedgerEvent:
-    timestamp: str
-    kind: EventKind
-    payload: Dict[str, Any]
+    """One ledger line.
+
+    A plain ``__slots__`` class rather than a dataclass: events are
+    created once per append, and ``dataclasses.asdict`` deep-copied the
+    payload just to serialize it. ``to_json`` writes the canonical
+    (sorted-key) form directly.
+    """
+
+    __slots__ = ("timestamp", "kind", "payload")
+
+    def __init__(self, timestamp: str, kind: EventKind, payload: Dict[str, Any]) -> None:
+        self.timestamp = timestamp
+        self.kind = kind
+        self.payload = payload
+
+    def __repr__(self) -> str:
+        return f"LedgerEvent(timestamp={self.timestamp!r}, kind={self.kind!r}, payload={self.payload!r})"
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, LedgerEvent):
+            return NotImplemented
+        return (self.timestamp, self.kind, self.payload) == (other.timestamp, other.kind, other.payload)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "payload": self.payload, "timestamp": self.timestamp}
+
+    def to_json(self) -> str:
+        encode = CANONICAL_JSON.encode
+        return (
+            '{"kind": ' + encode(self.kind)
+            + ', "payload": ' + encode(self.payload)
+            + ', "timestamp": ' + encode(self.timestamp) + "}"
+        )
 
 
 @dataclass
@@ -43,6 +84,9 @@ class EntropyShield:
         self._config = config
         self._config.root_dir.mkdir(parents=True, exist_ok=True)
         self._ledger_path = self._config.root_dir / self._config.ledger_filename
+        # Appends are serialized so that concurrent sessions sharing one
+        # shield (see daemon.py) never interleave partial lines.
+        self._write_lock = threading.Lock()
         logger.debug("EntropyShield initialized at %s", self._ledger_path)
 
     @property
@@ -53,58 +97,260 @@ class EntropyShield:
         return datetime.now(timezone.utc).isoformat()
 
     def _append(self, event: LedgerEvent) -> None:
-        line = json.dumps(asdict(event), sort_keys=True, ensure_ascii=False)
-        with self._ledger_path.open("a", encoding="utf-8") as f:
-            f.write(line + "\n")
+        line = event.to_json()
+        self._write(line + "\n")
         logger.debug("Ledger event recorded: %s", line)
 
+    def _write(self, text: str) -> None:
+        with self._write_lock:
+            with self._ledger_path.open("a", encoding="utf-8") as f:
+                f.write(text)
+
     # Public recording methods -------------------------------------------------
 
-    def record_command(self, *, command: str, cwd: str, exit_code: Optional[int] = None) -> None:
+    def record_command(
+        self,
+        *,
+        command: str,
+        cwd: str,
+        exit_code: Optional[int] = None,
+        stdout_hash: Optional[str] = None,
+        stderr_hash: Optional[str] = None,
+        duration_ms: Optional[float] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        profile: Optional[str] = None,
+    ) -> None:
+        """Record a shell command.
+
+        ``stdout_hash``/``stderr_hash`` are set when the outputs were kept
+        in the blob store (see blob_store.py); they are omitted otherwise.
+        ``duration_ms`` is the command's wall-clock run time. ``usage``
+        (CPU seconds, peak RSS) and the resource ``profile`` it ran under
+        are set when known (see resource_limits.py).
+        """
+
+        payload: Dict[str, Any] = {"command": command, "cwd": cwd, "exit_code": exit_code}
+        if duration_ms is not None:
+            payload["duration_ms"] = duration_ms
+        if usage is not None:
+            payload["usage"] = usage
+        if profile is not None:
+            payload["profile"] = profile
+        if stdout_hash is not None:
+            payload["stdout_hash"] = stdout_hash
+        if stderr_hash is not None:
+            payload["stderr_hash"] = stderr_hash
+        event = LedgerEvent(timestamp=self._now(), kind="command", payload=payload)
+        self._append(event)
+
+    def record_job(
+        self,
+        *,
+        action: str,
+        job_id: int,
+        command: str,
+        cwd: str,
+        pid: Optional[int] = None,
+        exit_code: Optional[int] = None,
+        state: Optional[str] = None,
+        output_hash: Optional[str] = None,
+        duration_ms: Optional[float] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        profile: Optional[str] = None,
+    ) -> None:
+        """Record a background job starting (``action="start"``) or ending (``"finish"``).
+
+        ``state`` and ``duration_ms`` are set on finish: ``"done"``, ``"failed"``
+        or ``"killed"``, and ``output_hash`` too if the job's output was
+        kept in the blob store. ``usage`` and ``profile`` are as for
+        ``record_command``.
+        """
+
+        payload: Dict[str, Any] = {"action": action, "job_id": job_id, "command": command, "cwd": cwd, "pid": pid}
+        if profile is not None:
+            payload["profile"] = profile
+        if action == "finish":
+            payload["exit_code"] = exit_code
+            payload["state"] = state
+            if duration_ms is not None:
+                payload["duration_ms"] = duration_ms
+            if usage is not None:
+                payload["usage"] = usage
+            if output_hash is not None:
+                payload["output_hash"] = output_hash
+        event = LedgerEvent(timestamp=self._now(), kind="job", payload=payload)
+        self._append(event)
+
+    def record_file_change(
+        self,
+        *,
+        path: Path,
+        before_hash: Optional[str],
+        after_hash: Optional[str],
+        patch: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Record a file write; ``patch`` (hash, ranges, in_place) is set for ranged edits."""
+
+        payload: Dict[str, Any] = {"path": str(path), "before_hash": before_hash, "after_hash": after_hash}
+        if patch is not None:
+            payload["patch"] = patch
+        event = LedgerEvent(timestamp=self._now(), kind="file_change", payload=payload)
+        self._append(event)
+
+    def record_file_batch(self, *, changes: List[Dict[str, Optional[str]]]) -> None:
+        """Record a transactional multi-file write as one grouped event.
+
+        Each entry carries the same ``path``/``before_hash``/``after_hash``
+        fields as a single ``file_change`` event.
+        """
+
         event = LedgerEvent(
             timestamp=self._now(),
-            kind="command",
-            payload={"command": command, "cwd": cwd, "exit_code": exit_code},
+            kind="file_batch",
+            payload={"count": len(changes), "changes": changes},
         )
         self._append(event)
 
-    def record_file_change(self, *, path: Path, before_hash: Optional[str], after_hash: Optional[str]) -> None:
+    def record_kernel_call(
+        self,
+        *,
+        prompt_hash: str,
+        response_hash: Optional[str] = None,
+        status: Optional[str] = None,
+        duration_ms: Optional[float] = None,
+        model: Optional[str] = None,
+        prompt_tokens: Optional[int] = None,
+        completion_tokens: Optional[int] = None,
+        tokens_estimated: bool = False,
+        cached: bool = False,
+        recalled_from: Optional[int] = None,
+        similarity: Optional[float] = None,
+        speculative: bool = False,
+    ) -> None:
+        """Record a model call.
+
+        ``status`` is only set for calls that did not complete, e.g.
+        ``"cancelled"`` or ``"deadline"``; those have no response hash.
+
+        ``duration_ms`` is end to end, including time queued in the
+        scheduler. Token counts come from Ollama's ``usage`` report;
+        ``tokens_estimated`` marks counts taken from a stream that was
+        stopped before the report. ``tokens_per_s`` is derived from
+        ``completion_tokens`` and ``duration_ms``. ``cached`` marks a reply
+        served from the daemon's completion cache. ``recalled_from`` (a
+        semantic memory record id) and ``similarity`` mark a reply reused
+        from memory instead of generated. ``speculative`` marks a prefetch
+        generated before anyone asked for it. Unset fields are omitted.
+        """
+
+        payload: Dict[str, Any] = {"prompt_hash": prompt_hash, "response_hash": response_hash}
+        if status is not None:
+            payload["status"] = status
+        if duration_ms is not None:
+            payload["duration_ms"] = duration_ms
+        if model is not None:
+            payload["model"] = model
+        if prompt_tokens is not None:
+            payload["prompt_tokens"] = prompt_tokens
+        if completion_tokens is not None:
+            payload["completion_tokens"] = completion_tokens
+            if tokens_estimated:
+                payload["tokens_estimated"] = True
+            if duration_ms:
+                payload["tokens_per_s"] = round(completion_tokens / (duration_ms / 1000.0), 2)
+        if cached:
+            payload["cached"] = True
+        if recalled_from is not None:
+            payload["recalled_from"] = recalled_from
+            payload["similarity"] = similarity
+        if speculative:
+            payload["speculative"] = True
+        event = LedgerEvent(timestamp=self._now(), kind="kernel_call", payload=payload)
+        self._append(event)
+
+    def record_kernel_resilience(self, *, action: str, details: Dict[str, Any]) -> None:
+        """Record one retry, hedge, or circuit breaker transition (see resilience.py)."""
+
         event = LedgerEvent(
             timestamp=self._now(),
-            kind="file_change",
-            payload={
-                "path": str(path),
-                "before_hash": before_hash,
-                "after_hash": after_hash,
-            },
+            kind="kernel_resilience",
+            payload={"action": action, **details},
         )
         self._append(event)
 
-    def record_kernel_call(self, *, prompt_hash: str, response_hash: Optional[str] = None) -> None:
+    def record_search(
+        self, *, query: str, root: str, regex: bool, match_count: int, duration_ms: Optional[float] = None
+    ) -> None:
         event = LedgerEvent(
             timestamp=self._now(),
-            kind="kernel_call",
-            payload={"prompt_hash": prompt_hash, "response_hash": response_hash},
+            kind="search",
+            payload={
+                "query": query,
+                "root": root,
+                "regex": regex,
+                "match_count": match_count,
+                "duration_ms": duration_ms,
+            },
         )
         self._append(event)
 
+    def merge_events(self, events: List[LedgerEvent], *, worker: str) -> None:
+        """Append events recorded by an executor worker (see workers.py).
+
+        They keep their own timestamps and gain a ``worker`` field, and
+        are written in one append so they stay together in the ledger.
+        """
+
+        if not events:
+            return
+        self._write(
+            "".join(LedgerEvent(e.timestamp, e.kind, {**e.payload, "worker": worker}).to_json() + "\n" for e in events)
+        )
+        logger.debug("Merged %d ledger event(s) from worker %s", len(events), worker)
+
     # Simple status helpers ----------------------------------------------------
 
+    def tail_events(self, limit: int) -> List[LedgerEvent]:
+        """Return the last ``limit`` events, oldest first.
+
+        The ledger is read backward from its end in fixed-size blocks,
+        so the cost depends on ``limit`` and not on the ledger size. A
+        line another writer is still appending is not included.
+        """
+
+        if limit <= 0 or not self._ledger_path.exists():
+            return []
+        blocks: List[bytes] = []
+        newlines = 0
+        with self._ledger_path.open("rb") as f:
+            position = f.seek(0, os.SEEK_END)
+            # limit + 1 newlines guarantee ``limit`` whole lines after the first, partial one.
+            while position > 0 and newlines <= limit:
+                size = min(_TAIL_BLOCK, position)
+                position -= size
+                f.seek(position)
+                block = f.read(size)
+                blocks.append(block)
+                newlines += block.count(b"\n")
+        # The last element is empty, or a line still being written; the
+        # first one is partial unless the file start was reached.
+        lines = b"".join(reversed(blocks)).split(b"\n")[int(position > 0) : -1]
+        events: List[LedgerEvent] = []
+        for line in reversed(lines):
+            if len(events) == limit:
+                break
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                events.append(LedgerEvent(timestamp=data["timestamp"], kind=data["kind"], payload=data["payload"]))
+            except (ValueError, KeyError, TypeError):
+                logger.warning("Skipping undecodable ledger line: %r", line[:200])
+        events.reverse()
+        return events
+
     def latest_timestamp(self) -> Optional[str]:
         """Return the timestamp of the most recent event, if any."""
 
-        if not self._ledger_path.exists():
-            return None
-        last_line = None
-        with self._ledger_path.open("r", encoding="utf-8") as f:
-            for line in f:
-                if line.strip():
-                    last_line = line
-        if not last_line:
-            return None
-        try:
-            data = json.loads(last_line)
-            return data.get("timestamp")
-        except json.JSONDecodeError:
-            logger.warning("Failed to decode last ledger line: %s", last_line)
-            return None
+        events = self.tail_events(1)
+        return events[0].timestamp if events else None
@@ -0,0 +1,323 @@
+"""File_Watch module: capture file mutations made by shell commands.
+
+``DeterministicAgent.write_file`` records its own ``file_change`` events,
+but files a shell command modifies never reached the ledger, and
+rehashing the whole tree after every command is far too slow. A
+FileWatcher collects the paths touched under the command's ``cwd``
+while it runs, and afterwards hashes only those:
+
+- On Linux an inotify watch is kept on every directory under the root
+  (ignored directories and the log directory excluded). It is set up
+  once per root and reused for later commands.
+- Elsewhere, or when inotify is unavailable or out of watches, the tree
+  is stat-walked before and after the command and paths whose mtime or
+  size changed are taken. Nothing is hashed during the walk.
+
+Before hashes come from a pre-image of every file under the root,
+built when the watcher starts on it with ``take_snapshot`` (see
+workspace_snapshot.py). Only files whose stat differs from the last
+stored snapshot are hashed, and the result is kept under
+``<log_dir>/file_watch`` for the next session. Hashes seen by later
+captures are added as they come. Files changed between commands, e.g.
+by an editor, are rehashed when the next command starts, so the
+pre-image stays current. ``before_hash`` None therefore means the file
+did not exist, and a file whose content did not change (``touch``) is
+not reported.
+"""
+
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import os
+import stat
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from workspace_snapshot import DEFAULT_IGNORED_DIRS, SnapshotStore, _walk, hash_file, take_snapshot
+
+logger = logging.getLogger("tools")
+
+# Subset of <sys/inotify.h>.
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+_EVENT_HEADER = struct.Struct("iIII")
+
+# path -> (mtime_ns, size, sha256), the same layout as a snapshot's FileTable
+PreImage = Dict[str, Tuple[int, int, str]]
+
+
+class _Inotify:
+    """Minimal ctypes binding: one inotify instance watching many directories."""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs: Dict[int, str] = {}
+
+    def add_watch(self, directory: str) -> None:
+        wd = self._add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            code = ctypes.get_errno()
+            if code in (errno.ENOENT, errno.ENOTDIR, errno.EACCES):
+                return  # vanished or unreadable; nothing to watch
+            raise OSError(code, f"inotify_add_watch failed for {directory}")
+        self.dirs[wd] = directory
+
+    def read(self) -> List[Tuple[int, int, str]]:
+        """All pending ``(wd, mask, name)`` events, without blocking."""
+
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 1 << 16)
+            except BlockingIOError:
+                return events
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+                offset += _EVENT_HEADER.size
+                name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+                offset += length
+                events.append((wd, mask, name))
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class FileWatcher:
+    """Collects the files one command touched and diffs them against the pre-image.
+
+    Use ``begin(cwd)`` before running the command and ``finish()`` after
+    it; ``finish`` returns ``(path, before_hash, after_hash)`` for every
+    file whose content changed, appeared or disappeared.
+    """
+
+    def __init__(
+        self,
+        *,
+        log_dir: Path,
+        ignored_dirs: Iterable[str] = DEFAULT_IGNORED_DIRS,
+        use_inotify: bool = True,
+    ) -> None:
+        self._log_dir = log_dir.resolve()
+        self._ignored = frozenset(ignored_dirs)
+        self._use_inotify = use_inotify and sys.platform.startswith("linux")
+        self._root: Optional[Path] = None
+        self._inotify: Optional[_Inotify] = None
+        self._pre_image: PreImage = {}
+        self._before_stats: Optional[Dict[str, Tuple[int, int]]] = None
+        self._began_ns = 0
+        self._overflowed = False
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if self._inotify is not None else "polling"
+
+    # Capture ------------------------------------------------------------------
+
+    def begin(self, cwd: Path) -> None:
+        root = cwd.resolve()
+        if root != self._root:
+            self._reset(root)
+        if self._inotify is not None:
+            # Changes made since the last command: refresh their pre-image.
+            for path in self._drain():
+                self._refresh(path)
+            self._overflowed = False
+        else:
+            self._before_stats = self._stat_tree()
+        self._began_ns = time.time_ns()
+
+    def finish(self) -> List[Tuple[Path, Optional[str], Optional[str]]]:
+        if self._root is None:
+            return []
+        if self._inotify is not None:
+            touched = self._drain()
+            if self._overflowed:
+                logger.warning("File watcher: inotify queue overflowed; rescanning %s", self._root)
+                touched |= self._rescan()
+        else:
+            after = self._stat_tree()
+            before = self._before_stats or {}
+            touched = {p for p in set(before) | set(after) if before.get(p) != after.get(p)}
+            self._before_stats = None
+
+        changes = []
+        for path in sorted(touched):
+            cached = self._pre_image.get(path)
+            before_hash = cached[2] if cached is not None else None
+            after_hash = self._refresh(path)
+            if before_hash != after_hash:
+                changes.append((Path(path), before_hash, after_hash))
+        logger.debug("File watcher (%s): %d touched, %d changed", self.mode, len(touched), len(changes))
+        return changes
+
+    def close(self) -> None:
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    # Internals ----------------------------------------------------------------
+
+    def _reset(self, root: Path) -> None:
+        self.close()
+        self._root = root
+        if self._use_inotify:
+            try:
+                self._inotify = _Inotify()
+                self._watch_tree(root)
+            except (OSError, AttributeError) as exc:  # no inotify, or out of watches
+                logger.info("File watcher: inotify unavailable (%s); polling %s instead", exc, root)
+                self.close()
+        # Watches come first: files changed while the pre-image is built are drained and rehashed by begin().
+        self._pre_image = self._build_pre_image(root)
+        logger.debug("File watcher on %s (%s, %d cached hashes)", root, self.mode, len(self._pre_image))
+
+    def _build_pre_image(self, root: Path) -> PreImage:
+        """Hash every file under ``root``, reusing hashes of files unchanged since a stored snapshot."""
+
+        store = SnapshotStore(self._log_dir / "file_watch")
+        previous = store.load(root) or SnapshotStore(self._log_dir).load(root)
+        start = time.perf_counter()
+        ignored = self._ignored
+        if root in self._log_dir.parents:
+            ignored = ignored | {self._log_dir.name}  # the ledger, blobs and indexes are not workspace files
+        snapshot = take_snapshot(root, previous=previous, ignored_dirs=ignored)
+        try:
+            store.save(snapshot)
+        except OSError as exc:
+            logger.warning("File watcher: cannot store the pre-image of %s: %s", root, exc)
+        logger.info(
+            "File watcher: pre-image of %s (%d files) in %.2fs", root, len(snapshot.files), time.perf_counter() - start
+        )
+        log_prefix = str(self._log_dir) + os.sep
+        return {
+            path: entry
+            for path, entry in ((str(root / rel), entry) for rel, entry in snapshot.files.items())
+            if not path.startswith(log_prefix)
+        }
+
+    def _skip_dir(self, path: str) -> bool:
+        return os.path.basename(path) in self._ignored or Path(path) == self._log_dir
+
+    def _watch_tree(self, top: Path) -> Set[str]:
+        """Watch ``top`` and every directory below it; return the files found."""
+
+        assert self._inotify is not None
+        files: Set[str] = set()
+        stack = [str(top)]
+        while stack:
+            directory = stack.pop()
+            self._inotify.add_watch(directory)
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not self._skip_dir(entry.path):
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        files.add(entry.path)
+                except OSError:
+                    continue
+        return files
+
+    def _drain(self) -> Set[str]:
+        """Touched file paths from pending inotify events; new directories get watched."""
+
+        assert self._inotify is not None
+        touched: Set[str] = set()
+        for wd, mask, name in self._inotify.read():
+            if mask & IN_Q_OVERFLOW:
+                self._overflowed = True
+                continue
+            if mask & IN_IGNORED:
+                self._inotify.dirs.pop(wd, None)
+                continue
+            directory = self._inotify.dirs.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO) and not self._skip_dir(path):
+                    # Files may have been written before the watch existed.
+                    try:
+                        touched |= self._watch_tree(Path(path))
+                    except OSError as exc:
+                        logger.warning("File watcher: cannot watch %s (%s)", path, exc)
+                        self._overflowed = True
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    prefix = path + os.sep
+                    touched |= {p for p in self._pre_image if p.startswith(prefix)}
+                    # A moved directory keeps its watches; they are re-keyed if it reappears here.
+                    for stale in [w for w, d in self._inotify.dirs.items() if d == path or d.startswith(prefix)]:
+                        del self._inotify.dirs[stale]
+                continue
+            touched.add(path)
+        return touched
+
+    def _rescan(self) -> Set[str]:
+        """Fallback after lost events: anything modified since ``begin`` or gone."""
+
+        assert self._root is not None
+        stats = self._stat_tree()
+        touched = {p for p in self._pre_image if p not in stats}
+        for path, (mtime_ns, size) in stats.items():
+            cached = self._pre_image.get(path)
+            if mtime_ns >= self._began_ns or (cached is not None and cached[:2] != (mtime_ns, size)):
+                touched.add(path)
+        return touched
+
+    def _stat_tree(self) -> Dict[str, Tuple[int, int]]:
+        assert self._root is not None
+        stats = _walk(self._root, self._ignored)
+        log_prefix = str(self._log_dir) + os.sep
+        return {
+            path: stat
+            for path, stat in ((str(self._root / rel), stat) for rel, stat in stats.items())
+            if not path.startswith(log_prefix)
+        }
+
+    def _refresh(self, path: str) -> Optional[str]:
+        """Hash ``path`` into the pre-image; None (and forgotten) if it is gone."""
+
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            self._pre_image.pop(path, None)
+            return None
+        cached = self._pre_image.get(path)
+        if cached is not None and cached[:2] == (st.st_mtime_ns, st.st_size):
+            return cached[2]
+        digest = hash_file(path)
+        if digest is None:
+            self._pre_image.pop(path, None)
+            return None
+        self._pre_image[path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
@@ -0,0 +1,278 @@
+"""History module: command history from the ledger, with prefix and fuzzy lookup.
+
+Every shell command already sits in the ledger as a ``command`` event
+(and every background job as a ``job`` start event). CommandHistory
+indexes them for input suggestions and up/down recall:
+
+- The index is built lazily on first use from the ledger's tail only
+  (``tail_bytes``), not the whole file.
+- After that it follows the ledger incrementally: each lookup stats the
+  file and reads just the bytes appended since, so commands recorded by
+  other sessions sharing the ledger appear too.
+- Commands live in a radix (path-compressed) trie. Every node keeps its
+  subtree's best few commands by frecency, so a prefix lookup is a walk
+  down the trie with no subtree scan.
+- Frecency is ``log(sum(exp(t / tau)))`` over a command's uses. Time
+  decays every command equally, so a use only changes that command's
+  score and only the nodes on its path need updating.
+- ``fuzzy`` falls back to subsequence matching when the prefix has too
+  few matches.
+
+Dashboard-only entries (``!ai ...`` and other ``!`` commands) are not
+in the ledger; the dashboards ``add`` them directly.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import math
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("tools")
+
+# Frecency time constant: a use one day ago counts e^-1 of one now.
+FRECENCY_TAU = 86400.0
+
+
+class _Node:
+    __slots__ = ("edges", "top")
+
+    def __init__(self) -> None:
+        # first character of the edge label -> (label, child)
+        self.edges: Dict[str, Tuple[str, "_Node"]] = {}
+        self.top: List[str] = []
+
+
+class CommandHistory:
+    """Prefix/fuzzy index and chronological recall over ledger commands."""
+
+    def __init__(
+        self,
+        ledger_path: Path,
+        *,
+        tail_bytes: int = 4 << 20,
+        max_commands: int = 5000,
+        top_k: int = 8,
+    ) -> None:
+        self._ledger_path = ledger_path
+        self._tail_bytes = tail_bytes
+        self._max_commands = max_commands
+        self._top_k = top_k
+        self._lock = threading.Lock()
+        self._root = _Node()
+        self._scores: Dict[str, float] = {}
+        self._recent: Deque[str] = deque(maxlen=1000)
+        self._offset: Optional[int] = None  # ledger bytes indexed so far; None until loaded
+
+    # Queries ------------------------------------------------------------------
+
+    def suggest(self, prefix: str, limit: int = 5) -> List[str]:
+        """Best commands starting with ``prefix``, by frecency."""
+
+        with self._lock:
+            self._sync()
+            return [c for c in self._lookup(prefix) if c != prefix][:limit]
+
+    def fuzzy(self, query: str, limit: int = 5) -> List[str]:
+        """Prefix matches first, then commands containing ``query`` as a subsequence."""
+
+        with self._lock:
+            self._sync()
+            results = [c for c in self._lookup(query) if c != query][:limit]
+            if len(results) < limit and query:
+                found = set(results)
+                matches = [c for c in self._scores if c not in found and c != query and _is_subsequence(query, c)]
+                matches.sort(key=self._scores.__getitem__, reverse=True)
+                results.extend(matches[: limit - len(results)])
+            return results
+
+    def recent(self) -> List[str]:
+        """Commands oldest to newest, consecutive repeats collapsed."""
+
+        with self._lock:
+            self._sync()
+            return list(self._recent)
+
+    def add(self, command: str, when: Optional[float] = None) -> None:
+        """Index a command that is not recorded in the ledger."""
+
+        with self._lock:
+            self._sync()
+            self._insert(command, time.time() if when is None else when)
+
+    # Ledger following ---------------------------------------------------------
+
+    def _sync(self) -> None:
+        try:
+            size = self._ledger_path.stat().st_size
+        except OSError:
+            return
+        if self._offset is None:
+            start = max(0, size - self._tail_bytes)
+        elif size < self._offset:
+            start = 0  # ledger replaced; start over from its start
+        elif size == self._offset:
+            return
+        else:
+            start = self._offset
+        with self._ledger_path.open("rb") as f:
+            f.seek(start)
+            data = f.read(size - start)
+        if self._offset is None and start > 0:
+            data = data[data.find(b"\n") + 1 :]  # skip the partial first line
+        end = data.rfind(b"\n") + 1  # a line still being written is read next time
+        for line in data[:end].splitlines():
+            self._index_line(line)
+        self._offset = size - (len(data) - end)
+
+    def _index_line(self, line: bytes) -> None:
+        if b'"kind": "command"' not in line and b'"kind": "job"' not in line:
+            return  # cheap pre-filter before decoding
+        try:
+            event = json.loads(line)
+        except ValueError:
+            return
+        payload = event.get("payload", {})
+        if event.get("kind") == "job" and payload.get("action") != "start":
+            return
+        command = payload.get("command")
+        if not command:
+            return
+        try:
+            when = datetime.fromisoformat(event["timestamp"]).timestamp()
+        except (KeyError, TypeError, ValueError):
+            when = time.time()
+        self._insert(command, when)
+
+    # Trie ---------------------------------------------------------------------
+
+    def _insert(self, command: str, when: float) -> None:
+        command = command.strip()
+        if not command:
+            return
+        if not self._recent or self._recent[-1] != command:
+            self._recent.append(command)
+        weight = when / FRECENCY_TAU
+        old = self._scores.get(command)
+        # log(exp(old) + exp(weight)) without overflow
+        score = weight if old is None else max(old, weight) + math.log1p(math.exp(-abs(old - weight)))
+        self._scores[command] = score
+        for node in self._path(command):
+            self._promote(node, command)
+        if len(self._scores) > 2 * self._max_commands:
+            self._compact()
+
+    def _path(self, command: str) -> List[_Node]:
+        """Nodes from the root to ``command``'s node, creating and splitting edges."""
+
+        node = self._root
+        nodes = [node]
+        rest = command
+        while rest:
+            edge = node.edges.get(rest[0])
+            if edge is None:
+                child = _Node()
+                node.edges[rest[0]] = (rest, child)
+                nodes.append(child)
+                break
+            label, child = edge
+            common = _common_prefix(label, rest)
+            if common < len(label):
+                middle = _Node()
+                middle.top = list(child.top)
+                middle.edges[label[common]] = (label[common:], child)
+                node.edges[rest[0]] = (label[:common], middle)
+                child = middle
+            nodes.append(child)
+            node = child
+            rest = rest[common:]
+        return nodes
+
+    def _promote(self, node: _Node, command: str) -> None:
+        top = node.top
+        if command in top:
+            top.remove(command)
+        score = self._scores[command]
+        index = len(top)
+        while index > 0 and self._scores[top[index - 1]] < score:
+            index -= 1
+        if index < self._top_k:
+            top.insert(index, command)
+            del top[self._top_k :]
+
+    def _lookup(self, prefix: str) -> List[str]:
+        node = self._root
+        rest = prefix
+        while rest:
+            edge = node.edges.get(rest[0])
+            if edge is None:
+                return []
+            label, child = edge
+            if label.startswith(rest):
+                return child.top  # every command below this edge matches
+            if not rest.startswith(label):
+                return []
+            node = child
+            rest = rest[len(label) :]
+        return node.top
+
+    def _compact(self) -> None:
+        """Rebuild the trie with only the ``max_commands`` best commands."""
+
+        keep = sorted(self._scores, key=self._scores.__getitem__, reverse=True)[: self._max_commands]
+        scores = {command: self._scores[command] for command in keep}
+        self._root = _Node()
+        self._scores = scores
+        for command in keep:
+            for node in self._path(command):
+                self._promote(node, command)
+        logger.debug("Command history compacted to %d commands", len(keep))
+
+
+def _common_prefix(a: str, b: str) -> int:
+    limit = min(len(a), len(b))
+    index = 0
+    while index < limit and a[index] == b[index]:
+        index += 1
+    return index
+
+
+def _is_subsequence(query: str, text: str) -> bool:
+    remaining = iter(text)
+    return all(ch in remaining for ch in query)
+
+
+class HistoryRecall:
+    """Up/down navigation over ``CommandHistory.recent()`` for one input line."""
+
+    def __init__(self, history: CommandHistory) -> None:
+        self._history = history
+        self._entries: List[str] = []
+        self._index = 0
+        self._draft = ""
+
+    def up(self, current: str) -> str:
+        if not self._entries or self._index == len(self._entries):
+            if not self._entries:
+                self._entries = self._history.recent()
+                self._index = len(self._entries)
+            self._draft = current
+        if self._index > 0:
+            self._index -= 1
+        return self._entries[self._index] if self._entries else current
+
+    def down(self) -> str:
+        if self._index < len(self._entries):
+            self._index += 1
+        return self._entries[self._index] if self._index < len(self._entries) else self._draft
+
+    def reset(self) -> None:
+        self._entries = []
+        self._index = 0
+        self._draft = ""
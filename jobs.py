@@ -0,0 +1,293 @@
+"""Jobs module: background job control for long-running shell commands.
+
+Shell commands normally run synchronously inside the dashboard loop, so
+a long build blocks all further input. A JobTable runs commands as
+background jobs instead:
+
+- Commands are verified by ``DeterministicAgent.verify_command`` before
+  they are queued, exactly like foreground commands.
+- At most ``max_running`` jobs run at once; further jobs wait in a queue.
+- Output (stdout and stderr merged) is streamed into a bounded per-job
+  buffer while the job runs.
+- Jobs can be listed, waited on (foregrounded) and killed.
+
+Every job that starts records a ``job`` ledger event with
+``action="start"`` and another with ``action="finish"`` when it ends.
+If the agent has a blob store, the job's complete output is streamed
+into it and the finish event carries its ``output_hash``.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import signal
+import subprocess
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, List, Optional
+
+from deterministic_agent import DeterministicAgent
+from entropy_shield import EntropyShield
+from kernel import CancelToken
+from resource_limits import wait_with_usage
+
+logger = logging.getLogger("agent")
+
+
+class JobError(RuntimeError):
+    """Raised for an unknown or malformed job number."""
+
+
+@dataclass
+class JobTableConfig:
+    max_running: int = 2
+    # Lines of output kept per job; older lines are dropped.
+    output_lines: int = 2000
+    # Seconds between SIGTERM and SIGKILL when a job is killed.
+    kill_grace: float = 3.0
+
+
+@dataclass
+class Job:
+    id: int
+    command: str
+    cwd: Path
+    state: str = "queued"  # queued, running, done, failed, killed
+    exit_code: Optional[int] = None
+    pid: Optional[int] = None
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    output: Deque[str] = field(default_factory=deque)
+    kill_requested: bool = False
+    process: Optional["subprocess.Popen[str]"] = field(default=None, repr=False)
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    @property
+    def active(self) -> bool:
+        return self.state in ("queued", "running")
+
+    def text(self) -> str:
+        return "".join(self.output)
+
+    def describe(self) -> str:
+        if self.state == "running" and self.started is not None:
+            status = f"running {time.monotonic() - self.started:.0f}s"
+        elif self.exit_code is not None:
+            status = f"{self.state} exit={self.exit_code}"
+        else:
+            status = self.state
+        return f"[{self.id}] {status:<18} {self.command}"
+
+
+class JobTable:
+    """Background shell jobs with bounded parallelism."""
+
+    def __init__(
+        self, agent: DeterministicAgent, shield: EntropyShield, config: Optional[JobTableConfig] = None
+    ) -> None:
+        self._agent = agent
+        self._shield = shield
+        self.config = config or JobTableConfig()
+        self._lock = threading.Lock()
+        self._jobs: Dict[int, Job] = {}
+        self._queue: Deque[Job] = deque()
+        self._running = 0
+        self._next_id = 1
+        self._unreported: List[Job] = []
+        governor = agent.governor
+        self._profile = governor.profile.name if governor is not None else None
+
+    def start(self, command: str, cwd: Path) -> Job:
+        """Verify ``command`` and queue it; raises if verification fails."""
+
+        self._agent.verify_command(command)
+        with self._lock:
+            job = Job(id=self._next_id, command=command, cwd=cwd, output=deque(maxlen=self.config.output_lines))
+            self._next_id += 1
+            self._jobs[job.id] = job
+            self._queue.append(job)
+        self._launch_queued()
+        return job
+
+    def get(self, job_id: int) -> Job:
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is None:
+            raise JobError(f"No job [{job_id}]")
+        return job
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def describe(self) -> str:
+        jobs = self.list()
+        return "\n".join(job.describe() for job in jobs) if jobs else "No background jobs."
+
+    def wait(self, job_id: int, cancel: Optional[CancelToken] = None) -> Job:
+        """Block until the job ends or ``cancel`` fires (the job keeps running)."""
+
+        job = self.get(job_id)
+        while not job.done.wait(0.1):
+            if cancel is not None and cancel.cancelled:
+                break
+        return job
+
+    def kill(self, job_id: int) -> Job:
+        job = self.get(job_id)
+        with self._lock:
+            if not job.active:
+                return job
+            job.kill_requested = True
+            if job.state == "queued":
+                self._queue.remove(job)
+                job.state = "killed"
+                job.finished = time.monotonic()
+                self._unreported.append(job)
+                job.done.set()
+                return job
+            process = job.process
+        if process is not None:
+            self._signal(process, signal.SIGTERM)
+            timer = threading.Timer(self.config.kill_grace, self._force_kill, args=(process,))
+            timer.daemon = True
+            timer.start()
+        return job
+
+    def finished_since_last_call(self) -> List[Job]:
+        """Jobs that ended since the previous call, for dashboard notices."""
+
+        with self._lock:
+            jobs, self._unreported = self._unreported, []
+        return jobs
+
+    def close(self) -> None:
+        """Kill every job still queued or running (the session is ending)."""
+
+        for job in self.list():
+            if job.active:
+                self.kill(job.id)
+
+    # Internals ----------------------------------------------------------------
+
+    def _launch_queued(self) -> None:
+        while True:
+            with self._lock:
+                if not self._queue or self._running >= self.config.max_running:
+                    return
+                job = self._queue.popleft()
+                self._running += 1
+                job.state = "running"
+                job.started = time.monotonic()
+            try:
+                job.process = self._agent.spawn_command(job.command, job.cwd)
+            except Exception as exc:
+                job.output.append(f"{exc}\n")
+                self._finish(job, state="failed", exit_code=None)
+                continue
+            job.pid = job.process.pid
+            self._shield.record_job(
+                action="start",
+                job_id=job.id,
+                command=job.command,
+                cwd=str(job.cwd),
+                pid=job.pid,
+                profile=self._profile,
+            )
+            logger.info("Job [%d] started (pid %d): %s", job.id, job.pid, job.command)
+            if job.kill_requested:  # killed between leaving the queue and spawning
+                self._signal(job.process, signal.SIGTERM)
+            threading.Thread(target=self._pump, args=(job,), name=f"job-{job.id}", daemon=True).start()
+
+    def _pump(self, job: Job) -> None:
+        process = job.process
+        assert process is not None and process.stdout is not None
+        blobs = self._agent.blobs
+        writer = blobs.writer() if blobs is not None else None
+        try:
+            for line in process.stdout:
+                job.output.append(line)
+                if writer is not None:
+                    writer.write(line.encode("utf-8", errors="replace"))
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        process.stdout.close()
+        exit_code, usage = wait_with_usage(process)
+        output_hash = writer.close() if writer is not None and writer.size else None
+        if writer is not None and output_hash is None:
+            writer.abort()
+        if job.kill_requested:
+            state = "killed"
+        else:
+            state = "done" if exit_code == 0 else "failed"
+        self._shield.record_job(
+            action="finish",
+            job_id=job.id,
+            command=job.command,
+            cwd=str(job.cwd),
+            pid=job.pid,
+            exit_code=exit_code,
+            state=state,
+            output_hash=output_hash,
+            duration_ms=round((time.monotonic() - job.started) * 1000.0, 1) if job.started is not None else None,
+            usage=usage,
+            profile=self._profile,
+        )
+        self._finish(job, state=state, exit_code=exit_code)
+        self._launch_queued()
+
+    def _finish(self, job: Job, *, state: str, exit_code: Optional[int]) -> None:
+        with self._lock:
+            job.state = state
+            job.exit_code = exit_code
+            job.finished = time.monotonic()
+            self._running -= 1
+            self._unreported.append(job)
+        job.done.set()
+        logger.info("Job [%d] %s (exit %s): %s", job.id, state, exit_code, job.command)
+
+    @staticmethod
+    def _signal(process: "subprocess.Popen[str]", sig: int) -> None:
+        if process.poll() is not None:
+            return
+        try:
+            if os.name == "posix":
+                os.killpg(process.pid, sig)  # the job leads its own session
+            elif sig == signal.SIGTERM:
+                process.terminate()
+            else:
+                process.kill()
+        except ProcessLookupError:
+            pass
+
+    @classmethod
+    def _force_kill(cls, process: "subprocess.Popen[str]") -> None:
+        cls._signal(process, getattr(signal, "SIGKILL", signal.SIGTERM))
+
+
+def parse_job_id(argument: str) -> int:
+    """Parse ``N`` or ``%N`` as used by ``!fg`` and ``!kill``."""
+
+    try:
+        return int(argument.strip().lstrip("%"))
+    except ValueError:
+        raise JobError(f"Expected a job number, got '{argument.strip()}'") from None
+
+
+def background_command(command: str) -> Optional[str]:
+    """Return the command to run in the background, or None for a foreground one.
+
+    ``!bg <command>`` and a trailing ``&`` (``make all &``) both start a job.
+    """
+
+    if command.startswith("!bg "):
+        return command[4:].strip() or None
+    if command.endswith("&") and not command.endswith("&&"):
+        return command[:-1].strip() or None
+    return None
@@ -7,8 +7,11 @@ Ollama is running on the same machine.
 
 from __future__ import annotations
 
+import json
+import threading
+import time
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional
 
 import httpx
 import logging
@@ -29,6 +32,101 @@ class KernelConfig:
     request_timeout: float = 120.0
 
 
+class GenerationCancelled(RuntimeError):
+    """Raised when a generation is cancelled or overruns its deadline."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(f"generation {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    """Cancellation handle for one generation, with an optional deadline.
+
+    ``cancel()`` may be called from any thread. Registered callbacks run
+    immediately; the Kernel registers one that closes the HTTP response,
+    which drops the connection so Ollama stops generating. If a deadline
+    is given, the token cancels itself with reason ``"deadline"``.
+    """
+
+    def __init__(self, deadline: Optional[float] = None) -> None:
+        self.reason: Optional[str] = None
+        self.expires_at = time.monotonic() + deadline if deadline else None
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self._timer: Optional[threading.Timer] = None
+        if deadline:
+            self._timer = threading.Timer(deadline, self.cancel, args=("deadline",))
+            self._timer.daemon = True
+            self._timer.start()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.reason is not None
+
+    def remaining(self) -> Optional[float]:
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def cancel(self, reason: str = "cancelled") -> None:
+        with self._lock:
+            if self.reason is not None:
+                return
+            self.reason = reason
+            callbacks, self._callbacks = self._callbacks, []
+        self.finish()
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as exc:  # a failing close must not mask the cancel
+                logger.debug("Cancel callback failed: %s", exc)
+
+    def on_cancel(self, callback: Callable[[], None]) -> Callable[[], None]:
+        """Register ``callback``; returns a function that unregisters it."""
+
+        with self._lock:
+            if self.reason is None:
+                self._callbacks.append(callback)
+                return lambda: self._discard(callback)
+        callback()
+        return lambda: None
+
+    def follow(self, parent: "CancelToken") -> Callable[[], None]:
+        """Cancel with ``parent`` and share its deadline; returns a function that unlinks."""
+
+        self.expires_at = parent.expires_at
+        return parent.on_cancel(lambda: self.cancel(parent.reason or "cancelled"))
+
+    def _discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+    def raise_if_cancelled(self) -> None:
+        if self.reason is not None:
+            raise GenerationCancelled(self.reason)
+
+    def finish(self) -> None:
+        """Stop the deadline timer once the generation is over."""
+
+        if self._timer is not None:
+            self._timer.cancel()
+
+
+def _is_complete_json_object(text: str) -> bool:
+    """True once ``text`` holds one whole JSON object (trailing output ignored)."""
+
+    stripped = text.lstrip()
+    if not stripped.startswith("{"):
+        return False
+    try:
+        value, _ = json.JSONDecoder().raw_decode(stripped)
+    except ValueError:
+        return False
+    return isinstance(value, dict)
+
+
 class Kernel:
     """Deterministic interface over the Ollama HTTP API.
 
@@ -53,6 +151,9 @@ class Kernel:
         messages: List[Dict[str, str]],
         temperature: float = 0.0,
         max_tokens: Optional[int] = None,
+        cancel: Optional[CancelToken] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, Any]] = None,
     ) -> str:
         """Call the local model deterministically.
 
@@ -61,6 +162,18 @@ class Kernel:
             messages: Conversation messages (role + content).
             temperature: Kept at or near zero to enforce stability.
             max_tokens: Optional upper bound on generated tokens.
+            cancel: Optional CancelToken. The response is then streamed
+                so that cancelling closes the connection mid-generation;
+                GenerationCancelled is raised.
+            response_schema: Optional JSON schema the reply must follow
+                (structured output). The response is streamed and the
+                connection closed as soon as one complete JSON object
+                has arrived, so the model cannot keep generating past it.
+            usage: Optional dict filled in with the serving ``model`` and
+                the ``prompt_tokens``/``completion_tokens`` Ollama reports.
+                A stream stopped early gets no report; its completion
+                tokens are then counted from the chunks received and
+                ``estimated`` is set.
         """
 
         payload: Dict[str, Any] = {
@@ -76,9 +189,20 @@ class Kernel:
 
         if max_tokens is not None:
             payload["options"]["num_predict"] = max_tokens
+            # The OpenAI-compatible endpoint maps this one to num_predict.
+            payload["max_tokens"] = max_tokens
+
+        if response_schema is not None:
+            payload["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": "response", "schema": response_schema},
+            }
 
         logger.debug("Kernel.generate payload=%s", payload)
 
+        if cancel is not None or response_schema is not None:
+            return self._generate_streamed(payload, cancel, stop_at_json=response_schema is not None, usage=usage)
+
         response = self._client.post("/v1/chat/completions", json=payload)
         response.raise_for_status()
 
@@ -92,4 +216,77 @@ class Kernel:
             logger.error("Unexpected kernel response structure: %s", data)
             raise RuntimeError("Kernel response shape mismatch") from exc
 
+        if usage is not None:
+            _fill_usage(usage, data.get("model") or self.config.model, data.get("usage"))
         return content
+
+    def _generate_streamed(
+        self,
+        payload: Dict[str, Any],
+        cancel: Optional[CancelToken],
+        *,
+        stop_at_json: bool = False,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        cancel = cancel or CancelToken()
+        cancel.raise_if_cancelled()
+        parts: List[str] = []
+        model: Optional[str] = None
+        reported: Optional[Dict[str, Any]] = None
+        streamed = {**payload, "stream": True}
+        if usage is not None:
+            # The usage report arrives in a final chunk with no choices.
+            streamed["stream_options"] = {"include_usage": True}
+        try:
+            # Leaving the block closes the response; stopping early therefore
+            # also stops Ollama generating.
+            with self._client.stream("POST", "/v1/chat/completions", json=streamed) as response:
+                unregister = cancel.on_cancel(response.close)
+                try:
+                    response.raise_for_status()
+                    for line in response.iter_lines():
+                        if cancel.cancelled:
+                            break
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                            model = chunk.get("model") or model
+                            reported = chunk.get("usage") or reported
+                            if not chunk["choices"] and reported is not None:
+                                continue
+                            delta = chunk["choices"][0].get("delta", {})
+                        except (ValueError, KeyError, IndexError, TypeError, AttributeError) as exc:
+                            logger.error("Unexpected kernel stream chunk: %s", data)
+                            raise RuntimeError("Kernel response shape mismatch") from exc
+                        content = delta.get("content") or ""
+                        parts.append(content)
+                        if stop_at_json and "}" in content and _is_complete_json_object("".join(parts)):
+                            logger.debug("Kernel: structured reply complete; closing the stream early")
+                            break
+                finally:
+                    unregister()
+        except (httpx.HTTPError, httpx.StreamError, OSError):
+            if cancel.cancelled:
+                raise GenerationCancelled(cancel.reason) from None
+            raise
+        cancel.raise_if_cancelled()
+        if usage is not None:
+            # Ollama streams roughly one token per chunk.
+            _fill_usage(usage, model or self.config.model, reported, sum(1 for part in parts if part))
+        return "".join(parts)
+
+
+def _fill_usage(
+    usage: Dict[str, Any], model: str, reported: Optional[Dict[str, Any]], chunks: Optional[int] = None
+) -> None:
+    usage["model"] = model
+    if reported:
+        usage["prompt_tokens"] = reported.get("prompt_tokens")
+        usage["completion_tokens"] = reported.get("completion_tokens")
+    elif chunks is not None:
+        usage["completion_tokens"] = chunks
+        usage["estimated"] = True
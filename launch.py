@@ -27,23 +27,50 @@ def main() -> None:
         sys.exit(1)
 
     # Import core modules for TUI
-    from main import parse_args, configure_logging
-    from kernel import Kernel, KernelConfig
-    from entropy_shield import EntropyShield, EntropyShieldConfig
-    from deterministic_agent import DeterministicAgent
+    from main import (
+        parse_args,
+        configure_logging,
+        build_memory,
+        build_substrate,
+        deadlines_from_args,
+        run_worker,
+        serve,
+        token_budgets_from_args,
+    )
     from textual_dashboard import run_tui
 
     args = parse_args()
     log_dir = Path(args.log_dir)
     configure_logging(run_id="axiom", log_dir=log_dir)
 
-    shield = EntropyShield(EntropyShieldConfig(root_dir=log_dir))
-    kernel = Kernel(KernelConfig(base_url=args.ollama_url, model=args.model))
-    agent = DeterministicAgent(entropy_shield=shield)
+    if args.serve:
+        serve(args)
+        return
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    shield, kernel, agent = build_substrate(args)
+    memory = build_memory(args)
 
     try:
-        run_tui(shield, kernel, agent)
+        run_tui(
+            shield,
+            kernel,
+            agent,
+            memory=memory,
+            reuse_threshold=args.reuse_threshold,
+            deadlines=deadlines_from_args(args),
+            prefetch=args.prefetch,
+            token_budgets=token_budgets_from_args(args),
+            resume=args.resume,
+        )
     finally:
+        if memory is not None:
+            memory.close()
+        if agent.workers is not None:
+            agent.workers.close()
         kernel.close()
 
 
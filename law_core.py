@@ -8,19 +8,92 @@ Protocol envelope) and records kernel calls in the Entropy Shield.
 from __future__ import annotations
 
 import hashlib
-from typing import Dict, List
+import json
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from entropy_shield import EntropyShield
 from foundations import build_omega_system_prompt, build_alexis_protocol_envelope
-from kernel import Kernel
+from kernel import CancelToken, GenerationCancelled, Kernel
+
+if TYPE_CHECKING:  # NumPy is only needed when semantic memory is enabled.
+    from deterministic_agent import DeterministicAgent
+    from semantic_index import SemanticMemory
+
+
+# Per-request deadlines in seconds, keyed by request type. Callers
+# create a CancelToken with the matching deadline for each request.
+DEFAULT_DEADLINES: Dict[str, float] = {"ai": 120.0, "explain": 45.0, "fix": 60.0}
+
+# Per-request generation budgets (Ollama ``num_predict``), keyed the same way.
+DEFAULT_TOKEN_BUDGETS: Dict[str, int] = {"ai": 1024, "explain": 384, "fix": 256}
+
+# Structured output for !fix: a single command the agent can verify as-is.
+FIX_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "command": {"type": "string"},
+        "explanation": {"type": "string"},
+    },
+    "required": ["command", "explanation"],
+}
+
+RESPONSE_SCHEMAS: Dict[str, Dict[str, Any]] = {"fix": FIX_SCHEMA}
 
 
 def _hash_text(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
 
+def _elapsed_ms(start: float) -> float:
+    return round((time.perf_counter() - start) * 1000.0, 1)
+
+
+def parse_structured(text: str, schema: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """Return the reply's required string fields, or None if it does not match ``schema``."""
+
+    try:
+        value, _ = json.JSONDecoder().raw_decode(text.strip())
+    except ValueError:
+        return None
+    if not isinstance(value, dict):
+        return None
+    fields = {key: value.get(key) for key in schema.get("required", [])}
+    if not all(isinstance(field, str) for field in fields.values()):
+        return None
+    return fields
+
+
+def describe_fix(payload: Dict[str, Any], agent: "DeterministicAgent") -> str:
+    """Render a !fix envelope payload, checking its command with ``verify_command``.
+
+    Payloads without a structured ``command`` (older recalled fixes, or a
+    model that ignored the schema) are shown as plain text.
+    """
+
+    command = payload.get("command")
+    if not command:
+        return str(payload.get("text", "<no text>"))
+    try:
+        agent.verify_command(command)
+        verdict = "passes verify_command"
+    except Exception as exc:
+        verdict = f"rejected: {exc}"
+    return f"$ {command}\n[{verdict}]\n{payload.get('explanation', '')}"
+
+
 def law_guarded_completion(
-    *, kernel: Kernel, shield: EntropyShield, user_content: str
+    *,
+    kernel: Kernel,
+    shield: EntropyShield,
+    user_content: str,
+    memory: Optional[SemanticMemory] = None,
+    memory_kind: str = "ai",
+    reuse_threshold: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+    max_tokens: Optional[int] = None,
+    response_schema: Optional[Dict[str, Any]] = None,
+    speculative: bool = False,
 ) -> Dict:
     """Run a single-turn completion under the Alexis Protocol.
 
@@ -29,17 +102,94 @@ def law_guarded_completion(
     - Call the local kernel deterministically.
     - Wrap the raw text in an Alexis Protocol envelope.
     - Record prompt/response hashes in the Zero Entropy Ledger.
+
+    With an opt-in ``memory``, the prompt and response are also stored
+    for semantic search under ``memory_kind``. If ``reuse_threshold`` is
+    set and a past entry of the same kind is at least that similar, its
+    response is returned instead of generating; the envelope payload and
+    the ``kernel_call`` event then carry ``recalled_from`` and
+    ``similarity`` so the reuse is visible and auditable.
+
+    With a ``cancel`` token the call can be aborted or time out; a
+    ``kernel_call`` event with the cancel reason as ``status`` is then
+    recorded and GenerationCancelled re-raised.
+
+    ``max_tokens`` caps the generation. With a ``response_schema`` the
+    model is asked for structured output; when the reply matches, its
+    fields are added to the envelope payload next to ``text``.
+
+    The ``kernel_call`` event carries the call's duration, the model and
+    the token counts the kernel reports. ``speculative`` marks it as a
+    prefetch nobody has asked for yet (see prefetch.py).
     """
 
     system_prompt = build_omega_system_prompt()
-    messages: List[Dict[str, str]] = [{"role": "user", "content": user_content}]
+    prompt_hash = _hash_text(system_prompt + "\n" + user_content)
+
+    if memory is not None and reuse_threshold is not None:
+        start = time.perf_counter()
+        hit = memory.best_match(user_content, kind=memory_kind)
+        if hit is not None and hit.score >= reuse_threshold:
+            similarity = round(hit.score, 4)
+            shield.record_kernel_call(
+                prompt_hash=prompt_hash,
+                response_hash=_hash_text(hit.record.response),
+                duration_ms=_elapsed_ms(start),
+                recalled_from=hit.record.id,
+                similarity=similarity,
+                speculative=speculative,
+            )
+            structured = parse_structured(hit.record.response, response_schema) if response_schema else None
+            return build_alexis_protocol_envelope(
+                payload={
+                    "text": hit.record.response,
+                    **(structured or {}),
+                    "recalled_from": hit.record.id,
+                    "similarity": similarity,
+                }
+            )
 
-    raw_text = kernel.generate(system_prompt=system_prompt, messages=messages)
+    messages: List[Dict[str, str]] = [{"role": "user", "content": user_content}]
+    usage: Dict[str, Any] = {}
+    start = time.perf_counter()
+    try:
+        raw_text = kernel.generate(
+            system_prompt=system_prompt,
+            messages=messages,
+            max_tokens=max_tokens,
+            cancel=cancel,
+            response_schema=response_schema,
+            usage=usage,
+        )
+    except GenerationCancelled as exc:
+        shield.record_kernel_call(
+            prompt_hash=prompt_hash,
+            response_hash=None,
+            status=exc.reason,
+            duration_ms=_elapsed_ms(start),
+            model=getattr(getattr(kernel, "config", None), "model", None),
+            speculative=speculative,
+        )
+        raise
+    duration_ms = _elapsed_ms(start)
 
-    envelope = build_alexis_protocol_envelope(payload={"text": raw_text})
+    structured = parse_structured(raw_text, response_schema) if response_schema else None
+    envelope = build_alexis_protocol_envelope(payload={"text": raw_text, **(structured or {})})
 
-    prompt_hash = _hash_text(system_prompt + "\n" + user_content)
     response_hash = _hash_text(raw_text)
-    shield.record_kernel_call(prompt_hash=prompt_hash, response_hash=response_hash)
+    shield.record_kernel_call(
+        prompt_hash=prompt_hash,
+        response_hash=response_hash,
+        duration_ms=duration_ms,
+        model=usage.get("model"),
+        prompt_tokens=usage.get("prompt_tokens"),
+        completion_tokens=usage.get("completion_tokens"),
+        tokens_estimated=bool(usage.get("estimated")),
+        cached=bool(usage.get("cached")),
+        speculative=speculative,
+    )
+
+    if memory is not None:
+        memory.remember_completion(kind=memory_kind, prompt=user_content, response=raw_text)
 
     return envelope
@@ -1,45 +1,387 @@
 """Entry point wiring Kernel, DeterministicAgent, EntropyShield, and Axiom_UI.
 
-This file is intentionally small. It establishes the deterministic
-substrate and then hands control to the UI loop.
+Besides the Rich dashboard's entry point, this module holds the shared
+command line and the ``build_*`` helpers that turn flags into the
+substrate: the kernel stack (router, replicas, resilience, priority
+scheduler), the shield and agent with their optional collaborators
+(file watcher, blob store, resource governor, executor workers) and
+semantic memory. launch.py reuses them for the Textual dashboard. The
+other modes, ``--serve``, ``--worker`` and ``--analytics``, start here
+too.
 """
 
 from __future__ import annotations
 
 import argparse
 from pathlib import Path
+from typing import Callable, Dict, List, TypeVar
 
 from kernel import Kernel, KernelConfig
 from entropy_shield import EntropyShield, EntropyShieldConfig
 from deterministic_agent import DeterministicAgent
+from scheduler import PriorityScheduler, ScheduledKernel, SchedulerConfig
 from axiom_ui import run_dashboard
 from logging_config import configure_logging
+from session_resume import DEFAULT_RESUME_EVENTS
+
+T = TypeVar("T")
 
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="AxiomUIXV Deterministic Terminal Substrate")
     parser.add_argument("--model", default="llama3", help="Local model name exposed by Ollama")
-    parser.add_argument("--ollama-url", default="http://localhost:11434", help="Base URL for local Ollama API")
+    parser.add_argument(
+        "--ollama-url",
+        default="http://localhost:11434",
+        help="Base URL for local Ollama API; comma-separate several replicas of --model to load balance across them",
+    )
     parser.add_argument("--log-dir", default=".axiom_logs", help="Directory for structured logs and ledger")
+    parser.add_argument(
+        "--serve",
+        action="store_true",
+        help="Run the shared-state daemon instead of a dashboard (one kernel, cache and ledger writer)",
+    )
+    parser.add_argument(
+        "--connect",
+        action="store_true",
+        help="Attach this dashboard to a running daemon instead of opening a private kernel and ledger",
+    )
+    parser.add_argument(
+        "--routing",
+        default=None,
+        help="YAML file with models/routes (e.g. agents.yaml) to route !ai/!explain/!fix and agents to different models",
+    )
+    parser.add_argument(
+        "--semantic-memory",
+        action="store_true",
+        help="Opt in to storing prompts, responses and command outputs for local semantic search",
+    )
+    parser.add_argument("--embed-model", default="nomic-embed-text", help="Ollama embedding model for --semantic-memory")
+    parser.add_argument(
+        "--reuse-threshold",
+        type=float,
+        default=None,
+        help="With --semantic-memory, answer !fix from a past fix at least this similar (0..1) without generating",
+    )
+    parser.add_argument(
+        "--resilient",
+        action="store_true",
+        help="Retry transient Ollama failures, hedge slow calls and fail fast while Ollama is down (all ledgered)",
+    )
+    parser.add_argument("--retries", type=int, default=2, help="With --resilient, retries per model call")
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=95.0,
+        help="With --resilient, send one duplicate request once a call outlasts this latency percentile (0 disables)",
+    )
+    parser.add_argument(
+        "--deadline",
+        action="append",
+        default=[],
+        metavar="ROUTE=SECONDS",
+        help="Per-request deadline for ai, explain or fix (repeatable), e.g. --deadline fix=30",
+    )
+    parser.add_argument(
+        "--max-tokens",
+        action="append",
+        default=[],
+        metavar="ROUTE=TOKENS",
+        help="Generation budget (num_predict) for ai, explain or fix (repeatable), e.g. --max-tokens ai=2048",
+    )
+    parser.add_argument(
+        "--prefetch",
+        action="store_true",
+        help="While idle after a shell command, speculatively generate !fix/!explain so they answer instantly",
+    )
+    parser.add_argument(
+        "--max-concurrent-calls",
+        type=int,
+        default=None,
+        help="Concurrent model calls in the priority scheduler (default: 1, or the model limits' sum with --routing)",
+    )
+    parser.add_argument(
+        "--watch-files",
+        action="store_true",
+        help="Record files changed by shell commands as file_change events (inotify on Linux, polling elsewhere)",
+    )
+    parser.add_argument(
+        "--store-outputs",
+        action="store_true",
+        help="Keep shell command and job outputs in a compressed blob store referenced from the ledger",
+    )
+    parser.add_argument(
+        "--resources",
+        default=None,
+        metavar="AGENT",
+        help="Run shell commands under AGENT's resource profile (nice, ionice, rlimits, cgroup) from --agents-file",
+    )
+    parser.add_argument(
+        "--agents-file", default="agents.yaml", help="Agent definitions for --resources (default: agents.yaml)"
+    )
+    parser.add_argument(
+        "--resume",
+        type=int,
+        default=DEFAULT_RESUME_EVENTS,
+        metavar="N",
+        help=f"Restore the Thought Stream and last command from the ledger's last N events "
+        f"(default: {DEFAULT_RESUME_EVENTS}; 0 starts empty)",
+    )
+    parser.add_argument(
+        "--analytics",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="DAYS",
+        help="Print the ledger analytics report (latency, throughput, failures), optionally for the last DAYS, and exit",
+    )
+    parser.add_argument(
+        "--workers-listen",
+        default=None,
+        metavar="ADDRESS",
+        help="Accept executor workers on HOST:PORT or a Unix socket path; shell commands run on them when they have "
+        "free slots",
+    )
+    parser.add_argument(
+        "--worker",
+        default=None,
+        metavar="ADDRESS",
+        help="Run as an executor worker for the dashboard listening on ADDRESS instead of a dashboard",
+    )
+    parser.add_argument(
+        "--worker-key",
+        default=None,
+        help="Shared key file for --workers-listen/--worker (default: <log-dir>/workers.key, created by the dashboard)",
+    )
+    parser.add_argument(
+        "--worker-capacity", type=int, default=None, help="With --worker, concurrent commands (default: CPU count)"
+    )
+    parser.add_argument(
+        "--worker-root", default=None, help="With --worker, run every command in this directory (for remote hosts)"
+    )
+    parser.add_argument("--socket", default=None, help="Daemon Unix socket path (default: <log-dir>/axiomd.sock)")
     return parser.parse_args()
 
 
+def _per_route(items: List[str], flag: str, unit: str, convert: Callable[[str], T]) -> Dict[str, T]:
+    values: Dict[str, T] = {}
+    for item in items:
+        route, _, value = item.partition("=")
+        try:
+            values[route.strip()] = convert(value)
+        except ValueError:
+            raise SystemExit(f"Invalid {flag} {item!r}; expected ROUTE={unit}") from None
+    return values
+
+
+def deadlines_from_args(args: argparse.Namespace) -> Dict[str, float]:
+    """Parse ``--deadline ROUTE=SECONDS`` values; unset routes keep their defaults."""
+
+    return _per_route(args.deadline, "--deadline", "SECONDS", float)
+
+
+def token_budgets_from_args(args: argparse.Namespace) -> Dict[str, int]:
+    """Parse ``--max-tokens ROUTE=TOKENS`` values; unset routes keep their defaults."""
+
+    return _per_route(args.max_tokens, "--max-tokens", "TOKENS", int)
+
+
+def socket_path_from_args(args: argparse.Namespace) -> Path:
+    return Path(args.socket) if args.socket else Path(args.log_dir) / "axiomd.sock"
+
+
+def worker_key_path_from_args(args: argparse.Namespace) -> Path:
+    return Path(args.worker_key) if args.worker_key else Path(args.log_dir) / "workers.key"
+
+
+def build_governor(args: argparse.Namespace):
+    """Return a ResourceGovernor for ``--resources AGENT``, else None."""
+
+    if not args.resources:
+        return None
+    from resource_limits import ResourceGovernor, ResourceProfile, ResourceProfileError
+
+    try:
+        return ResourceGovernor(ResourceProfile.from_yaml(Path(args.agents_file), args.resources))
+    except (OSError, ResourceProfileError) as exc:
+        raise SystemExit(f"--resources: {exc}") from None
+
+
+def ollama_urls_from_args(args: argparse.Namespace) -> List[str]:
+    return [url.strip() for url in args.ollama_url.split(",") if url.strip()]
+
+
+def build_kernel(args: argparse.Namespace, shield: EntropyShield):
+    """Return a single Kernel, or a ModelRouter when ``--routing`` is given.
+
+    Several ``--ollama-url`` replicas give a ReplicatedKernel instead of
+    a Kernel, with one concurrent call per replica by default.
+
+    With ``--resilient`` either is wrapped in a ResilientKernel that
+    records its retries and hedges on ``shield``. The result always sits
+    behind a PriorityScheduler so background calls yield to interactive ones.
+    """
+
+    if args.routing:
+        from router import ModelRouter
+
+        kernel = ModelRouter.from_yaml(Path(args.routing))
+    else:
+        urls = ollama_urls_from_args(args)
+        config = KernelConfig(base_url=urls[0], model=args.model)
+        if len(urls) > 1:
+            from replicas import ReplicatedKernel
+
+            kernel = ReplicatedKernel(config, urls)
+        else:
+            kernel = Kernel(config)
+    max_concurrent = args.max_concurrent_calls or getattr(kernel, "capacity", 1)
+    if args.resilient:
+        from resilience import ResilientKernel, ResiliencePolicy
+
+        policy = ResiliencePolicy(
+            max_retries=args.retries,
+            hedge_percentile=args.hedge_percentile or None,
+        )
+        kernel = ResilientKernel(kernel, policy=policy, shield=shield)
+    return ScheduledKernel(kernel, PriorityScheduler(SchedulerConfig(max_concurrent=max_concurrent)))
+
+
+def build_substrate(args: argparse.Namespace):
+    """Return ``(shield, kernel, agent)`` for a dashboard session.
+
+    With ``--connect`` the shield and kernel are thin proxies to the
+    daemon, so appends and model calls are shared with other terminals.
+    Commands still run locally in this terminal's working directory.
+    """
+
+    log_dir = Path(args.log_dir)
+    if args.connect:
+        from daemon import connect
+
+        shield, kernel = connect(socket_path_from_args(args))
+    else:
+        shield = EntropyShield(EntropyShieldConfig(root_dir=log_dir))
+        kernel = build_kernel(args, shield)
+    watcher = None
+    if args.watch_files:
+        from file_watch import FileWatcher
+
+        watcher = FileWatcher(log_dir=shield.ledger_path.parent)
+    blobs = None
+    if args.store_outputs:
+        from blob_store import BlobStore
+
+        blobs = BlobStore(shield.ledger_path.parent / "blobs")
+    workers = None
+    if args.workers_listen:
+        from workers import WorkerError, WorkerPool, load_key
+
+        try:
+            key = load_key(worker_key_path_from_args(args), create=True)
+            workers = WorkerPool(args.workers_listen, shield=shield, key=key, blobs=blobs)
+            workers.start()
+        except (OSError, WorkerError) as exc:
+            raise SystemExit(f"--workers-listen: {exc}") from None
+    agent = DeterministicAgent(
+        entropy_shield=shield, watcher=watcher, blobs=blobs, governor=build_governor(args), workers=workers
+    )
+    return shield, kernel, agent
+
+
+def build_memory(args: argparse.Namespace):
+    """Return a SemanticMemory when ``--semantic-memory`` is given, else None."""
+
+    if not args.semantic_memory:
+        return None
+    from semantic_index import OllamaEmbedder, SemanticMemory
+
+    return SemanticMemory(
+        Path(args.log_dir), embedder=OllamaEmbedder(base_url=ollama_urls_from_args(args)[0], model=args.embed_model)
+    )
+
+
+def serve(args: argparse.Namespace) -> None:
+    from daemon import AxiomDaemon, DaemonConfig
+
+    shield = EntropyShield(EntropyShieldConfig(root_dir=Path(args.log_dir)))
+    kernel = build_kernel(args, shield)
+    daemon = AxiomDaemon(config=DaemonConfig(socket_path=socket_path_from_args(args)), kernel=kernel, shield=shield)
+    try:
+        daemon.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.shutdown()
+        kernel.close()
+
+
+def run_worker(args: argparse.Namespace) -> None:
+    """Serve ``--worker ADDRESS`` until interrupted, under ``--resources`` if given."""
+
+    from workers import ExecutorWorker, WorkerConfig, WorkerError, load_key
+
+    try:
+        config = WorkerConfig(address=args.worker, key=load_key(worker_key_path_from_args(args)))
+    except WorkerError as exc:
+        raise SystemExit(f"--worker: {exc}") from None
+    if args.worker_capacity:
+        config.capacity = args.worker_capacity
+    if args.worker_root:
+        config.root = Path(args.worker_root)
+    worker = ExecutorWorker(config, governor=build_governor(args))
+    try:
+        worker.run_forever()
+    except WorkerError as exc:
+        raise SystemExit(f"--worker: {exc}") from None
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.close()
+
+
 def main() -> None:
     args = parse_args()
 
     log_dir = Path(args.log_dir)
     configure_logging(run_id="axiom", log_dir=log_dir)
 
-    shield = EntropyShield(EntropyShieldConfig(root_dir=log_dir))
+    if args.serve:
+        serve(args)
+        return
+
+    if args.worker:
+        run_worker(args)
+        return
+
+    if args.analytics is not None:
+        from analytics import analytics_command
+
+        print(analytics_command(log_dir / EntropyShieldConfig.ledger_filename, args.analytics))
+        return
 
-    kernel = Kernel(KernelConfig(base_url=args.ollama_url, model=args.model))
-    agent = DeterministicAgent(entropy_shield=shield)
+    shield, kernel, agent = build_substrate(args)
+    memory = build_memory(args)
 
     try:
         # The dashboard now wires the Entropy Shield, Kernel, and DeterministicAgent
         # together so general commands run under invariants.
-        run_dashboard(shield, kernel, agent)
+        run_dashboard(
+            shield,
+            kernel,
+            agent,
+            memory=memory,
+            reuse_threshold=args.reuse_threshold,
+            deadlines=deadlines_from_args(args),
+            prefetch=args.prefetch,
+            token_budgets=token_budgets_from_args(args),
+            resume=args.resume,
+        )
     finally:
+        if memory is not None:
+            memory.close()
+        if agent.workers is not None:
+            agent.workers.close()
         kernel.close()
 
 
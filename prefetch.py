@@ -0,0 +1,194 @@
+"""Prefetch module: idle-time speculative completions for !explain and !fix.
+
+After a shell command the next request is very often ``!fix`` (after a
+failure) or ``!explain``. While the user is idle the dashboards hand
+those prompts to a SpeculativePrefetcher, which generates them one at a
+time in the scheduler's ``background`` class, so an interactive request
+preempts them. Results are kept for a short time, keyed by the exact
+prompt, and served when the same request arrives:
+
+- ``take`` returns a finished result instantly, or waits for one still
+  running instead of starting a second generation.
+- ``discard`` cancels all speculation; the dashboards call it as soon
+  as any other command is entered.
+
+Speculative calls go through ``law_guarded_completion`` like any other,
+so each is a ``kernel_call`` ledger event, marked ``speculative`` so
+analytics can keep it apart from requests; speculation that is thrown
+away mid-generation is recorded with status ``superseded``.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+from entropy_shield import EntropyShield
+from kernel import CancelToken, GenerationCancelled
+from law_core import DEFAULT_DEADLINES, DEFAULT_TOKEN_BUDGETS, RESPONSE_SCHEMAS, law_guarded_completion
+from router import route_kernel
+from scheduler import prioritized
+
+if TYPE_CHECKING:
+    from semantic_index import SemanticMemory
+
+logger = logging.getLogger("orchestrator")
+
+
+@dataclass
+class _Speculation:
+    cancel: CancelToken
+    future: "Future[Dict]"
+    created: float
+
+
+class SpeculativePrefetcher:
+    """Short-lived cache of speculative completions, keyed by (kind, prompt)."""
+
+    def __init__(
+        self,
+        *,
+        kernel: Any,
+        shield: EntropyShield,
+        memory: Optional["SemanticMemory"] = None,
+        deadlines: Optional[Dict[str, float]] = None,
+        token_budgets: Optional[Dict[str, int]] = None,
+        ttl: float = 120.0,
+    ) -> None:
+        self._kernel = kernel
+        self._shield = shield
+        self._memory = memory
+        self._deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+        self._token_budgets = {**DEFAULT_TOKEN_BUDGETS, **(token_budgets or {})}
+        self._ttl = ttl
+        # One worker: speculation never competes with itself for the model.
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, str], _Speculation] = {}
+        self.launched = 0
+        self.hits = 0
+        self.misses = 0
+
+    def speculate(self, kind: str, prompt: str) -> None:
+        """Queue a speculative completion unless one for this prompt exists."""
+
+        key = (kind, prompt)
+        with self._lock:
+            if key in self._entries:
+                return
+            cancel = CancelToken(deadline=self._deadlines.get(kind))
+            future = self._pool.submit(self._run, kind, prompt, cancel)
+            self._entries[key] = _Speculation(cancel=cancel, future=future, created=time.monotonic())
+            self.launched += 1
+        logger.debug("Prefetch: speculating %s", kind)
+
+    def _run(self, kind: str, prompt: str, cancel: CancelToken) -> Dict:
+        cancel.raise_if_cancelled()  # discarded while still queued
+        try:
+            return law_guarded_completion(
+                kernel=prioritized(route_kernel(self._kernel, kind), "background"),
+                shield=self._shield,
+                user_content=prompt,
+                memory_kind=kind,
+                cancel=cancel,
+                max_tokens=self._token_budgets.get(kind),
+                response_schema=RESPONSE_SCHEMAS.get(kind),
+                speculative=True,
+            )
+        finally:
+            cancel.finish()
+
+    def take(self, kind: str, prompt: str, cancel: Optional[CancelToken] = None) -> Optional[Dict]:
+        """Return the speculative envelope for this exact prompt, or None.
+
+        A speculation still running is awaited; cancelling ``cancel``
+        (the user's own request token) cancels it and re-raises.
+        Failed or expired speculation counts as a miss so the caller
+        generates normally.
+        """
+
+        with self._lock:
+            spec = self._entries.pop((kind, prompt), None)
+        if spec is None or time.monotonic() - spec.created > self._ttl:
+            if spec is not None:
+                spec.cancel.cancel("superseded")
+            self.misses += 1
+            return None
+
+        unregister = cancel.on_cancel(lambda: spec.cancel.cancel(cancel.reason or "cancelled")) if cancel else None
+        try:
+            envelope = spec.future.result()
+        except GenerationCancelled:
+            if cancel is not None and cancel.cancelled:
+                raise
+            self.misses += 1
+            return None
+        except Exception as exc:
+            logger.info("Prefetch: speculative %s failed (%s); generating normally", kind, exc)
+            self.misses += 1
+            return None
+        finally:
+            if unregister is not None:
+                unregister()
+        self.hits += 1
+        if self._memory is not None:
+            # Only completions the user actually asked for are remembered.
+            text = str(envelope.get("payload", {}).get("text", ""))
+            self._memory.remember_completion(kind=kind, prompt=prompt, response=text)
+        return envelope
+
+    def discard(self) -> None:
+        """Cancel and forget all speculation (the user moved on)."""
+
+        with self._lock:
+            entries, self._entries = self._entries, {}
+        for spec in entries.values():
+            spec.future.cancel()
+            spec.cancel.cancel("superseded")
+
+    def close(self) -> None:
+        self.discard()
+        self._pool.shutdown(wait=False)
+
+
+def complete_with_prefetch(
+    kind: str,
+    prompt: str,
+    *,
+    kernel: Any,
+    shield: EntropyShield,
+    prefetcher: Optional[SpeculativePrefetcher],
+    memory: Optional["SemanticMemory"] = None,
+    reuse_threshold: Optional[float] = None,
+    cancel: Optional[CancelToken] = None,
+    max_tokens: Optional[int] = None,
+) -> Tuple[Dict, str]:
+    """Serve ``prompt`` from speculation if possible, else generate it.
+
+    Kinds with a structured reply (``law_core.RESPONSE_SCHEMAS``) are
+    generated with that schema.
+
+    Returns ``(envelope, origin)`` where origin is ``"prefetch"``,
+    ``"recall"`` (semantic memory reuse) or ``"model"``.
+    """
+
+    if prefetcher is not None:
+        envelope = prefetcher.take(kind, prompt, cancel)
+        if envelope is not None:
+            return envelope, "prefetch"
+    envelope = law_guarded_completion(
+        kernel=route_kernel(kernel, kind),
+        shield=shield,
+        user_content=prompt,
+        memory=memory,
+        memory_kind=kind,
+        reuse_threshold=reuse_threshold,
+        cancel=cancel,
+        max_tokens=max_tokens,
+        response_schema=RESPONSE_SCHEMAS.get(kind),
+    )
+    return envelope, "recall" if "recalled_from" in envelope.get("payload", {}) else "model"
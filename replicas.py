@@ -0,0 +1,233 @@
+"""Replicas module: load balancing across several Ollama instances of one model.
+
+One Ollama server generates one reply at a time per loaded model, so a
+single ``base_url`` caps throughput. A ReplicatedKernel fronts one
+Kernel per endpoint serving the same model (``--ollama-url`` with
+comma-separated URLs, or a list as a routing model's ``base_url``):
+
+- Balancing: a call goes to the healthy endpoint with the fewest
+  outstanding requests, ties broken by recent latency.
+- Stickiness: each prompt prefix (system prompt and messages, first
+  ``sticky_prefix_chars`` characters) has a home endpoint chosen by
+  rendezvous hashing. The call stays there while it is no busier than
+  the least loaded endpoint (plus ``sticky_slack``), so repeated context
+  hits that server's prompt cache. Endpoints joining or leaving only
+  move the prefixes they own.
+- Health: a background thread probes ``/api/version`` every
+  ``health_interval`` seconds. Endpoints that fail the probe, or refuse
+  a connection, get no calls until a probe succeeds again. A refused
+  connection means nothing was generated, so the call fails over to the
+  next endpoint; every other error is raised as from a plain Kernel.
+- Stats: calls, errors, outstanding requests, sticky hits and latency
+  percentiles per endpoint (``endpoint_stats``, shown by ``!stats``).
+
+Replicas may run on other hosts you control; prompts are sent to them
+in plain HTTP like to a local Ollama.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set
+
+import httpx
+
+from kernel import CancelToken, Kernel, KernelConfig
+
+logger = logging.getLogger("ollama")
+
+# Weight of the newest sample in the per-endpoint latency average.
+_EWMA_ALPHA = 0.2
+
+
+@dataclass
+class ReplicaPolicy:
+    health_interval: float = 10.0  # seconds between probes; 0 disables probing and marking endpoints down
+    health_timeout: float = 2.0
+    sticky_prefix_chars: int = 2048
+    # Extra outstanding requests the home endpoint may have over the least loaded one.
+    sticky_slack: int = 0
+
+
+class _Endpoint:
+    """One replica: its Kernel plus load, health and latency counters."""
+
+    def __init__(self, url: str, kernel: Kernel) -> None:
+        self.url = url
+        self.kernel = kernel
+        self.healthy = True
+        self.outstanding = 0
+        self.calls = 0
+        self.errors = 0
+        self.sticky_hits = 0
+        self.ewma: Optional[float] = None
+        self.latencies: Deque[float] = deque(maxlen=1024)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "calls": self.calls,
+            "errors": self.errors,
+            "sticky_hits": self.sticky_hits,
+            "p50_s": self.percentile(50),
+            "p95_s": self.percentile(95),
+        }
+
+
+def _home_score(key: bytes, url: str) -> bytes:
+    return hashlib.blake2b(key + url.encode("utf-8"), digest_size=8).digest()
+
+
+class ReplicatedKernel:
+    """Kernel-compatible front for several Ollama instances serving the same model."""
+
+    def __init__(self, config: KernelConfig, urls: Sequence[str], *, policy: Optional[ReplicaPolicy] = None) -> None:
+        if not urls:
+            raise ValueError("ReplicatedKernel requires at least one endpoint URL")
+        self.config = replace(config, base_url=urls[0])
+        self.policy = policy or ReplicaPolicy()
+        self._endpoints = [_Endpoint(url, Kernel(replace(config, base_url=url))) for url in urls]
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+        if self.policy.health_interval > 0:
+            self._prober = threading.Thread(target=self._probe_loop, name="replica-health", daemon=True)
+            self._prober.start()
+        logger.info("Load balancing model %s across %d endpoint(s): %s", config.model, len(urls), ", ".join(urls))
+
+    @property
+    def capacity(self) -> int:
+        """One concurrent call per endpoint."""
+
+        return len(self._endpoints)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._prober is not None:
+            self._prober.join(timeout=self.policy.health_timeout + 1.0)
+        for endpoint in self._endpoints:
+            endpoint.kernel.close()
+
+    # Selection ----------------------------------------------------------------
+
+    def _prefix_key(self, system_prompt: str, messages: List[Dict[str, str]]) -> bytes:
+        limit = self.policy.sticky_prefix_chars
+        parts = [system_prompt]
+        length = len(system_prompt)
+        for message in messages:
+            if length >= limit:
+                break
+            content = f"\x00{message.get('role', '')}\x00{message.get('content', '')}"
+            parts.append(content)
+            length += len(content)
+        return "".join(parts)[:limit].encode("utf-8")
+
+    def _acquire(self, key: bytes, exclude: Set[str]) -> _Endpoint:
+        with self._lock:
+            candidates = [e for e in self._endpoints if e.url not in exclude]
+            # With every endpoint marked down, try them anyway rather than fail without asking.
+            healthy = [e for e in candidates if e.healthy] or candidates
+            home = max(healthy, key=lambda e: _home_score(key, e.url))
+            least = min(healthy, key=lambda e: (e.outstanding, e.ewma or 0.0))
+            if home.outstanding <= least.outstanding + self.policy.sticky_slack:
+                chosen = home
+                chosen.sticky_hits += 1
+            else:
+                chosen = least
+            chosen.outstanding += 1
+        return chosen
+
+    def _release(self, endpoint: _Endpoint, elapsed: float, *, error: bool = False, down: bool = False) -> None:
+        with self._lock:
+            endpoint.outstanding -= 1
+            endpoint.calls += 1
+            endpoint.errors += int(error)
+            if not error:
+                endpoint.latencies.append(elapsed)
+                endpoint.ewma = elapsed if endpoint.ewma is None else (
+                    _EWMA_ALPHA * elapsed + (1 - _EWMA_ALPHA) * endpoint.ewma
+                )
+            if down and endpoint.healthy and self._prober is not None:  # only a probe can mark it up again
+                endpoint.healthy = False
+                logger.warning("Endpoint %s refused a connection; marked down until a probe succeeds", endpoint.url)
+
+    # Generation ---------------------------------------------------------------
+
+    def generate(
+        self,
+        *,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        cancel: Optional[CancelToken] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """Generate on one endpoint, failing over only when a connection is refused."""
+
+        key = self._prefix_key(system_prompt, messages)
+        tried: Set[str] = set()
+        while True:
+            endpoint = self._acquire(key, tried)
+            start = time.perf_counter()
+            try:
+                text = endpoint.kernel.generate(
+                    system_prompt=system_prompt,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    cancel=cancel,
+                    response_schema=response_schema,
+                    usage=usage,
+                )
+            except (httpx.ConnectError, httpx.ConnectTimeout) as exc:
+                self._release(endpoint, time.perf_counter() - start, error=True, down=True)
+                tried.add(endpoint.url)
+                if len(tried) == len(self._endpoints) or (cancel is not None and cancel.cancelled):
+                    raise
+                logger.info("Endpoint %s unreachable (%s); retrying on another replica", endpoint.url, exc)
+                continue
+            except BaseException:
+                self._release(endpoint, time.perf_counter() - start, error=True)
+                raise
+            self._release(endpoint, time.perf_counter() - start)
+            logger.debug("Replica %s served call in %.3fs", endpoint.url, time.perf_counter() - start)
+            return text
+
+    # Health -------------------------------------------------------------------
+
+    def check_health(self) -> None:
+        """Probe every endpoint once and update its health."""
+
+        for endpoint in self._endpoints:
+            try:
+                response = httpx.get(f"{endpoint.url.rstrip('/')}/api/version", timeout=self.policy.health_timeout)
+                healthy = response.status_code == 200
+            except httpx.HTTPError:
+                healthy = False
+            with self._lock:
+                changed = endpoint.healthy != healthy
+                endpoint.healthy = healthy
+            if changed:
+                logger.warning("Endpoint %s is %s", endpoint.url, "back up" if healthy else "down")
+
+    def _probe_loop(self) -> None:
+        while not self._stop.wait(self.policy.health_interval):
+            self.check_health()
+
+    def endpoint_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            return {endpoint.url: endpoint.snapshot() for endpoint in self._endpoints}
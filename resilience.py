@@ -0,0 +1,306 @@
+"""Resilience module: explicit, audited retry/hedge/breaker policy for Kernel calls.
+
+``Kernel`` does not retry silently, and that stays true: this wrapper is
+opt-in, configured explicitly, and every retry, hedge and circuit
+breaker transition is written to the Zero Entropy Ledger as its own
+``kernel_resilience`` event.
+
+- Retries: transport errors, HTTP 429 and 5xx responses are retried up
+  to ``max_retries`` times with deterministic exponential backoff.
+- Hedging: once enough latency samples exist, a call still running
+  after the ``hedge_percentile`` latency gets one duplicate request; the
+  first response wins and the slower request is cancelled.
+- Circuit breaker: after ``breaker_failure_threshold`` consecutive
+  retryable failures the breaker opens and calls fail fast until
+  ``breaker_reset_timeout`` has passed; then one trial call decides
+  whether it closes again.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+import httpx
+
+from entropy_shield import EntropyShield
+from kernel import CancelToken, GenerationCancelled
+
+logger = logging.getLogger("ollama")
+
+
+@dataclass
+class ResiliencePolicy:
+    max_retries: int = 2
+    backoff_base: float = 0.5
+    backoff_max: float = 8.0
+    hedge_percentile: Optional[float] = 95.0
+    hedge_min_samples: int = 20
+    breaker_failure_threshold: int = 5
+    breaker_reset_timeout: float = 30.0
+
+    def backoff(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** attempt))
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without contacting Ollama while the breaker is open."""
+
+
+def is_retryable(exc: BaseException) -> bool:
+    if isinstance(exc, httpx.TransportError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        return status == 429 or status >= 500
+    return False
+
+
+class CircuitBreaker:
+    """Consecutive-failure breaker with a single half-open trial."""
+
+    def __init__(self, *, failure_threshold: int, reset_timeout: float, on_transition=None) -> None:
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._on_transition = on_transition or (lambda state, failures: None)
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self.state = "closed"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - (self._opened_at or 0.0) >= self._reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            changed = self.state != "closed"
+            self._failures = 0
+            self.state = "closed"
+            self._trial_in_flight = False
+        if changed:
+            self._on_transition("closed", 0)
+
+    def release_trial(self) -> None:
+        """Let another call try if a half-open trial ended without a verdict."""
+
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            trip = self.state == "half_open" or (
+                self.state == "closed" and self._failures >= self._failure_threshold
+            )
+            if trip:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+            failures = self._failures
+        if trip:
+            self._on_transition("open", failures)
+
+
+class ResilientKernel:
+    """Kernel-compatible wrapper applying a ResiliencePolicy.
+
+    Routed kernels (see router.py) are supported: ``for_route`` returns a
+    wrapper around the routed view that shares this wrapper's breaker
+    and thread pool but keeps its own latency samples.
+    """
+
+    def __init__(
+        self,
+        kernel: Any,
+        *,
+        policy: ResiliencePolicy,
+        shield: EntropyShield,
+        breaker: Optional[CircuitBreaker] = None,
+        pool: Optional[ThreadPoolExecutor] = None,
+    ) -> None:
+        self._kernel = kernel
+        self.policy = policy
+        self._shield = shield
+        self._owns_pool = pool is None
+        self._pool = pool or ThreadPoolExecutor(max_workers=8, thread_name_prefix="kernel-hedge")
+        self.breaker = breaker or CircuitBreaker(
+            failure_threshold=policy.breaker_failure_threshold,
+            reset_timeout=policy.breaker_reset_timeout,
+            on_transition=self._on_breaker_transition,
+        )
+        # Appended from pool threads; read under the lock, sorted outside it.
+        self._latencies: Deque[float] = deque(maxlen=256)
+        self._latency_lock = threading.Lock()
+        self._routes: Dict[str, "ResilientKernel"] = {}
+
+    @property
+    def config(self) -> Any:
+        return self._kernel.config
+
+    @property
+    def inner(self) -> Any:
+        return self._kernel
+
+    def for_route(self, route: str) -> "ResilientKernel":
+        for_route = getattr(self._kernel, "for_route", None)
+        if not callable(for_route):
+            return self
+        if route not in self._routes:
+            self._routes[route] = ResilientKernel(
+                for_route(route), policy=self.policy, shield=self._shield, breaker=self.breaker, pool=self._pool
+            )
+        return self._routes[route]
+
+    def close(self) -> None:
+        if self._owns_pool:
+            self._pool.shutdown(wait=False)
+        self._kernel.close()
+
+    # Ledger -------------------------------------------------------------------
+
+    def _record(self, action: str, **details: Any) -> None:
+        self._shield.record_kernel_resilience(action=action, details=details)
+
+    def _on_breaker_transition(self, state: str, failures: int) -> None:
+        logger.warning("Kernel circuit breaker %s after %d consecutive failure(s)", state, failures)
+        self._record(f"circuit_{state}", consecutive_failures=failures)
+
+    # Calls --------------------------------------------------------------------
+
+    def _hedge_delay(self) -> Optional[float]:
+        if self.policy.hedge_percentile is None:
+            return None
+        with self._latency_lock:
+            samples = list(self._latencies)
+        if len(samples) < self.policy.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(self.policy.hedge_percentile / 100.0 * len(ordered)))
+        return ordered[index]
+
+    def _attempt(self, attempt: int, kwargs: Dict[str, Any]) -> str:
+        start = time.perf_counter()
+        usage = kwargs["usage"]
+        cancel: Optional[CancelToken] = kwargs["cancel"]
+        # Each request gets its own usage dict, so a dropped hedge cannot overwrite the
+        # winner's, and its own token, so the loser can be stopped without the caller's.
+        usages: Dict[Future, Dict[str, Any]] = {}
+        tokens: Dict[Future, CancelToken] = {}
+        unlinks: List[Callable[[], None]] = []
+
+        def submit() -> Future:
+            own: Dict[str, Any] = {}
+            token = CancelToken()
+            if cancel is not None:
+                unlinks.append(token.follow(cancel))
+            future = self._pool.submit(
+                self._kernel.generate, **{**kwargs, "cancel": token, "usage": own if usage is not None else None}
+            )
+            usages[future] = own
+            tokens[future] = token
+            return future
+
+        try:
+            pending: List[Future] = [submit()]
+            delay = self._hedge_delay()
+            if delay is not None:
+                done, _ = wait(pending, timeout=delay)
+                if not done:
+                    self._record("hedge", attempt=attempt, after_s=round(delay, 3))
+                    pending.append(submit())
+
+            error: Optional[BaseException] = None
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    exc = future.exception()
+                    if exc is None:
+                        with self._latency_lock:
+                            self._latencies.append(time.perf_counter() - start)
+                        for loser in pending:
+                            tokens[loser].cancel("hedge_lost")
+                        if usage is not None:
+                            usage.update(usages[future])
+                        return future.result()
+                    error = exc
+            assert error is not None
+            raise error
+        finally:
+            for unlink in unlinks:
+                unlink()
+
+    def generate(
+        self,
+        *,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        cancel: Optional[CancelToken] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        kwargs = {
+            "system_prompt": system_prompt,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "cancel": cancel,
+            "response_schema": response_schema,
+            "usage": usage,
+        }
+        for attempt in range(self.policy.max_retries + 1):
+            if not self.breaker.allow():
+                self._record("circuit_rejected", attempt=attempt)
+                raise CircuitOpenError("Kernel circuit breaker is open; Ollama is treated as unavailable")
+            try:
+                text = self._attempt(attempt, kwargs)
+            except GenerationCancelled:
+                # Cancellation is the caller's decision, not an Ollama failure.
+                self.breaker.release_trial()
+                raise
+            except Exception as exc:
+                if not is_retryable(exc):
+                    # A rejected request says nothing about Ollama's availability.
+                    self.breaker.release_trial()
+                    raise
+                self.breaker.record_failure()
+                if attempt >= self.policy.max_retries:
+                    raise
+                delay = self.policy.backoff(attempt)
+                logger.info("Kernel attempt %d failed (%s); retrying in %.2fs", attempt, exc, delay)
+                self._record("retry", attempt=attempt + 1, delay_s=delay, error=f"{type(exc).__name__}: {exc}")
+                if cancel is None:
+                    time.sleep(delay)
+                    continue
+                cancel.raise_if_cancelled()
+                remaining = cancel.remaining()
+                if remaining is not None and remaining < delay:
+                    raise  # the retry could not finish before the deadline
+                woken = threading.Event()
+                unregister = cancel.on_cancel(woken.set)
+                try:
+                    woken.wait(delay)
+                finally:
+                    unregister()
+                cancel.raise_if_cancelled()
+                continue
+            self.breaker.record_success()
+            return text
+        raise AssertionError("unreachable")  # pragma: no cover
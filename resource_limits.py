@@ -0,0 +1,246 @@
+"""Resource_Limits module: per-agent resource profiles for executed commands.
+
+Commands run by the DeterministicAgent used to inherit the dashboard's
+full priority and unlimited resources, so a heavy build could starve
+the local Ollama process. A ResourceProfile, read from an agent's
+``resources`` key in ``agents.yaml``, is applied to every command the
+agent runs:
+
+- ``nice`` (added niceness) and the ``cpu_seconds``/``memory_mb``
+  rlimits (RLIMIT_CPU, RLIMIT_AS) are set in the child before it
+  execs. Only plain system calls run there, which is safe even though
+  the dashboards are multi-threaded.
+- ``ionice`` (``idle`` or ``best-effort:N``) is applied through psutil
+  right after the spawn, as the stdlib has no ioprio call. On Windows
+  ``nice`` maps to a lower psutil priority class instead.
+- With ``cgroup`` limits (``cpu`` in CPUs, ``memory_mb``) and a
+  writable cgroup v2 hierarchy, commands are moved into a
+  ``axiom-<profile>`` group under ``cgroup.parent`` (default: this
+  process's own cgroup). cgroup v2 only lets a group with no processes
+  of its own delegate controllers, so the default parent usually only
+  works under a delegated systemd unit. Otherwise a warning is logged
+  once and the other limits still apply.
+
+``wait_with_usage`` reaps a command with ``os.wait4`` to get its exact
+CPU time and peak memory (including reaped children), and the agent
+records them on the ``command`` and ``job`` events.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+logger = logging.getLogger("agent")
+
+_MIB = 1 << 20
+_CGROUP_PERIOD_US = 100_000
+
+
+class ResourceProfileError(RuntimeError):
+    """Raised for an unknown agent or an invalid ``resources`` entry."""
+
+
+@dataclass
+class ResourceProfile:
+    name: str = "default"
+    nice: Optional[int] = None
+    ionice: Optional[str] = None  # "idle" or "best-effort:0".."best-effort:7"
+    cpu_seconds: Optional[int] = None
+    memory_mb: Optional[int] = None
+    cgroup_cpu: Optional[float] = None  # CPUs, e.g. 2.0
+    cgroup_memory_mb: Optional[int] = None
+    cgroup_parent: Optional[str] = None
+
+    @classmethod
+    def from_mapping(cls, name: str, data: Mapping[str, Any]) -> "ResourceProfile":
+        cgroup = data.get("cgroup") or {}
+        known = {"nice", "ionice", "cpu_seconds", "memory_mb", "cgroup"}
+        unknown = set(data) - known | set(cgroup) - {"cpu", "memory_mb", "parent"}
+        if unknown:
+            raise ResourceProfileError(f"Unknown resources key(s) for agent '{name}': {', '.join(sorted(unknown))}")
+        ionice = data.get("ionice")
+        if ionice is not None:
+            ionice = str(ionice)
+            _ionice_class(ionice)  # validate now, not in the first command
+        return cls(
+            name=name,
+            nice=_optional(int, data.get("nice")),
+            ionice=ionice,
+            cpu_seconds=_optional(int, data.get("cpu_seconds")),
+            memory_mb=_optional(int, data.get("memory_mb")),
+            cgroup_cpu=_optional(float, cgroup.get("cpu")),
+            cgroup_memory_mb=_optional(int, cgroup.get("memory_mb")),
+            cgroup_parent=cgroup.get("parent"),
+        )
+
+    @classmethod
+    def from_yaml(cls, path: Path, agent: str) -> "ResourceProfile":
+        """The ``resources`` of ``agent`` in an ``agents.yaml``-style file."""
+
+        import yaml
+
+        data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+        for entry in data.get("agents", []):
+            if entry.get("name") == agent:
+                return cls.from_mapping(agent, entry.get("resources") or {})
+        raise ResourceProfileError(f"No agent '{agent}' in {path}")
+
+    def describe(self) -> Dict[str, Any]:
+        return {key: value for key, value in vars(self).items() if value is not None and key != "name"}
+
+
+def _optional(convert: Callable[[Any], Any], value: Any) -> Any:
+    return None if value is None else convert(value)
+
+
+def _ionice_class(value: str) -> Tuple[str, Optional[int]]:
+    kind, _, level = value.partition(":")
+    if kind == "idle" and not level:
+        return kind, None
+    if kind == "best-effort" and level.isdigit() and 0 <= int(level) <= 7:
+        return kind, int(level)
+    raise ResourceProfileError(f"Invalid ionice '{value}'; expected 'idle' or 'best-effort:0'..'best-effort:7'")
+
+
+class _Cgroup:
+    """A cgroup v2 directory with ``cpu.max``/``memory.max`` set for one profile."""
+
+    def __init__(self, profile: ResourceProfile) -> None:
+        self.path: Optional[Path] = None
+        try:
+            parent = Path(profile.cgroup_parent) if profile.cgroup_parent else _own_cgroup()
+            if parent is None:
+                raise OSError("no cgroup v2 hierarchy is mounted")
+            wanted = {"cpu"} if profile.cgroup_cpu is not None else set()
+            if profile.cgroup_memory_mb is not None:
+                wanted.add("memory")
+            enabled = set((parent / "cgroup.subtree_control").read_text().split())
+            if wanted - enabled:
+                # Fails with EBUSY while ``parent`` itself has processes.
+                (parent / "cgroup.subtree_control").write_text(" ".join(f"+{c}" for c in sorted(wanted - enabled)))
+            path = parent / f"axiom-{profile.name}"
+            path.mkdir(exist_ok=True)
+            if profile.cgroup_cpu is not None:
+                quota = max(1000, int(profile.cgroup_cpu * _CGROUP_PERIOD_US))
+                (path / "cpu.max").write_text(f"{quota} {_CGROUP_PERIOD_US}")
+            if profile.cgroup_memory_mb is not None:
+                (path / "memory.max").write_text(str(profile.cgroup_memory_mb * _MIB))
+            self.path = path
+            logger.info("Resource profile %s: commands run in cgroup %s", profile.name, path)
+        except OSError as exc:
+            logger.warning("Resource profile %s: cgroup limits unavailable (%s); using rlimits only", profile.name, exc)
+
+    def attach(self, pid: int) -> None:
+        if self.path is None:
+            return
+        try:
+            (self.path / "cgroup.procs").write_text(str(pid))
+        except OSError as exc:  # e.g. the command already exited
+            logger.debug("Could not move pid %d into %s: %s", pid, self.path, exc)
+
+
+def _own_cgroup() -> Optional[Path]:
+    """This process's cgroup v2 directory, if a cgroup2 filesystem is mounted."""
+
+    try:
+        mounts = Path("/proc/self/mounts").read_text().splitlines()
+        own = next(line[3:] for line in Path("/proc/self/cgroup").read_text().splitlines() if line.startswith("0::"))
+    except (OSError, StopIteration):
+        return None
+    for line in mounts:
+        fields = line.split()
+        if len(fields) > 2 and fields[2] == "cgroup2":
+            return Path(fields[1]) / own.lstrip("/")
+    return None
+
+
+class ResourceGovernor:
+    """Applies one ResourceProfile to the processes an agent spawns."""
+
+    def __init__(self, profile: ResourceProfile) -> None:
+        self.profile = profile
+        self._cgroup = (
+            _Cgroup(profile)
+            if sys.platform.startswith("linux")
+            and (profile.cgroup_cpu is not None or profile.cgroup_memory_mb is not None)
+            else None
+        )
+
+    def popen_kwargs(self) -> Dict[str, Any]:
+        """Extra ``subprocess.Popen`` arguments that apply limits before exec."""
+
+        if os.name != "posix":
+            return {}
+        import resource
+
+        nice, setrlimit = os.nice, resource.setrlimit
+        limits = []
+        if self.profile.cpu_seconds is not None:
+            # SIGXCPU at the soft limit, SIGKILL shortly after.
+            limits.append((resource.RLIMIT_CPU, (self.profile.cpu_seconds, self.profile.cpu_seconds + 5)))
+        if self.profile.memory_mb is not None:
+            limits.append((resource.RLIMIT_AS, (self.profile.memory_mb * _MIB,) * 2))
+        increment = self.profile.nice
+        if not increment and not limits:
+            return {}
+
+        def apply() -> None:  # runs in the child between fork and exec
+            if increment:
+                nice(increment)
+            for which, value in limits:
+                setrlimit(which, value)
+
+        return {"preexec_fn": apply}
+
+    def after_spawn(self, pid: int) -> None:
+        """Limits that can only be applied from outside, right after the spawn."""
+
+        if self._cgroup is not None:
+            self._cgroup.attach(pid)
+        if self.profile.ionice is None and (os.name == "posix" or not self.profile.nice):
+            return
+        import psutil
+
+        try:
+            process = psutil.Process(pid)
+            if os.name != "posix" and self.profile.nice:
+                priority = psutil.IDLE_PRIORITY_CLASS if self.profile.nice >= 10 else psutil.BELOW_NORMAL_PRIORITY_CLASS
+                process.nice(priority)
+            if self.profile.ionice is not None and sys.platform.startswith("linux"):
+                kind, level = _ionice_class(self.profile.ionice)
+                if kind == "idle":
+                    process.ionice(psutil.IOPRIO_CLASS_IDLE)
+                else:
+                    process.ionice(psutil.IOPRIO_CLASS_BE, level)
+        except psutil.Error as exc:  # exited already, or not permitted
+            logger.debug("Could not adjust priority of pid %d: %s", pid, exc)
+
+
+def wait_with_usage(process: "subprocess.Popen[Any]") -> Tuple[int, Optional[Dict[str, Any]]]:
+    """Reap ``process`` and return ``(exit_code, usage)``.
+
+    ``usage`` has ``cpu_user_s``, ``cpu_system_s`` and ``max_rss_kb`` for
+    the process and its reaped children; it is None where ``os.wait4`` is
+    unavailable or the process was already reaped (e.g. by ``poll()``).
+    """
+
+    if not hasattr(os, "wait4") or process.returncode is not None:
+        return process.wait(), None
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        return process.wait(), None
+    process.returncode = os.waitstatus_to_exitcode(status)
+    max_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == "darwin" else rusage.ru_maxrss  # bytes on macOS
+    usage = {
+        "cpu_user_s": round(rusage.ru_utime, 3),
+        "cpu_system_s": round(rusage.ru_stime, 3),
+        "max_rss_kb": max_rss_kb,
+    }
+    return process.returncode, usage
@@ -0,0 +1,297 @@
+"""Router module: map request types to local models by role and load.
+
+A single ``KernelConfig.model`` makes a trivial ``!explain ls`` wait on
+the same large model as a deep ``!ai`` question. The router sits in
+front of one Kernel per configured model and chooses per request:
+
+- Each route (``ai``, ``explain``, ``fix`` and every agent name from
+  ``agents.yaml`` such as ``planner`` or ``reviewer``) names a primary
+  model and an optional smaller fallback.
+- Each model has a concurrency limit. When the primary model's queue
+  is at least ``fallback_queue_depth`` deep, the call goes to the
+  fallback instead of waiting.
+- Latency, error and fallback counts are kept per route.
+
+Everything stays local: endpoints are expected to be Ollama instances
+on this machine. A model's ``base_url`` may also be a list of replicas,
+which are load balanced (see replicas.py).
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Union
+
+from kernel import CancelToken, Kernel, KernelConfig
+
+logger = logging.getLogger("ollama")
+
+
+@dataclass
+class ModelSpec:
+    """One local model (and the endpoint that serves it)."""
+
+    name: str
+    model: str
+    base_url: Union[str, List[str]] = "http://localhost:11434"
+    max_concurrency: int = 1  # per endpoint when ``base_url`` lists replicas
+
+
+@dataclass
+class RouteSpec:
+    """Which model a request type uses, and when to fall back."""
+
+    name: str
+    model: str
+    fallback: Optional[str] = None
+    fallback_queue_depth: int = 1
+
+
+@dataclass
+class RouteStats:
+    calls: int = 0
+    errors: int = 0
+    fallbacks: int = 0
+    latencies: Deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "fallbacks": self.fallbacks,
+            "p50_s": self.percentile(50),
+            "p95_s": self.percentile(95),
+        }
+
+
+class _ModelSlot:
+    """A Kernel guarded by a concurrency limit, with queue accounting."""
+
+    def __init__(self, spec: ModelSpec, request_timeout: float) -> None:
+        self.spec = spec
+        urls = [spec.base_url] if isinstance(spec.base_url, str) else list(spec.base_url)
+        config = KernelConfig(base_url=urls[0], model=spec.model, request_timeout=request_timeout)
+        if len(urls) > 1:
+            from replicas import ReplicatedKernel
+
+            self.kernel: Any = ReplicatedKernel(config, urls)
+        else:
+            self.kernel = Kernel(config)
+        self.capacity = max(1, spec.max_concurrency) * len(urls)
+        self._semaphore = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+
+    def generate(self, **kwargs: Any) -> str:
+        cancel: Optional[CancelToken] = kwargs.get("cancel")
+        with self._lock:
+            self.waiting += 1
+        try:
+            if cancel is None:
+                self._semaphore.acquire()
+            else:
+                # A cancelled request gives up its place in the queue too.
+                while not self._semaphore.acquire(timeout=0.05):
+                    cancel.raise_if_cancelled()
+        finally:
+            with self._lock:
+                self.waiting -= 1
+        with self._lock:
+            self.in_flight += 1
+        try:
+            return self.kernel.generate(**kwargs)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+            self._semaphore.release()
+
+    def queue_depth(self) -> int:
+        """Calls that would have to wait if one more arrived now."""
+
+        with self._lock:
+            return self.waiting + max(0, self.in_flight + 1 - self.capacity)
+
+    def close(self) -> None:
+        self.kernel.close()
+
+
+class RoutedKernel:
+    """Kernel-compatible view of the router bound to one route."""
+
+    def __init__(self, router: "ModelRouter", route: str) -> None:
+        self._router = router
+        self.route = route
+
+    @property
+    def config(self) -> KernelConfig:
+        return self._router.primary_for(self.route).kernel.config
+
+    def generate(
+        self,
+        *,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        cancel: Optional[CancelToken] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        return self._router.generate(
+            route=self.route,
+            system_prompt=system_prompt,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            cancel=cancel,
+            response_schema=response_schema,
+            usage=usage,
+        )
+
+
+class ModelRouter:
+    """Route generation requests to local models by request type and load."""
+
+    def __init__(
+        self,
+        *,
+        models: List[ModelSpec],
+        routes: List[RouteSpec],
+        default_route: str = "ai",
+        request_timeout: float = 120.0,
+    ) -> None:
+        if not models:
+            raise ValueError("ModelRouter requires at least one model")
+        self._slots: Dict[str, _ModelSlot] = {m.name: _ModelSlot(m, request_timeout) for m in models}
+        self._routes: Dict[str, RouteSpec] = {r.name: r for r in routes}
+        for route in routes:
+            for model_name in filter(None, (route.model, route.fallback)):
+                if model_name not in self._slots:
+                    raise ValueError(f"Route '{route.name}' references unknown model '{model_name}'")
+        if default_route not in self._routes:
+            self._routes[default_route] = RouteSpec(name=default_route, model=models[0].name)
+        self._default_route = default_route
+        self._stats: Dict[str, RouteStats] = {}
+        self._stats_lock = threading.Lock()
+
+    # Construction -------------------------------------------------------------
+
+    @classmethod
+    def from_yaml(cls, path: Path, *, request_timeout: float = 120.0) -> "ModelRouter":
+        """Load ``models``/``routes`` and per-agent ``model`` keys from YAML.
+
+        Agent entries (as in ``agents.yaml``) may carry ``model``,
+        ``fallback_model`` and ``fallback_queue_depth``; each such agent
+        becomes a route named after the agent.
+        """
+
+        import yaml
+
+        data = yaml.safe_load(path.read_text(encoding="utf-8")) or {}
+        models = [ModelSpec(**entry) for entry in data.get("models", [])]
+        routes = [RouteSpec(name=name, **spec) for name, spec in (data.get("routes") or {}).items()]
+        for agent in data.get("agents", []):
+            if agent.get("model"):
+                routes.append(
+                    RouteSpec(
+                        name=agent["name"],
+                        model=agent["model"],
+                        fallback=agent.get("fallback_model"),
+                        fallback_queue_depth=int(agent.get("fallback_queue_depth", 1)),
+                    )
+                )
+        return cls(models=models, routes=routes, request_timeout=request_timeout)
+
+    @property
+    def capacity(self) -> int:
+        """Total concurrent calls across all models."""
+
+        return sum(slot.capacity for slot in self._slots.values())
+
+    # Routing ------------------------------------------------------------------
+
+    def _spec_for(self, route: str) -> RouteSpec:
+        return self._routes.get(route) or self._routes[self._default_route]
+
+    def primary_for(self, route: str) -> _ModelSlot:
+        return self._slots[self._spec_for(route).model]
+
+    def select(self, route: str) -> _ModelSlot:
+        """Pick the slot for ``route`` given current queue depths."""
+
+        spec = self._spec_for(route)
+        primary = self._slots[spec.model]
+        if spec.fallback is None:
+            return primary
+        fallback = self._slots[spec.fallback]
+        if primary.queue_depth() >= spec.fallback_queue_depth and fallback.queue_depth() < primary.queue_depth():
+            return fallback
+        return primary
+
+    def for_route(self, route: str) -> RoutedKernel:
+        return RoutedKernel(self, route)
+
+    def generate(self, *, route: str, **kwargs: Any) -> str:
+        slot = self.select(route)
+        fell_back = slot is not self.primary_for(route)
+        if fell_back:
+            logger.info("Router: route=%s falling back to model=%s", route, slot.spec.model)
+
+        start = time.perf_counter()
+        error = False
+        try:
+            return slot.generate(**kwargs)
+        except Exception:
+            error = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._stats_lock:
+                stats = self._stats.setdefault(route, RouteStats())
+                stats.calls += 1
+                stats.errors += int(error)
+                stats.fallbacks += int(fell_back)
+                stats.latencies.append(elapsed)
+            logger.debug("Router: route=%s model=%s elapsed=%.3fs error=%s", route, slot.spec.model, elapsed, error)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._stats_lock:
+            return {route: stats.snapshot() for route, stats in self._stats.items()}
+
+    def endpoint_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Per-endpoint stats of models served by several replicas."""
+
+        stats: Dict[str, Dict[str, Any]] = {}
+        for slot in self._slots.values():
+            endpoint_stats = getattr(slot.kernel, "endpoint_stats", None)
+            if callable(endpoint_stats):
+                stats.update({f"{slot.spec.name} {url}": s for url, s in endpoint_stats().items()})
+        return stats
+
+    def close(self) -> None:
+        for slot in self._slots.values():
+            slot.close()
+
+
+def route_kernel(kernel: Any, route: str) -> Any:
+    """Return ``kernel`` bound to ``route`` if it supports routing.
+
+    Plain Kernels have no routes and are returned unchanged, so callers
+    can route unconditionally.
+    """
+
+    for_route = getattr(kernel, "for_route", None)
+    return for_route(route) if callable(for_route) else kernel
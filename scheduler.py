@@ -0,0 +1,384 @@
+"""Scheduler module: priority classes in front of the local kernel.
+
+Every model call used to compete equally, so background work (prefetch,
+batch jobs, agent runs) could hold Ollama while the user waits on an
+interactive ``!ai``. The PriorityScheduler admits calls in three
+classes and runs at most ``max_concurrent`` at once:
+
+- ``interactive``: requests the user is waiting on. Always picked first,
+  and when every slot is busy one running preemptible job (by default
+  ``background``) is cancelled to make room.
+- ``background``: speculative or opportunistic work that may be dropped.
+- ``batch``: bulk work that must finish eventually but is never urgent.
+
+Each class has a bounded queue; a full queue rejects the call with
+QueueFull instead of growing without bound. Within a class, jobs are
+queued per session (e.g. one daemon client) and the sessions are served
+round-robin, so one busy terminal cannot starve the others. A queued
+job that has waited longer than its class's ``max_wait`` is run next
+regardless of priority, so lower classes cannot starve. Queue waits are
+kept per class for ``stats()``.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+from kernel import CancelToken, GenerationCancelled
+from router import route_kernel
+
+logger = logging.getLogger("ollama")
+
+PRIORITIES: Tuple[str, ...] = ("interactive", "background", "batch")
+
+
+@dataclass
+class SchedulerConfig:
+    max_concurrent: int = 1
+    queue_limits: Dict[str, int] = field(
+        default_factory=lambda: {"interactive": 8, "background": 16, "batch": 256}
+    )
+    # Seconds a queued job may wait before it is promoted ahead of higher classes.
+    max_wait: Dict[str, float] = field(default_factory=lambda: {"background": 30.0, "batch": 60.0})
+    preemptible: Tuple[str, ...] = ("background",)
+
+
+class QueueFull(RuntimeError):
+    """Raised when a priority class's queue is at its limit."""
+
+
+@dataclass
+class _Job:
+    priority: str
+    fn: Callable[[CancelToken], Any]
+    cancel: CancelToken
+    future: "Future[Any]"
+    enqueued: float
+    session: str = ""
+    started: Optional[float] = None
+
+
+class _FairQueue:
+    """One class's queue: a FIFO per session, with the sessions taking turns."""
+
+    def __init__(self) -> None:
+        self._sessions: Dict[str, Deque[_Job]] = {}
+        self._turns: Deque[str] = deque()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __iter__(self) -> Iterator[_Job]:
+        for queue in self._sessions.values():
+            yield from queue
+
+    def append(self, job: _Job) -> None:
+        queue = self._sessions.get(job.session)
+        if queue is None:
+            queue = self._sessions[job.session] = deque()
+            self._turns.append(job.session)
+        queue.append(job)
+        self._size += 1
+
+    def next_in_turn(self) -> Optional[_Job]:
+        return self._sessions[self._turns[0]][0] if self._turns else None
+
+    def oldest(self) -> Optional[_Job]:
+        return min((queue[0] for queue in self._sessions.values()), key=lambda j: j.enqueued, default=None)
+
+    def remove(self, job: _Job) -> bool:
+        """Take ``job`` out; its session goes to the back of the turns if it has more."""
+
+        queue = self._sessions.get(job.session)
+        if queue is None or job not in queue:
+            return False
+        queue.remove(job)
+        self._size -= 1
+        self._turns.remove(job.session)
+        if queue:
+            self._turns.append(job.session)
+        else:
+            del self._sessions[job.session]
+        return True
+
+    def clear(self) -> None:
+        self._sessions.clear()
+        self._turns.clear()
+        self._size = 0
+
+
+def _percentile(values: Deque[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))]
+
+
+@dataclass
+class _ClassStats:
+    calls: int = 0
+    errors: int = 0
+    rejected: int = 0
+    preempted: int = 0
+    promoted: int = 0
+    waits: Deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+    durations: Deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "preempted": self.preempted,
+            "promoted": self.promoted,
+            "wait_p50_s": _percentile(self.waits, 50),
+            "wait_p95_s": _percentile(self.waits, 95),
+            "run_p50_s": _percentile(self.durations, 50),
+            "run_p95_s": _percentile(self.durations, 95),
+        }
+
+
+class PriorityScheduler:
+    """Run callables by priority class with bounded queues and aging."""
+
+    def __init__(self, config: Optional[SchedulerConfig] = None) -> None:
+        self.config = config or SchedulerConfig()
+        self._cond = threading.Condition()
+        self._queues: Dict[str, _FairQueue] = {p: _FairQueue() for p in PRIORITIES}
+        self._running: List[_Job] = []
+        self._stats: Dict[str, _ClassStats] = {p: _ClassStats() for p in PRIORITIES}
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"kernel-sched-{i}", daemon=True)
+            for i in range(max(1, self.config.max_concurrent))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(
+        self,
+        priority: str,
+        fn: Callable[[CancelToken], Any],
+        *,
+        cancel: Optional[CancelToken] = None,
+        session: Optional[str] = None,
+    ) -> "Future[Any]":
+        """Queue ``fn(token)``; ``token`` is cancelled on preemption or when ``cancel`` is.
+
+        Jobs of the same ``session`` run in order; sessions in a class take turns.
+        """
+
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class '{priority}'; expected one of {PRIORITIES}")
+        job = _Job(
+            priority=priority,
+            fn=fn,
+            cancel=CancelToken(),
+            future=Future(),
+            enqueued=time.monotonic(),
+            session=session or "",
+        )
+        victim: Optional[_Job] = None
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("Scheduler is closed")
+            queue = self._queues[priority]
+            limit = self.config.queue_limits.get(priority)
+            if limit is not None and len(queue) >= limit:
+                self._stats[priority].rejected += 1
+                raise QueueFull(f"{priority} queue is full ({limit} waiting)")
+            queue.append(job)
+            if priority == "interactive" and len(self._running) >= len(self._workers):
+                victim = self._pick_victim_locked()
+            self._cond.notify()
+
+        job.cancel.on_cancel(lambda: self._drop(job))
+        if cancel is not None:
+            # The job token carries the caller's deadline so wrapped kernels can budget retries.
+            unlink = job.cancel.follow(cancel)
+            job.future.add_done_callback(lambda _: unlink())
+        if victim is not None:
+            logger.info("Scheduler: preempting a %s call for an interactive one", victim.priority)
+            victim.cancel.cancel("preempted")
+        return job.future
+
+    def _pick_victim_locked(self) -> Optional[_Job]:
+        candidates = [
+            j for j in self._running if j.priority in self.config.preemptible and not j.cancel.cancelled
+        ]
+        if not candidates:
+            return None
+        # Lowest class first, then the most recently started (least work lost).
+        victim = max(candidates, key=lambda j: (PRIORITIES.index(j.priority), j.started or 0.0))
+        self._stats[victim.priority].preempted += 1
+        return victim
+
+    def _drop(self, job: _Job) -> None:
+        """Cancel hook: a job still queued is removed and fails immediately."""
+
+        with self._cond:
+            if not self._queues[job.priority].remove(job):
+                return  # running (its token stops it) or already finished
+        job.future.set_exception(GenerationCancelled(job.cancel.reason or "cancelled"))
+
+    def _next_job_locked(self) -> Optional[_Job]:
+        now = time.monotonic()
+        starving = [
+            job
+            for job in (q.oldest() for p, q in self._queues.items() if p in self.config.max_wait)
+            if job is not None and now - job.enqueued >= self.config.max_wait[job.priority]
+        ]
+        if starving:
+            job = min(starving, key=lambda j: j.enqueued)
+            self._stats[job.priority].promoted += 1
+        else:
+            job = next((q.next_in_turn() for q in self._queues.values() if q), None)
+            if job is None:
+                return None
+        self._queues[job.priority].remove(job)
+        return job
+
+    def _worker(self) -> None:
+        while True:
+            with self._cond:
+                job = self._next_job_locked()
+                while job is None and not self._closed:
+                    self._cond.wait()
+                    job = self._next_job_locked()
+                if job is None:
+                    return
+                job.started = time.monotonic()
+                self._running.append(job)
+                self._stats[job.priority].waits.append(job.started - job.enqueued)
+            error = False
+            try:
+                job.future.set_result(job.fn(job.cancel))
+            except BaseException as exc:  # delivered to the waiting caller
+                error = True
+                job.future.set_exception(exc)
+            finally:
+                job.cancel.finish()
+                with self._cond:
+                    self._running.remove(job)
+                    stats = self._stats[job.priority]
+                    stats.calls += 1
+                    stats.errors += int(error)
+                    stats.durations.append(time.monotonic() - (job.started or 0.0))
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._cond:
+            result = {p: s.snapshot() for p, s in self._stats.items()}
+            for p, queue in self._queues.items():
+                result[p]["queued"] = len(queue)
+                result[p]["running"] = sum(1 for job in self._running if job.priority == p)
+            return result
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            pending = [job for queue in self._queues.values() for job in queue]
+            for queue in self._queues.values():
+                queue.clear()
+            self._cond.notify_all()
+        for job in pending:
+            job.future.set_exception(RuntimeError("Scheduler closed"))
+
+
+class ScheduledKernel:
+    """Kernel-compatible view that runs ``generate`` through a PriorityScheduler.
+
+    Views for other routes (``for_route``), classes (``with_priority``)
+    and sessions (``for_session``) share the scheduler; only the root
+    view closes it.
+    """
+
+    def __init__(
+        self,
+        kernel: Any,
+        scheduler: PriorityScheduler,
+        *,
+        priority: str = "interactive",
+        session: Optional[str] = None,
+        owner: bool = True,
+    ) -> None:
+        self._kernel = kernel
+        self.scheduler = scheduler
+        self.priority = priority
+        self.session = session
+        self._owner = owner
+
+    @property
+    def config(self) -> Any:
+        return self._kernel.config
+
+    @property
+    def inner(self) -> Any:
+        return self._kernel
+
+    def for_route(self, route: str) -> "ScheduledKernel":
+        return ScheduledKernel(
+            route_kernel(self._kernel, route), self.scheduler, priority=self.priority, session=self.session, owner=False
+        )
+
+    def with_priority(self, priority: str) -> "ScheduledKernel":
+        return ScheduledKernel(self._kernel, self.scheduler, priority=priority, session=self.session, owner=False)
+
+    def for_session(self, session: str) -> "ScheduledKernel":
+        return ScheduledKernel(self._kernel, self.scheduler, priority=self.priority, session=session, owner=False)
+
+    def close(self) -> None:
+        if self._owner:
+            self.scheduler.close()
+            self._kernel.close()
+
+    def generate(
+        self,
+        *,
+        system_prompt: str,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.0,
+        max_tokens: Optional[int] = None,
+        cancel: Optional[CancelToken] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+        usage: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        future = self.scheduler.submit(
+            self.priority,
+            lambda token: self._kernel.generate(
+                system_prompt=system_prompt,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                cancel=token,
+                response_schema=response_schema,
+                usage=usage,
+            ),
+            cancel=cancel,
+            session=self.session,
+        )
+        return future.result()
+
+
+def prioritized(kernel: Any, priority: str) -> Any:
+    """Return ``kernel`` bound to a priority class if it supports one.
+
+    Like ``router.route_kernel``, kernels without a scheduler are
+    returned unchanged.
+    """
+
+    with_priority = getattr(kernel, "with_priority", None)
+    return with_priority(priority) if callable(with_priority) else kernel
+
+
+def for_session(kernel: Any, session: str) -> Any:
+    """Return ``kernel`` bound to a scheduler session if it supports one."""
+
+    bind = getattr(kernel, "for_session", None)
+    return bind(session) if callable(bind) else kernel
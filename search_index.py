@@ -0,0 +1,544 @@
+"""Search_Index module: in-process codebase search for the ``search`` tool.
+
+``agents.yaml`` grants the planner and executor a ``search`` tool. Going
+through ``DeterministicAgent.execute_command`` is not an option (the DCG
+rejects pipes) and would scan every file on every query anyway.
+
+This module keeps a persisted trigram index of the workspace:
+
+- Every text file contributes the set of its (ASCII-lowercased) byte
+  trigrams. Postings are two parallel NumPy ``uint32`` arrays sorted by
+  trigram, so a lookup is two ``searchsorted`` calls.
+- ``refresh`` walks the tree and compares ``(mtime_ns, size)`` with the
+  stored table. Only new or changed files are read; they land in a small
+  sorted delta, saved to its own file. Once the delta grows past a
+  threshold it is merged into the main postings on a background thread,
+  which also compacts the ids of removed or replaced files. A query
+  never rewrites the main postings.
+- A query is reduced to the trigrams it must contain (all of them for a
+  literal; the mandatory literal runs for a regex). Only files holding
+  every such trigram are opened and matched line by line.
+
+Every query is recorded in the Entropy Shield.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:  # Python 3.11+
+    import re._parser as sre_parse  # type: ignore[import-not-found]
+except ImportError:  # pragma: no cover - older interpreters
+    import sre_parse  # type: ignore[no-redef]
+
+from entropy_shield import EntropyShield
+
+logger = logging.getLogger("tools")
+
+DEFAULT_IGNORED_DIRS = frozenset(
+    {".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv", ".mypy_cache", ".pytest_cache", ".tox"}
+)
+
+
+@dataclass
+class SearchMatch:
+    path: str
+    line_number: int
+    line: str
+
+
+# ---------------------------------------------------------------------------
+# Trigram extraction
+# ---------------------------------------------------------------------------
+
+
+def _file_trigrams(data: bytes) -> np.ndarray:
+    """Return the sorted unique trigram codes of ``data`` (ASCII-lowercased)."""
+
+    if len(data) < 3:
+        return np.zeros(0, dtype=np.uint32)
+    raw = np.frombuffer(data, dtype=np.uint8)
+    upper = (raw >= 65) & (raw <= 90)
+    lowered = np.where(upper, raw + 32, raw).astype(np.uint32)
+    codes = (lowered[:-2] << 16) | (lowered[1:-1] << 8) | lowered[2:]
+    return np.unique(codes)
+
+
+def _literal_trigrams(text: bytes) -> Set[int]:
+    lowered = text.lower()
+    return {(lowered[i] << 16) | (lowered[i + 1] << 8) | lowered[i + 2] for i in range(len(lowered) - 2)}
+
+
+def _required_runs(items: Iterable) -> List[bytes]:
+    """Collect literal byte runs that every match of a parsed regex contains."""
+
+    runs: List[bytes] = []
+    current = bytearray()
+
+    def flush() -> None:
+        if current:
+            runs.append(bytes(current))
+            current.clear()
+
+    repeats = ("MAX_REPEAT", "MIN_REPEAT", "POSSESSIVE_REPEAT")
+    for op, arg in items:
+        name = str(op)
+        if name == "LITERAL":
+            current.extend(chr(arg).encode("utf-8"))
+        elif name in repeats and arg[0] >= 1:
+            body = list(arg[2])
+            if len(body) == 1 and str(body[0][0]) == "LITERAL":
+                # "ab+" still guarantees "ab": extend the run, then end it.
+                current.extend(chr(body[0][1]).encode("utf-8"))
+                flush()
+            else:
+                flush()
+                runs.extend(_required_runs(body))
+        elif name == "SUBPATTERN":
+            flush()
+            runs.extend(_required_runs(arg[-1]))
+        else:
+            # Branches, classes, anchors and optional repeats carry no
+            # mandatory literal text.
+            flush()
+    flush()
+    return runs
+
+
+def query_trigrams(query: str, *, regex: bool) -> Set[int]:
+    """Trigrams any matching file must contain (empty set: no constraint)."""
+
+    if not regex:
+        return _literal_trigrams(query.encode("utf-8"))
+    try:
+        parsed = sre_parse.parse(query)
+    except re.error:
+        return set()
+    trigrams: Set[int] = set()
+    for run in _required_runs(parsed):
+        trigrams |= _literal_trigrams(run)
+    return trigrams
+
+
+def _read_trigrams(path: str, max_file_bytes: int) -> Optional[np.ndarray]:
+    try:
+        with open(path, "rb") as f:
+            data = f.read(max_file_bytes + 1)
+    except OSError:
+        return None
+    if len(data) > max_file_bytes or b"\0" in data[:8192]:
+        return None  # too large or binary
+    return _file_trigrams(data)
+
+
+def _read_trigrams_batch(paths: List[str], max_file_bytes: int) -> List[Optional[np.ndarray]]:
+    return [_read_trigrams(p, max_file_bytes) for p in paths]
+
+
+# ---------------------------------------------------------------------------
+# Index
+# ---------------------------------------------------------------------------
+
+
+class TrigramIndex:
+    """Persisted, incrementally refreshed trigram index over a directory.
+
+    Postings are kept in two sorted pairs of arrays. The main pair, in
+    ``postings.npz``, is only rewritten by ``merge``. The delta pair, in
+    ``delta.npz``, holds the postings of files read since the last merge
+    and stays small. ``save`` writes the delta and the file table, never
+    the main postings. ``merge`` folds the delta in and compacts the ids
+    of removed files; it sorts without holding the lock, so it can run
+    on a background thread while queries continue.
+    """
+
+    FORMAT_VERSION = 2
+    DELTA_MERGE_THRESHOLD = 200_000
+    PARALLEL_THRESHOLD = 256
+
+    def __init__(
+        self,
+        root: Path,
+        index_dir: Path,
+        *,
+        ignored_dirs: Iterable[str] = DEFAULT_IGNORED_DIRS,
+        max_file_bytes: int = 2 * 1024 * 1024,
+    ) -> None:
+        self.root = root.resolve()
+        self._index_dir = index_dir
+        self._excluded_dirs = {str(index_dir.resolve())}
+        self._ignored_dirs = frozenset(ignored_dirs)
+        self._max_file_bytes = max_file_bytes
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()  # one walk at a time
+
+        # file id -> (relative path, mtime_ns, size); None for dead ids until the next merge.
+        self._files: List[Optional[Tuple[str, int, int]]] = []
+        self._by_path: Dict[str, int] = {}
+        self._dead = 0
+        self._keys = np.zeros(0, dtype=np.uint32)
+        self._ids = np.zeros(0, dtype=np.uint32)
+        self._delta_keys = np.zeros(0, dtype=np.uint32)
+        self._delta_ids = np.zeros(0, dtype=np.uint32)
+        self._alive = np.zeros(0, dtype=bool)
+        # Bumped by each merge; the three files on disk must agree on it.
+        self._generation = 0
+        self._saved_generation = -1
+        self._revision = 0
+        self._merging = False
+        self._dirty = False
+        self._load()
+
+    # Persistence --------------------------------------------------------------
+
+    @property
+    def _table_path(self) -> Path:
+        return self._index_dir / "files.json"
+
+    @property
+    def _postings_path(self) -> Path:
+        return self._index_dir / "postings.npz"
+
+    @property
+    def _delta_path(self) -> Path:
+        return self._index_dir / "delta.npz"
+
+    def _load(self) -> None:
+        if not (self._table_path.exists() and self._postings_path.exists() and self._delta_path.exists()):
+            return
+        try:
+            table = json.loads(self._table_path.read_text(encoding="utf-8"))
+            if table.get("version") != self.FORMAT_VERSION or table.get("root") != str(self.root):
+                return
+            with np.load(self._postings_path) as postings:
+                keys, ids, generation = postings["keys"], postings["ids"], int(postings["generation"])
+            with np.load(self._delta_path) as delta:
+                delta_keys, delta_ids, alive = delta["keys"], delta["ids"], delta["alive"]
+                stamp = (int(delta["generation"]), int(delta["revision"]))
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning("Search index at %s unreadable, rebuilding: %s", self._index_dir, exc)
+            return
+        if not generation == stamp[0] == table.get("generation") or stamp[1] != table.get("revision"):
+            logger.warning("Search index at %s was saved partially, rebuilding", self._index_dir)
+            return
+        self._files = [tuple(entry) if entry else None for entry in table["files"]]
+        self._by_path = {entry[0]: i for i, entry in enumerate(self._files) if entry}
+        self._dead = len(self._files) - len(self._by_path)
+        self._alive = alive
+        self._keys, self._ids = keys, ids
+        self._delta_keys, self._delta_ids = delta_keys, delta_ids
+        self._generation = self._saved_generation = generation
+        self._revision = stamp[1]
+
+    def _write_postings(self, keys: np.ndarray, ids: np.ndarray, generation: int) -> None:
+        self._index_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self._postings_path.with_suffix(".tmp.npz")
+        np.savez(tmp, keys=keys, ids=ids, generation=np.int64(generation))
+        os.replace(tmp, self._postings_path)
+
+    def save(self) -> None:
+        """Persist the delta and the file table (and the main postings on first save)."""
+
+        with self._lock:
+            if self._saved_generation != self._generation:
+                # Only a brand-new index gets here; merge writes its own postings.
+                self._write_postings(self._keys, self._ids, self._generation)
+                self._saved_generation = self._generation
+            if not self._dirty:
+                return
+            self._revision += 1
+            self._index_dir.mkdir(parents=True, exist_ok=True)
+            tmp_delta = self._delta_path.with_suffix(".tmp.npz")
+            np.savez(
+                tmp_delta,
+                keys=self._delta_keys,
+                ids=self._delta_ids,
+                alive=self._alive,
+                generation=np.int64(self._generation),
+                revision=np.int64(self._revision),
+            )
+            os.replace(tmp_delta, self._delta_path)
+            tmp_table = self._table_path.with_suffix(".tmp")
+            tmp_table.write_text(
+                json.dumps(
+                    {
+                        "version": self.FORMAT_VERSION,
+                        "root": str(self.root),
+                        "generation": self._generation,
+                        "revision": self._revision,
+                        "files": self._files,
+                    }
+                ),
+                encoding="utf-8",
+            )
+            os.replace(tmp_table, self._table_path)
+            self._dirty = False
+
+    # Maintenance --------------------------------------------------------------
+
+    def _walk(self) -> Dict[str, Tuple[int, int]]:
+        found: Dict[str, Tuple[int, int]] = {}
+        prefix = len(str(self.root).rstrip(os.sep)) + 1
+        stack = [str(self.root)]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        if entry.name not in self._ignored_dirs and entry.path not in self._excluded_dirs:
+                            stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        st = entry.stat(follow_symlinks=False)
+                        if st.st_size <= self._max_file_bytes:
+                            found[entry.path[prefix:]] = (st.st_mtime_ns, st.st_size)
+                except OSError:
+                    continue
+        return found
+
+    def _retire(self, file_id: int) -> None:
+        entry = self._files[file_id]
+        if entry is not None:
+            self._by_path.pop(entry[0], None)
+            self._dead += 1
+        self._files[file_id] = None
+        self._alive[file_id] = False
+
+    def refresh(self) -> int:
+        """Re-index new and changed files; return how many were (re)read."""
+
+        with self._refresh_lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        on_disk = self._walk()
+        with self._lock:
+            stale = [
+                rel
+                for rel, signature in on_disk.items()
+                if rel not in self._by_path or tuple(self._files[self._by_path[rel]][1:]) != signature
+            ]
+            removed = [rel for rel in self._by_path if rel not in on_disk]
+
+        paths = [str(self.root / rel) for rel in stale]
+        if len(paths) >= self.PARALLEL_THRESHOLD:
+            chunk = max(64, len(paths) // ((os.cpu_count() or 1) * 4))
+            batches = [paths[i : i + chunk] for i in range(0, len(paths), chunk)]
+            with ProcessPoolExecutor() as pool:
+                limits = [self._max_file_bytes] * len(batches)
+                results = [r for batch in pool.map(_read_trigrams_batch, batches, limits) for r in batch]
+        else:
+            results = [_read_trigrams(p, self._max_file_bytes) for p in paths]
+
+        with self._lock:
+            for rel in removed:
+                if rel in self._by_path:
+                    self._retire(self._by_path[rel])
+            for rel in stale:
+                if rel in self._by_path:
+                    self._retire(self._by_path[rel])
+
+            grown = np.zeros(len(self._files) + len(stale), dtype=bool)
+            grown[: len(self._alive)] = self._alive
+            self._alive = grown
+            new_keys: List[np.ndarray] = [self._delta_keys]
+            new_ids: List[np.ndarray] = [self._delta_ids]
+            for rel, trigrams in zip(stale, results):
+                file_id = len(self._files)
+                mtime_ns, size = on_disk[rel]
+                self._files.append((rel, mtime_ns, size))
+                self._by_path[rel] = file_id
+                self._alive[file_id] = trigrams is not None
+                if trigrams is not None and trigrams.size:
+                    new_keys.append(trigrams)
+                    new_ids.append(np.full(trigrams.size, file_id, dtype=np.uint32))
+            if len(new_keys) > 1:
+                # The delta is small; keeping it sorted makes a lookup two searchsorted calls.
+                keys = np.concatenate(new_keys).astype(np.uint32)
+                ids = np.concatenate(new_ids).astype(np.uint32)
+                keep = self._alive[ids]
+                keys, ids = keys[keep], ids[keep]
+                order = np.lexsort((ids, keys))
+                self._delta_keys, self._delta_ids = keys[order], ids[order]
+
+            if stale or removed:
+                self._dirty = True
+        logger.debug("Search index refresh: %d read, %d removed", len(stale), len(removed))
+        return len(stale)
+
+    @property
+    def needs_merge(self) -> bool:
+        """True once the delta or the dead file ids have grown enough to fold away."""
+
+        with self._lock:
+            return not self._merging and (
+                self._delta_keys.size >= self.DELTA_MERGE_THRESHOLD or self._dead > max(1024, len(self._files) // 4)
+            )
+
+    def merge(self) -> None:
+        """Fold the delta into the main postings and compact dead file ids.
+
+        Only files known when the merge starts are folded in; files read
+        while it sorts stay in the delta. Queries keep using the old
+        arrays until the merged ones are swapped in under the lock.
+        """
+
+        with self._lock:
+            if self._merging:
+                return
+            self._merging = True
+            keys, ids = self._keys, self._ids
+            delta_keys, delta_ids = self._delta_keys, self._delta_ids
+            alive = self._alive.copy()
+            known = len(self._files)
+        try:
+            all_keys = np.concatenate([keys, delta_keys]).astype(np.uint32)
+            all_ids = np.concatenate([ids, delta_ids]).astype(np.uint32)
+            keep = alive[all_ids]
+            all_keys, all_ids = all_keys[keep], all_ids[keep]
+            order = np.lexsort((all_ids, all_keys))
+            all_keys, all_ids = all_keys[order], all_ids[order]
+
+            with self._lock:
+                keep = self._alive[all_ids]  # files retired while sorting
+                live = np.fromiter((entry is not None for entry in self._files), dtype=bool, count=len(self._files))
+                # Ids only ever shrink for live files, so the remap keeps both pairs sorted.
+                remap = (np.cumsum(live) - 1).astype(np.uint32)
+                self._keys, self._ids = all_keys[keep], remap[all_ids[keep]]
+                newer = (self._delta_ids >= known) & self._alive[self._delta_ids]
+                self._delta_keys, self._delta_ids = self._delta_keys[newer], remap[self._delta_ids[newer]]
+                self._files = [entry for entry in self._files if entry is not None]
+                self._by_path = {entry[0]: i for i, entry in enumerate(self._files)}
+                self._alive = self._alive[live]
+                self._dead = 0
+                self._generation += 1
+                # Written below, outside the lock; a crash before it is caught on load.
+                self._saved_generation = self._generation
+                self._dirty = True
+                merged = (self._keys, self._ids, self._generation)
+            self._write_postings(*merged)
+            self.save()
+            logger.debug("Search index merged: %d postings, %d files", merged[0].size, len(self._files))
+        finally:
+            with self._lock:
+                self._merging = False
+
+    # Queries ------------------------------------------------------------------
+
+    def _files_with(self, trigram: int) -> np.ndarray:
+        found = _slice(self._keys, self._ids, trigram)
+        extra = _slice(self._delta_keys, self._delta_ids, trigram)
+        return np.union1d(found, extra) if extra.size else found
+
+    def candidates(self, trigrams: Set[int]) -> List[str]:
+        """Relative paths of live files containing every trigram."""
+
+        with self._lock:
+            if not trigrams:
+                ids = np.flatnonzero(self._alive)
+            else:
+                ids = None
+                for trigram in sorted(trigrams, key=lambda t: self._files_with(t).size):
+                    files = self._files_with(trigram)
+                    ids = files if ids is None else np.intersect1d(ids, files, assume_unique=True)
+                    if ids.size == 0:
+                        return []
+                ids = ids[self._alive[ids]]
+            return [self._files[int(i)][0] for i in ids]
+
+    def search(
+        self, query: str, *, regex: bool = False, ignore_case: bool = False, max_results: int = 200
+    ) -> List[SearchMatch]:
+        flags = re.IGNORECASE if ignore_case else 0
+        pattern = re.compile(query if regex else re.escape(query), flags)
+        matches: List[SearchMatch] = []
+        for rel in sorted(self.candidates(query_trigrams(query, regex=regex))):
+            try:
+                with open(self.root / rel, "r", encoding="utf-8", errors="replace") as f:
+                    for number, line in enumerate(f, start=1):
+                        if pattern.search(line):
+                            matches.append(SearchMatch(path=rel, line_number=number, line=line.rstrip("\n")))
+                            if len(matches) >= max_results:
+                                return matches
+            except OSError:
+                continue
+        return matches
+
+    def __len__(self) -> int:
+        return int(self._alive.sum())
+
+
+def _slice(keys: np.ndarray, ids: np.ndarray, code: int) -> np.ndarray:
+    # A bare Python int would make searchsorted upcast the whole array per call.
+    code = np.uint32(code)
+    lo = np.searchsorted(keys, code, side="left")
+    hi = np.searchsorted(keys, code, side="right")
+    return ids[lo:hi]
+
+
+# ---------------------------------------------------------------------------
+# Tool facade
+# ---------------------------------------------------------------------------
+
+
+class SearchTool:
+    """The ``search`` tool from ``agents.yaml``, backed by a TrigramIndex.
+
+    The index is refreshed from file mtimes at most once every
+    ``max_staleness`` seconds, so bursts of queries pay for one walk.
+    Merges run on a background thread after the query that triggers them.
+    """
+
+    def __init__(self, *, root: Path, shield: EntropyShield, index_dir: Path, max_staleness: float = 2.0) -> None:
+        self._index = TrigramIndex(root, index_dir)
+        self._shield = shield
+        self._max_staleness = max_staleness
+        self._last_refresh = float("-inf")
+        self._merger: Optional[threading.Thread] = None
+
+    def search(
+        self, query: str, *, regex: bool = False, ignore_case: bool = False, max_results: int = 200
+    ) -> List[SearchMatch]:
+        if not query:
+            raise RuntimeError("search: empty query rejected")
+        start = time.perf_counter()
+        if time.monotonic() - self._last_refresh >= self._max_staleness:
+            self._index.refresh()
+            self._index.save()
+            self._last_refresh = time.monotonic()
+            if self._index.needs_merge and (self._merger is None or not self._merger.is_alive()):
+                self._merger = threading.Thread(target=self._index.merge, name="search-merge", daemon=True)
+                self._merger.start()
+        matches = self._index.search(query, regex=regex, ignore_case=ignore_case, max_results=max_results)
+        elapsed_ms = (time.perf_counter() - start) * 1000.0
+        self._shield.record_search(
+            query=query,
+            root=str(self._index.root),
+            regex=regex,
+            match_count=len(matches),
+            duration_ms=round(elapsed_ms, 3),
+        )
+        return matches
+
+
+def format_matches(matches: List[SearchMatch], *, limit: int = 50) -> str:
+    if not matches:
+        return "<no matches>"
+    lines = [f"{m.path}:{m.line_number}: {m.line.strip()}" for m in matches[:limit]]
+    if len(matches) > limit:
+        lines.append(f"... {len(matches) - limit} more")
+    return "\n".join(lines)
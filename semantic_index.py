@@ -0,0 +1,399 @@
+"""Semantic_Index module: opt-in local memory of prompts, responses and outputs.
+
+The Zero Entropy Ledger stores only hashes, so there is no way to find
+"the last time we fixed this error". This module keeps an opt-in content
+store next to the ledger and a NumPy-backed approximate nearest
+neighbour index over embeddings of that content.
+
+- Embeddings come from Ollama's local ``/api/embed`` endpoint. Any
+  object with an ``embed(texts)`` method can stand in for it; the
+  ``HashingEmbedder`` needs no model at all.
+- The index uses random-hyperplane locality sensitive hashing. The
+  hyperplanes are derived from a fixed seed, so the same vectors always
+  land in the same buckets. A query scores only the vectors in buckets
+  within Hamming distance one of its own, and falls back to an exact
+  scan when that yields too few candidates. A kind filter is applied to
+  the candidates before the top ``k`` are chosen.
+- Everything is persisted append-only under ``<log_dir>/semantic``:
+  ``records.jsonl`` for content and ``vectors.f32`` for raw float32
+  vectors. New entries are appended; nothing is rewritten.
+
+Requires NumPy.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Protocol, Sequence
+
+import numpy as np
+
+logger = logging.getLogger("tools")
+
+
+# ---------------------------------------------------------------------------
+# Embedders
+# ---------------------------------------------------------------------------
+
+
+class Embedder(Protocol):
+    """Anything that turns texts into fixed-length vectors."""
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        """Return one vector per input text."""
+
+
+class OllamaEmbedder:
+    """Embeddings from the local Ollama ``/api/embed`` endpoint."""
+
+    def __init__(
+        self, *, base_url: str = "http://localhost:11434", model: str = "nomic-embed-text", timeout: float = 30.0
+    ) -> None:
+        import httpx
+
+        self.model = model
+        self._client = httpx.Client(base_url=base_url, timeout=timeout)
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        response = self._client.post("/api/embed", json={"model": self.model, "input": list(texts)})
+        response.raise_for_status()
+        data = response.json()
+        try:
+            return data["embeddings"]
+        except (KeyError, TypeError) as exc:
+            logger.error("Unexpected embedding response structure: %s", data)
+            raise RuntimeError("Embedding response shape mismatch") from exc
+
+    def close(self) -> None:
+        self._client.close()
+
+
+class HashingEmbedder:
+    """Deterministic bag-of-tokens embedder that needs no model.
+
+    Useful offline and as a stub: texts sharing tokens get similar
+    vectors, which is enough to find repeated error messages.
+    """
+
+    _TOKEN = re.compile(r"[A-Za-z0-9_./-]+")
+
+    def __init__(self, dim: int = 256) -> None:
+        self.dim = dim
+
+    def embed(self, texts: Sequence[str]) -> List[List[float]]:
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in self._TOKEN.findall(text.lower()):
+                digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+                bucket = int.from_bytes(digest[:4], "little") % self.dim
+                sign = 1.0 if digest[4] & 1 else -1.0
+                vectors[row, bucket] += sign
+        return vectors.tolist()
+
+
+# ---------------------------------------------------------------------------
+# Vector index
+# ---------------------------------------------------------------------------
+
+
+class VectorIndex:
+    """Append-only LSH index over L2-normalized float32 vectors."""
+
+    def __init__(self, path: Path, *, dim: Optional[int] = None, n_planes: int = 12, seed: int = 0) -> None:
+        self._path = path
+        self._n_planes = n_planes
+        self._seed = seed
+        self._lock = threading.Lock()
+        self.dim = dim
+        self._vectors = np.zeros((0, dim or 0), dtype=np.float32)
+        self._codes = np.zeros(0, dtype=np.int64)
+        self._buckets: Dict[int, List[int]] = {}
+        self._planes: Optional[np.ndarray] = None
+        self._capacity = 0
+        self._size = 0
+        if path.exists() and dim:
+            self._load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _init_planes(self) -> None:
+        rng = np.random.default_rng(self._seed)
+        self._planes = rng.standard_normal((self.dim, self._n_planes)).astype(np.float32)
+
+    def _load(self) -> None:
+        raw = np.fromfile(self._path, dtype=np.float32)
+        usable = (raw.size // self.dim) * self.dim
+        self._append_in_memory(raw[:usable].reshape(-1, self.dim))
+
+    def truncate(self, count: int) -> None:
+        """Keep only the first ``count`` vectors (recovery after a torn write)."""
+
+        with self._lock:
+            if count >= self._size:
+                return
+            kept = self._vectors[:count].copy()
+            kept.tofile(self._path)
+            self._capacity = 0
+            self._size = 0
+            self._buckets.clear()
+            self._append_in_memory(kept)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32)
+
+    def _hash(self, vectors: np.ndarray) -> np.ndarray:
+        bits = (vectors @ self._planes) > 0
+        weights = 1 << np.arange(self._n_planes, dtype=np.int64)
+        return bits.astype(np.int64) @ weights
+
+    def _append_in_memory(self, vectors: np.ndarray) -> None:
+        if self._planes is None:
+            self._init_planes()
+        count = len(vectors)
+        if self._size + count > self._capacity:
+            self._capacity = max(1024, 2 * (self._size + count))
+            grown = np.zeros((self._capacity, self.dim), dtype=np.float32)
+            grown[: self._size] = self._vectors[: self._size]
+            self._vectors = grown
+            codes = np.zeros(self._capacity, dtype=np.int64)
+            codes[: self._size] = self._codes[: self._size]
+            self._codes = codes
+        new_codes = self._hash(vectors) if count else np.zeros(0, dtype=np.int64)
+        self._vectors[self._size : self._size + count] = vectors
+        self._codes[self._size : self._size + count] = new_codes
+        for offset, code in enumerate(new_codes.tolist()):
+            self._buckets.setdefault(code, []).append(self._size + offset)
+        self._size += count
+
+    def add(self, vectors: Sequence[Sequence[float]]) -> List[int]:
+        """Normalize, persist and index ``vectors``; return their row ids."""
+
+        array = np.asarray(vectors, dtype=np.float32)
+        with self._lock:
+            if self.dim is None:
+                self.dim = array.shape[1]
+                self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+            if array.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {array.shape[1]} does not match index dimension {self.dim}")
+            normalized = self._normalize(array)
+            first = self._size
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            with self._path.open("ab") as f:
+                normalized.tofile(f)
+            self._append_in_memory(normalized)
+            return list(range(first, self._size))
+
+    def search(
+        self, vector: Sequence[float], k: int = 5, *, min_candidates: int = 32, mask: Optional[np.ndarray] = None
+    ) -> List[tuple]:
+        """Return up to ``k`` ``(row_id, cosine_similarity)`` pairs, best first.
+
+        With a boolean ``mask`` over row ids, only rows where it is true
+        are considered (rows past its end are not), before the top ``k``
+        are chosen.
+        """
+
+        with self._lock:
+            if self._size == 0:
+                return []
+            query = self._normalize(np.asarray([vector], dtype=np.float32))
+            code = int(self._hash(query)[0])
+            probe = [code] + [code ^ (1 << bit) for bit in range(self._n_planes)]
+            candidates = np.asarray([row for c in probe for row in self._buckets.get(c, ())], dtype=np.int64)
+            if mask is not None:
+                candidates = candidates[candidates < len(mask)]
+                candidates = candidates[mask[candidates]]
+            if len(candidates) < max(k, min_candidates):
+                rows = np.arange(self._size) if mask is None else np.flatnonzero(mask[: self._size])
+            else:
+                rows = candidates
+            scores = self._vectors[rows] @ query[0]
+            top = np.argsort(-scores)[:k]
+            return [(int(rows[i]), float(scores[i])) for i in top]
+
+
+# ---------------------------------------------------------------------------
+# Content store + facade
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class MemoryRecord:
+    id: int
+    kind: str
+    timestamp: str
+    prompt: str
+    response: str
+    exit_code: Optional[int] = None
+
+
+@dataclass
+class MemoryHit:
+    score: float
+    record: MemoryRecord
+
+
+class SemanticMemory:
+    """Opt-in store of prompts/responses and command outputs with vector search.
+
+    ``remember_*`` calls return immediately; embedding and indexing run
+    on one background thread so the dashboards never wait on them.
+    """
+
+    EMBED_CHARS = 4000
+
+    def __init__(self, root_dir: Path, *, embedder: Embedder) -> None:
+        self._root = root_dir / "semantic"
+        self._root.mkdir(parents=True, exist_ok=True)
+        self._records_path = self._root / "records.jsonl"
+        self._meta_path = self._root / "meta.json"
+        self._embedder = embedder
+        self._records: List[MemoryRecord] = []
+        # Kind of each record as a small integer, so a kind filter is one vectorized compare.
+        self._kind_codes: Dict[str, int] = {}
+        self._row_kinds = np.zeros(0, dtype=np.int32)
+        self._lock = threading.Lock()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-index")
+        # The dashboards search and then consult best_match for the same
+        # prompt; keep the last few query embeddings to avoid a second call.
+        self._query_cache: "OrderedDict[str, List[float]]" = OrderedDict()
+
+        dim = None
+        if self._meta_path.exists():
+            dim = json.loads(self._meta_path.read_text(encoding="utf-8")).get("dim")
+        self._index = VectorIndex(self._root / "vectors.f32", dim=dim)
+        self._load_records()
+        logger.debug("SemanticMemory loaded %d records from %s", len(self._records), self._root)
+
+    def _load_records(self) -> None:
+        if not self._records_path.exists():
+            return
+        with self._records_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    self._records.append(MemoryRecord(**json.loads(line)))
+                except (json.JSONDecodeError, TypeError):
+                    logger.warning("Skipping malformed semantic record: %s", line[:200])
+        # Records and vectors are appended in lockstep; a crash between the
+        # two writes leaves one side longer. Keep the common prefix.
+        count = min(len(self._records), len(self._index))
+        self._index.truncate(count)
+        if len(self._records) > count:
+            self._records = self._records[:count]
+            with self._records_path.open("w", encoding="utf-8") as f:
+                for record in self._records:
+                    f.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+        self._row_kinds = np.asarray([self._kind_code(r.kind) for r in self._records], dtype=np.int32)
+
+    def _kind_code(self, kind: str) -> int:
+        return self._kind_codes.setdefault(kind, len(self._kind_codes))
+
+    def _append_kind(self, kind: str) -> None:
+        row = len(self._records)
+        if row >= len(self._row_kinds):
+            grown = np.zeros(max(1024, 2 * len(self._row_kinds)), dtype=np.int32)
+            grown[:row] = self._row_kinds[:row]
+            self._row_kinds = grown
+        self._row_kinds[row] = self._kind_code(kind)
+
+    # Writing ------------------------------------------------------------------
+
+    def _store(self, kind: str, prompt: str, response: str, exit_code: Optional[int]) -> None:
+        vector = self._embedder.embed([(prompt + "\n" + response)[: self.EMBED_CHARS]])[0]
+        with self._lock:
+            record = MemoryRecord(
+                id=len(self._records),
+                kind=kind,
+                timestamp=datetime.now(timezone.utc).isoformat(),
+                prompt=prompt,
+                response=response,
+                exit_code=exit_code,
+            )
+            if not self._meta_path.exists():
+                self._meta_path.write_text(json.dumps({"dim": len(vector)}), encoding="utf-8")
+            self._index.add([vector])
+            with self._records_path.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(asdict(record), ensure_ascii=False) + "\n")
+            self._append_kind(kind)
+            self._records.append(record)
+
+    def _submit(self, kind: str, prompt: str, response: str, exit_code: Optional[int] = None) -> None:
+        def task() -> None:
+            try:
+                self._store(kind, prompt, response, exit_code)
+            except Exception as exc:  # memory is best-effort; the ledger is authoritative
+                logger.warning("Semantic memory failed to index %s entry: %s", kind, exc)
+
+        self._writer.submit(task)
+
+    def remember_completion(self, *, kind: str, prompt: str, response: str) -> None:
+        self._submit(kind, prompt, response)
+
+    def remember_command(self, *, command: str, output: str, exit_code: Optional[int]) -> None:
+        self._submit("command", command, output, exit_code)
+
+    # Reading ------------------------------------------------------------------
+
+    def _embed_query(self, text: str) -> List[float]:
+        with self._lock:
+            cached = self._query_cache.get(text)
+        if cached is not None:
+            return cached
+        vector = self._embedder.embed([text])[0]
+        with self._lock:
+            self._query_cache[text] = vector
+            while len(self._query_cache) > 8:
+                self._query_cache.popitem(last=False)
+        return vector
+
+    def search(self, text: str, *, k: int = 5, kind: Optional[str] = None) -> List[MemoryHit]:
+        """Return the ``k`` most similar records, optionally of one kind."""
+
+        if len(self._index) == 0:
+            return []
+        vector = self._embed_query(text[: self.EMBED_CHARS])
+        mask = None
+        if kind is not None:
+            with self._lock:
+                if kind not in self._kind_codes:
+                    return []
+                mask = self._row_kinds[: len(self._records)] == self._kind_codes[kind]
+        raw = self._index.search(vector, k=k, mask=mask)
+        with self._lock:
+            return [MemoryHit(score=score, record=self._records[row]) for row, score in raw if row < len(self._records)]
+
+    def best_match(self, text: str, *, kind: Optional[str] = None) -> Optional[MemoryHit]:
+        hits = self.search(text, k=1, kind=kind)
+        return hits[0] if hits else None
+
+    def flush(self) -> None:
+        """Block until queued entries are indexed."""
+
+        self._writer.submit(lambda: None).result()
+
+    def close(self) -> None:
+        self._writer.shutdown(wait=True)
+        closer = getattr(self._embedder, "close", None)
+        if callable(closer):
+            closer()
+
+
+def describe_hit(hit: MemoryHit, *, max_chars: int = 400) -> str:
+    record = hit.record
+    return f"[{record.timestamp}] {record.prompt[:max_chars]}\n→ {record.response[:max_chars]}"
+
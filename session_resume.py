@@ -0,0 +1,107 @@
+"""Session_Resume module: rebuild dashboard context from the ledger tail.
+
+A relaunched dashboard used to start with an empty Thought Stream and
+no last command, so ``!explain`` and ``!fix`` had nothing to work on.
+``resume_session`` reads only the last ``limit`` events, using
+``EntropyShield.tail_events``, which seeks backward from the end of the
+ledger. Startup cost therefore does not grow with the ledger.
+
+Model replies are not in the ledger (only their hashes), so model calls
+resume as one-line summaries. The last shell command's stdout and stderr
+are restored from the blob store when they were stored (``--store-outputs``),
+up to ``max_output_bytes`` each.
+"""
+
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from blob_store import BlobStore
+    from entropy_shield import LedgerEvent
+
+logger = logging.getLogger("orchestrator")
+
+DEFAULT_RESUME_EVENTS = 50
+
+
+@dataclass
+class ResumedSession:
+    # (source, content) pairs for the Thought Stream, oldest first
+    events: List[Tuple[str, str]] = field(default_factory=list)
+    last_shell_command: Optional[str] = None
+    last_stdout: Optional[str] = None
+    last_stderr: Optional[str] = None
+    last_exit_code: Optional[int] = None
+
+
+def _read_blob(blobs: Optional["BlobStore"], digest: Optional[str], max_bytes: int) -> Optional[str]:
+    if blobs is None or not digest:
+        return None
+    try:
+        with blobs.open(digest) as stream:
+            return stream.read(max_bytes).decode("utf-8", errors="replace")
+    except Exception as exc:  # missing or unreadable blob: resume without it
+        logger.debug("Resume: output blob %s unavailable: %s", digest, exc)
+        return None
+
+
+def _describe(event: "LedgerEvent") -> Optional[Tuple[str, str]]:
+    p: Dict[str, Any] = event.payload
+    if event.kind == "command":
+        return "user", p.get("command", "")
+    if event.kind == "job" and p.get("action") == "finish":
+        return f"job[{p.get('job_id')}]", f"{p.get('state')} exit={p.get('exit_code')} {p.get('command', '')}"
+    if event.kind == "kernel_call":
+        if p.get("recalled_from") is not None:
+            return "model", f"reply recalled from memory #{p['recalled_from']} (similarity {p.get('similarity')})"
+        details = [p.get("status") or "ok"]
+        if p.get("speculative"):
+            details.insert(0, "speculative")
+        if p.get("duration_ms") is not None:
+            details.append(f"{p['duration_ms'] / 1000:.1f}s")
+        if p.get("completion_tokens") is not None:
+            details.append(f"{p['completion_tokens']} tokens")
+        return "model", f"call {' '.join(details)} (reply not kept in the ledger)"
+    if event.kind == "file_change":
+        return "file", f"{p.get('path')} {'patched' if p.get('patch') else 'changed'}"
+    if event.kind == "file_batch":
+        return "file", f"{p.get('count')} files written"
+    if event.kind == "search":
+        return "search", f"'{p.get('query')}': {p.get('match_count')} matches"
+    return None
+
+
+def resume_session(
+    shield: Any,
+    *,
+    limit: int = DEFAULT_RESUME_EVENTS,
+    blobs: Optional["BlobStore"] = None,
+    max_output_bytes: int = 64 * 1024,
+) -> ResumedSession:
+    """Context of the previous session from the last ``limit`` ledger events."""
+
+    session = ResumedSession()
+    events = shield.tail_events(limit)
+    if not events:
+        return session
+    last_command: Optional["LedgerEvent"] = None
+    for event in events:
+        described = _describe(event)
+        if described is not None:
+            session.events.append(described)
+        if event.kind == "command":
+            last_command = event
+            exit_code = event.payload.get("exit_code")
+            if exit_code:
+                session.events.append(("shell", f"exit={exit_code}"))
+    if last_command is not None:
+        p = last_command.payload
+        session.last_shell_command = p.get("command")
+        session.last_exit_code = p.get("exit_code")
+        session.last_stdout = _read_blob(blobs, p.get("stdout_hash"), max_output_bytes)
+        session.last_stderr = _read_blob(blobs, p.get("stderr_hash"), max_output_bytes)
+    session.events.insert(0, ("resume", f"Resumed {len(events)} event(s), the last at {events[-1].timestamp}."))
+    return session
@@ -11,26 +11,78 @@ Run: python textual_dashboard.py
 from __future__ import annotations
 
 import asyncio
+import functools
 import logging
+from bisect import bisect_right
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List, Optional
+from typing import TYPE_CHECKING, Any, Awaitable, Callable, Dict, List, Optional
 
+from rich.cells import chop_cells
+from rich.segment import Segment
+from rich.style import Style
 from rich.text import Text
+from textual import events
 from textual.app import ComposeResult, RenderableType
 from textual.containers import Container, Horizontal, Vertical
 from textual.widgets import Footer, Header, Static, Input
 from textual.reactive import reactive
 from textual.app import App
 from textual.binding import Binding
+from textual.geometry import Size
+from textual.scroll_view import ScrollView
+from textual.strip import Strip
+from textual.suggester import Suggester
 
 from entropy_shield import EntropyShield
-from kernel import Kernel
+from kernel import CancelToken, GenerationCancelled, Kernel
 from deterministic_agent import DeterministicAgent
-from law_core import law_guarded_completion
+from diagnostics import CommandProfiler, collect_stats
+from history import CommandHistory, HistoryRecall
+from jobs import JobError, JobTable, background_command, parse_job_id
+from law_core import DEFAULT_DEADLINES, DEFAULT_TOKEN_BUDGETS, describe_fix, law_guarded_completion
+from prefetch import SpeculativePrefetcher, complete_with_prefetch
+from router import route_kernel
+from session_resume import resume_session
+
+if TYPE_CHECKING:
+    from semantic_index import SemanticMemory
 
 logger = logging.getLogger("axiom_tui")
 
+COMMAND_HELP = """\
+!ai <question>      chat with the model about the session
+!explain            explain the last command's output
+!fix                diagnose the last failure and propose a fix
+!search <text>      search the workspace (re:<pattern> for a regex)
+!bg <cmd> / cmd &   run a command as a background job
+!jobs               list jobs; !fg <id> waits for one, !kill <id> stops it
+!stats              cache, model and ledger statistics
+!profile [N|off]    profile the next N commands
+!analytics [DAYS]   report over the whole ledger
+!snapshot           snapshot the workspace and check it against the ledger
+!help               show this list
+exit / quit         leave the dashboard"""
+
+
+def _fold_line(line: str, width: int) -> List[str]:
+    """Split one line into rows of at most ``width`` terminal cells."""
+
+    line = line.expandtabs(4)
+    if line.isascii():
+        return [line[i:i + width] for i in range(0, max(len(line), 1), width)]
+    return chop_cells(line, width) or [""]
+
+
+def _line_rows(line: str, width: int) -> int:
+    """Row count of ``_fold_line(line, width)`` without building the ASCII rows."""
+
+    line = line.expandtabs(4)
+    if line.isascii():
+        return max(1, -(-len(line) // width))
+    return max(1, len(chop_cells(line, width)))
+
 
 @dataclass
 class ThoughtEvent:
@@ -42,33 +94,146 @@ class ThoughtEvent:
 class UIState:
     thought_stream: List[ThoughtEvent] = field(default_factory=list)
     last_command: Optional[str] = None
+    last_shell_command: Optional[str] = None
     last_stdout: Optional[str] = None
     last_stderr: Optional[str] = None
     last_exit_code: Optional[int] = None
 
 
-class ThoughtStreamWidget(Static):
-    """Renders the thought stream with syntax highlighting."""
+class ThoughtStreamWidget(ScrollView):
+    """Virtualized, scrollable view of the full thought stream.
+
+    Only the rows currently in the viewport are rendered. Each event is
+    folded to the content width once; a cumulative row index maps a
+    screen row back to its event with a binary search, so appending is
+    O(1) and scrolling through tens of thousands of events stays cheap.
+    Rows are counted and folded by terminal cells after tab expansion,
+    so wide characters cannot push the index out of step. Content is
+    never truncated.
+    """
 
     DEFAULT_CSS = """
     ThoughtStreamWidget {
         border: solid $accent;
         height: 70%;
+        overflow-x: hidden;
+        overflow-y: auto;
     }
     """
 
-    stream: reactive[List[ThoughtEvent]] = reactive([])
+    SOURCE_WIDTH = 20
+    FOLD_CACHE_SIZE = 512
 
-    def render(self) -> RenderableType:
-        from rich.table import Table
-        table = Table(show_header=True, header_style="bold cyan")
-        table.add_column("Source", style="magenta", width=20)
-        table.add_column("Content", style="white")
-        
-        for event in self.stream[-20:]:
-            table.add_row(event.source, event.content[:100] + ("..." if len(event.content) > 100 else ""))
-        
-        return table
+    def __init__(self, *, id: Optional[str] = None) -> None:
+        super().__init__(id=id)
+        self.border_title = "Thought Stream"
+        self._events: List[ThoughtEvent] = []
+        self._row_starts: List[int] = []
+        self._total_rows = 0
+        self._content_width = 0
+        self._folded: "OrderedDict[int, List[str]]" = OrderedDict()
+
+    # Feeding events -------------------------------------------------------
+
+    def sync(self, events: List[ThoughtEvent]) -> None:
+        """Bring the view in line with ``events``, appending only new ones."""
+
+        if len(events) < len(self._events) or (self._events and events[0] is not self._events[0]):
+            self.clear()
+        self._extend(events[len(self._events):])
+
+    def append(self, event: ThoughtEvent) -> None:
+        self._extend([event])
+
+    def _extend(self, new_events: List[ThoughtEvent]) -> None:
+        if not new_events:
+            return
+        follow = self.scroll_y >= self.max_scroll_y
+        for event in new_events:
+            self._events.append(event)
+            self._row_starts.append(self._total_rows)
+            self._total_rows += self._row_count(event)
+        self._update_virtual_size()
+        if follow:
+            self.scroll_end(animate=False)
+        self.refresh()
+
+    def clear(self) -> None:
+        self._events.clear()
+        self._row_starts.clear()
+        self._total_rows = 0
+        self._folded.clear()
+        self._update_virtual_size()
+        self.scroll_home(animate=False)
+        self.refresh()
+
+    # Layout ---------------------------------------------------------------
+
+    def _width_for_content(self) -> int:
+        return max(1, self.scrollable_content_region.width - self.SOURCE_WIDTH - 1)
+
+    def _row_count(self, event: ThoughtEvent) -> int:
+        width = self._content_width or self._width_for_content()
+        return sum(_line_rows(line, width) for line in event.content.split("\n"))
+
+    def _reindex(self) -> None:
+        self._content_width = self._width_for_content()
+        self._folded.clear()
+        self._row_starts = []
+        total = 0
+        for event in self._events:
+            self._row_starts.append(total)
+            total += self._row_count(event)
+        self._total_rows = total
+        self._update_virtual_size()
+
+    def _update_virtual_size(self) -> None:
+        self.virtual_size = Size(self.scrollable_content_region.width, self._total_rows)
+
+    def on_resize(self, event: events.Resize) -> None:
+        if self._width_for_content() != self._content_width:
+            follow = self.scroll_y >= self.max_scroll_y
+            self._reindex()
+            if follow:
+                self.scroll_end(animate=False)
+        self.refresh()
+
+    def _fold(self, index: int) -> List[str]:
+        rows = self._folded.get(index)
+        if rows is not None:
+            self._folded.move_to_end(index)
+            return rows
+        width = self._content_width or self._width_for_content()
+        rows = []
+        for line in self._events[index].content.split("\n"):
+            rows.extend(_fold_line(line, width))
+        self._folded[index] = rows
+        while len(self._folded) > self.FOLD_CACHE_SIZE:
+            self._folded.popitem(last=False)
+        return rows
+
+    # Line API -------------------------------------------------------------
+
+    def render_line(self, y: int) -> Strip:
+        _, scroll_y = self.scroll_offset
+        row = scroll_y + y
+        width = self.scrollable_content_region.width
+        base_style = self.rich_style
+        if row >= self._total_rows or not self._events:
+            return Strip.blank(width, base_style)
+
+        index = bisect_right(self._row_starts, row) - 1
+        local_row = row - self._row_starts[index]
+        rows = self._fold(index)
+        content = rows[local_row] if local_row < len(rows) else ""
+        source = self._events[index].source if local_row == 0 else ""
+
+        segments = [
+            Segment(source[: self.SOURCE_WIDTH].ljust(self.SOURCE_WIDTH), base_style + Style(color="magenta")),
+            Segment(" ", base_style),
+            Segment(content, base_style + Style(color="white")),
+        ]
+        return Strip(segments).adjust_cell_length(width, base_style)
 
 
 class StatusBarWidget(Static):
@@ -89,11 +254,46 @@ class StatusBarWidget(Static):
     def render(self) -> RenderableType:
         cmd = self.command or "<no command issued>"
         code = self.exit_code if self.exit_code is not None else "—"
-        hints = "[bold]!ai[/bold] for chat | [bold]!explain[/bold] to explain | [bold]!fix[/bold] to diagnose"
-        
+        hints = "!ai chat | !explain | !fix | !search | !bg/!jobs | !stats | !snapshot | !help for all commands"
+
         return Text(f"Last: {cmd} | exit={code}\n{hints}", style="bold")
 
 
+class HistorySuggester(Suggester):
+    """Inline suggestion: the best earlier command starting with the typed text."""
+
+    def __init__(self, history: CommandHistory) -> None:
+        super().__init__(use_cache=False)  # the history grows while the app runs
+        self._history = history
+
+    async def get_suggestion(self, value: str) -> Optional[str]:
+        if not value:
+            return None
+        matches = self._history.suggest(value, limit=1)
+        return matches[0] if matches else None
+
+
+class CommandInput(Input):
+    """Input with up/down recall of earlier commands (Right accepts a suggestion)."""
+
+    BINDINGS = [
+        Binding("up", "history_up", "Previous command", show=False),
+        Binding("down", "history_down", "Next command", show=False),
+    ]
+
+    def __init__(self, history: CommandHistory, **kwargs: Any) -> None:
+        super().__init__(suggester=HistorySuggester(history), **kwargs)
+        self.recall = HistoryRecall(history)
+
+    def action_history_up(self) -> None:
+        self.value = self.recall.up(self.value)
+        self.cursor_position = len(self.value)
+
+    def action_history_down(self) -> None:
+        self.value = self.recall.down()
+        self.cursor_position = len(self.value)
+
+
 class InputLineWidget(Static):
     """Command input field."""
 
@@ -104,8 +304,16 @@ class InputLineWidget(Static):
     }
     """
 
+    def __init__(self, history: CommandHistory, **kwargs: Any) -> None:
+        super().__init__(**kwargs)
+        self._history = history
+
     def compose(self) -> ComposeResult:
-        yield Input(id="command_input", placeholder="Enter command, !ai, !explain, or !fix...")
+        yield CommandInput(
+            self._history,
+            id="command_input",
+            placeholder="Enter command, !ai, !explain, !fix, !bg, !jobs, !stats or !profile...",
+        )
 
 
 class AxiomTUI(App):
@@ -135,20 +343,62 @@ class AxiomTUI(App):
     BINDINGS = [
         Binding("ctrl+c", "quit", "Quit"),
         Binding("ctrl+l", "clear_stream", "Clear Stream"),
+        Binding("escape", "cancel_generation", "Cancel Generation"),
+        Binding("pageup", "stream_page_up", "Scroll Up", show=False),
+        Binding("pagedown", "stream_page_down", "Scroll Down", show=False),
     ]
 
-    def __init__(self, shield: EntropyShield, kernel: Kernel, agent: DeterministicAgent):
+    def __init__(
+        self,
+        shield: EntropyShield,
+        kernel: Kernel,
+        agent: DeterministicAgent,
+        memory: Optional["SemanticMemory"] = None,
+        reuse_threshold: Optional[float] = None,
+        deadlines: Optional[Dict[str, float]] = None,
+        prefetch: bool = False,
+        token_budgets: Optional[Dict[str, int]] = None,
+        resume: int = 0,
+    ):
         super().__init__()
         self.shield = shield
         self.kernel = kernel
         self.agent = agent
+        self.memory = memory
+        self.reuse_threshold = reuse_threshold
+        self.deadlines = {**DEFAULT_DEADLINES, **(deadlines or {})}
+        self.token_budgets = {**DEFAULT_TOKEN_BUDGETS, **(token_budgets or {})}
+        self._prefetcher = (
+            SpeculativePrefetcher(
+                kernel=kernel,
+                shield=shield,
+                memory=memory,
+                deadlines=self.deadlines,
+                token_budgets=self.token_budgets,
+            )
+            if prefetch
+            else None
+        )
+        self._search_tool = None
+        self._cancel: Optional[CancelToken] = None
+        self.profiler = CommandProfiler(shield.ledger_path.parent)
+        self.jobs = JobTable(agent, shield)
+        self.history = CommandHistory(shield.ledger_path)
         self.state = UIState()
+        if resume:
+            # Previous session's stream and !explain/!fix context (see session_resume.py).
+            session = resume_session(shield, limit=resume, blobs=agent.blobs)
+            self.state.thought_stream.extend(ThoughtEvent(source=s, content=c) for s, c in session.events)
+            self.state.last_shell_command = session.last_shell_command
+            self.state.last_stdout = session.last_stdout
+            self.state.last_stderr = session.last_stderr
+            self.state.last_exit_code = session.last_exit_code
 
     def compose(self) -> ComposeResult:
         yield Header()
         with Vertical():
             yield ThoughtStreamWidget(id="stream")
-            yield InputLineWidget(id="input_container")
+            yield InputLineWidget(self.history, id="input_container")
             yield StatusBarWidget(id="status")
         yield Footer()
 
@@ -156,12 +406,22 @@ class AxiomTUI(App):
         """Set up event handlers and focus."""
         input_field = self.query_one("#command_input", Input)
         input_field.focus()
+        self.set_interval(1.0, self._report_finished_jobs)
+        if self.state.thought_stream:
+            self._update_widgets()
+
+    def on_unmount(self) -> None:
+        self.jobs.close()
+        self.profiler.stop()
+        if self._prefetcher is not None:
+            self._prefetcher.close()
 
     async def on_input_submitted(self, event: Input.Submitted) -> None:
         """Handle command submission."""
         command = event.value.strip()
-        input_field = self.query_one("#command_input", Input)
+        input_field = self.query_one("#command_input", CommandInput)
         input_field.value = ""
+        input_field.recall.reset()
 
         if not command:
             return
@@ -171,132 +431,406 @@ class AxiomTUI(App):
             return
 
         self.state.last_command = command
+        if command.startswith("!") and background_command(command) is None:
+            self.history.add(command)  # shell commands and jobs reach it through the ledger
         self.state.thought_stream.append(ThoughtEvent(source="user", content=command))
-
-        # Route commands
-        if command.startswith("!ai "):
-            await self._handle_ai(command[4:].strip())
+        if self._prefetcher is not None and command not in {"!explain", "!fix", "!stats", "!analytics", "!help"}:
+            self._prefetcher.discard()
+
+        # Route commands. Model calls run as workers so the app keeps
+        # handling keys (Esc cancels) while Ollama generates; they count
+        # as finished (for !profile) when the worker ends.
+        in_worker = False
+        background = background_command(command)
+        if background is not None:
+            self._handle_background(background)
+        elif command == "!jobs":
+            self.state.thought_stream.append(ThoughtEvent(source="jobs", content=self.jobs.describe()))
+        elif command.startswith("!fg "):
+            try:
+                job_id = parse_job_id(command[4:])
+                in_worker = self._start_generation("fg", lambda cancel: self._handle_fg(job_id, cancel))
+            except JobError as exc:
+                self.state.thought_stream.append(ThoughtEvent(source="error", content=str(exc)))
+        elif command.startswith("!kill "):
+            self._handle_kill(command[6:])
+        elif command.startswith("!ai "):
+            query = command[4:].strip()
+            in_worker = self._start_generation("ai", lambda cancel: self._handle_ai(query, cancel))
         elif command == "!explain":
-            await self._handle_explain()
+            in_worker = self._start_generation("explain", self._handle_explain)
         elif command == "!fix":
-            await self._handle_fix()
+            in_worker = self._start_generation("fix", self._handle_fix)
+        elif command.startswith("!search "):
+            await self._handle_search(command[8:].strip())
+        elif command == "!snapshot":
+            await self._handle_snapshot()
+        elif command == "!stats":
+            self._handle_stats()
+        elif command == "!help":
+            self.state.thought_stream.append(ThoughtEvent(source="help", content=COMMAND_HELP))
+        elif command == "!analytics" or command.startswith("!analytics "):
+            await self._handle_analytics(command[10:])
+        elif command == "!profile" or command.startswith("!profile "):
+            self.state.thought_stream.append(ThoughtEvent(source="profile", content=self.profiler.command(command[8:])))
+            self._update_widgets()
+            return
         else:
             await self._handle_shell(command)
 
+        if not in_worker:
+            self._command_finished()
         self._update_widgets()
 
-    async def _handle_ai(self, query: str) -> None:
+    def _start_generation(self, route: str, handler: Callable[[CancelToken], Awaitable[None]]) -> bool:
+        if self._cancel is not None:
+            self.state.thought_stream.append(
+                ThoughtEvent(source="error", content="A request is still running; press Esc to cancel it.")
+            )
+            return False
+        cancel = CancelToken(deadline=self.deadlines.get(route))
+        self._cancel = cancel
+        self.run_worker(self._run_generation(handler(cancel), cancel), group="generation")
+        return True
+
+    async def _run_generation(self, work: Awaitable[None], cancel: CancelToken) -> None:
+        try:
+            await work
+        finally:
+            cancel.finish()
+            self._cancel = None
+            self._command_finished()
+            self._update_widgets()
+
+    async def _in_thread(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking call (model, index, ledger scan) off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.profiler.wrap(functools.partial(fn, *args, **kwargs)))
+
+    def _command_finished(self) -> None:
+        report = self.profiler.command_finished()
+        if report is not None:
+            self.state.thought_stream.append(ThoughtEvent(source="profile", content=report))
+
+    def _handle_stats(self) -> None:
+        """Handle !stats."""
+        try:
+            report = collect_stats(
+                shield=self.shield, kernel=self.kernel, prefetcher=self._prefetcher, profiler=self.profiler
+            )
+            self.state.thought_stream.append(ThoughtEvent(source="stats", content=report))
+        except Exception as exc:
+            self.state.thought_stream.append(
+                ThoughtEvent(source="error", content=f"stats: {exc}")
+            )
+
+    def _handle_background(self, command: str) -> None:
+        """Handle !bg <command> and <command> &."""
+        try:
+            job = self.jobs.start(command, cwd=Path.cwd())
+            self.state.thought_stream.append(ThoughtEvent(source=f"job[{job.id}]", content=job.describe()))
+        except Exception as exc:
+            self.state.thought_stream.append(
+                ThoughtEvent(source="error", content=f"agent: {exc}")
+            )
+
+    async def _handle_fg(self, job_id: int, cancel: CancelToken) -> None:
+        """Handle !fg N: wait for the job (Esc stops waiting) and show its output."""
+        try:
+            job = await self._in_thread(self.jobs.wait, job_id, cancel)
+        except JobError as exc:
+            self.state.thought_stream.append(ThoughtEvent(source="error", content=str(exc)))
+            return
+        output = job.text().strip()
+        if job.active:
+            content = f"{job.describe()} (still in background)\n{output or '<no output yet>'}"
+        else:
+            # A finished job becomes the target of !explain and !fix.
+            self.state.last_shell_command = job.command
+            self.state.last_stdout = job.text()
+            self.state.last_stderr = None
+            self.state.last_exit_code = job.exit_code
+            content = f"{job.describe()}\n{output}"
+        self.state.thought_stream.append(ThoughtEvent(source=f"job[{job.id}]", content=content))
+
+    def _handle_kill(self, argument: str) -> None:
+        """Handle !kill N."""
+        try:
+            job = self.jobs.kill(parse_job_id(argument))
+            self.state.thought_stream.append(ThoughtEvent(source=f"job[{job.id}]", content=job.describe()))
+        except JobError as exc:
+            self.state.thought_stream.append(ThoughtEvent(source="error", content=str(exc)))
+
+    def _report_finished_jobs(self) -> None:
+        finished = self.jobs.finished_since_last_call()
+        for job in finished:
+            self.state.thought_stream.append(ThoughtEvent(source=f"job[{job.id}]", content=job.describe()))
+        if finished:
+            self._update_widgets()
+
+    def action_cancel_generation(self) -> None:
+        if self._cancel is not None:
+            self._cancel.cancel()
+
+    async def _handle_ai(self, query: str, cancel: CancelToken) -> None:
         """Handle !ai <query>."""
         try:
-            envelope = law_guarded_completion(kernel=self.kernel, shield=self.shield, user_content=query)
+            envelope = await self._in_thread(
+                law_guarded_completion,
+                kernel=route_kernel(self.kernel, "ai"),
+                shield=self.shield,
+                user_content=query,
+                memory=self.memory,
+                cancel=cancel,
+                max_tokens=self.token_budgets.get("ai"),
+            )
             text = str(envelope.get("payload", {}).get("text", "<no text>"))
             status = envelope.get("status", "UNKNOWN")
             self.state.thought_stream.append(
                 ThoughtEvent(source=f"model[{status}]", content=text)
             )
+        except GenerationCancelled as exc:
+            self.state.thought_stream.append(ThoughtEvent(source="cancelled", content=f"!ai {exc}"))
         except Exception as exc:
             self.state.thought_stream.append(
                 ThoughtEvent(source="error", content=f"law_core: {exc}")
             )
 
-    async def _handle_explain(self) -> None:
-        """Handle !explain."""
-        if not self.state.last_command:
-            self.state.thought_stream.append(
-                ThoughtEvent(source="error", content="No previous command to explain.")
-            )
-            return
-
+    def _explain_prompt(self) -> Optional[str]:
+        if not self.state.last_shell_command:
+            return None
         prompt = (
             "You are a deterministic terminal assistant. Explain the following shell command "
             "and its result in clear, concise language.\n\n"
-            f"Command:\n{self.state.last_command}\n"
+            f"Command:\n{self.state.last_shell_command}\n"
         )
         if self.state.last_stdout:
             prompt += f"Last stdout:\n{self.state.last_stdout}\n"
         if self.state.last_stderr:
             prompt += f"Last stderr (may indicate error):\n{self.state.last_stderr}\n"
+        return prompt
+
+    def _fix_prompt(self) -> Optional[str]:
+        if not self.state.last_shell_command:
+            return None
+        prompt = (
+            "You are a deterministic terminal assistant. The user ran this command and it did not "
+            "behave as expected. Analyze any errors and reply with JSON: \"command\" is a single corrected "
+            "command (no pipes or chaining) and \"explanation\" says briefly why it works.\n\n"
+            f"Command:\n{self.state.last_shell_command}\n"
+        )
+        if self.state.last_stdout:
+            prompt += f"Last stdout:\n{self.state.last_stdout}\n"
+        if self.state.last_stderr:
+            prompt += f"Last stderr (error details):\n{self.state.last_stderr}\n"
+        return prompt
+
+    async def _handle_explain(self, cancel: CancelToken) -> None:
+        """Handle !explain."""
+        prompt = self._explain_prompt()
+        if prompt is None:
+            self.state.thought_stream.append(
+                ThoughtEvent(source="error", content="No previous command to explain.")
+            )
+            return
 
         try:
-            envelope = law_guarded_completion(kernel=self.kernel, shield=self.shield, user_content=prompt)
+            envelope, origin = await self._in_thread(
+                complete_with_prefetch,
+                "explain",
+                prompt,
+                kernel=self.kernel,
+                shield=self.shield,
+                prefetcher=self._prefetcher,
+                memory=self.memory,
+                cancel=cancel,
+                max_tokens=self.token_budgets.get("explain"),
+            )
             text = str(envelope.get("payload", {}).get("text", "<no text>"))
             status = envelope.get("status", "UNKNOWN")
             self.state.thought_stream.append(
-                ThoughtEvent(source=f"model[{status}]", content=text)
+                ThoughtEvent(source=f"{origin}[{status}]", content=text)
             )
+        except GenerationCancelled as exc:
+            self.state.thought_stream.append(ThoughtEvent(source="cancelled", content=f"!explain {exc}"))
         except Exception as exc:
             self.state.thought_stream.append(
                 ThoughtEvent(source="error", content=f"law_core: {exc}")
             )
 
-    async def _handle_fix(self) -> None:
+    async def _handle_fix(self, cancel: CancelToken) -> None:
         """Handle !fix."""
-        if not self.state.last_command:
+        prompt = self._fix_prompt()
+        if prompt is None:
             self.state.thought_stream.append(
                 ThoughtEvent(source="error", content="No previous command to fix.")
             )
             return
 
-        prompt = (
-            "You are a deterministic terminal assistant. The user ran this command and it did not "
-            "behave as expected. Analyze any errors and propose a single corrected command plus a brief explanation.\n\n"
-            f"Command:\n{self.state.last_command}\n"
-        )
-        if self.state.last_stdout:
-            prompt += f"Last stdout:\n{self.state.last_stdout}\n"
-        if self.state.last_stderr:
-            prompt += f"Last stderr (error details):\n{self.state.last_stderr}\n"
-
         try:
-            envelope = law_guarded_completion(kernel=self.kernel, shield=self.shield, user_content=prompt)
-            text = str(envelope.get("payload", {}).get("text", "<no text>"))
+            if self.memory is not None:
+                from semantic_index import describe_hit
+
+                # The query embedding is an HTTP call; keep it off the event loop.
+                for hit in await self._in_thread(self.memory.search, prompt, k=3, kind="fix"):
+                    self.state.thought_stream.append(
+                        ThoughtEvent(source=f"memory[{hit.score:.2f}]", content=describe_hit(hit))
+                    )
+            envelope, origin = await self._in_thread(
+                complete_with_prefetch,
+                "fix",
+                prompt,
+                kernel=self.kernel,
+                shield=self.shield,
+                prefetcher=self._prefetcher,
+                memory=self.memory,
+                reuse_threshold=self.reuse_threshold,
+                cancel=cancel,
+                max_tokens=self.token_budgets.get("fix"),
+            )
+            text = describe_fix(envelope.get("payload", {}), self.agent)
             status = envelope.get("status", "UNKNOWN")
             self.state.thought_stream.append(
-                ThoughtEvent(source=f"model[{status}]", content=text)
+                ThoughtEvent(source=f"{origin}[{status}]", content=text)
             )
+        except GenerationCancelled as exc:
+            self.state.thought_stream.append(ThoughtEvent(source="cancelled", content=f"!fix {exc}"))
         except Exception as exc:
             self.state.thought_stream.append(
                 ThoughtEvent(source="error", content=f"law_core: {exc}")
             )
 
+    async def _handle_search(self, query: str) -> None:
+        """Handle !search <text> (literal) or !search re:<pattern> (regex), off the event loop."""
+        from search_index import SearchTool, format_matches
+
+        regex = query.startswith("re:")
+        if regex:
+            query = query[3:]
+
+        def search() -> List[Any]:
+            # Building the index on first use walks the workspace; keep it off the loop too.
+            if self._search_tool is None:
+                self._search_tool = SearchTool(
+                    root=Path.cwd(), shield=self.shield, index_dir=self.shield.ledger_path.parent / "search"
+                )
+            return self._search_tool.search(query, regex=regex)
+
+        try:
+            matches = await self._in_thread(search)
+            self.state.thought_stream.append(
+                ThoughtEvent(source=f"search[{len(matches)}]", content=format_matches(matches))
+            )
+        except Exception as exc:
+            self.state.thought_stream.append(
+                ThoughtEvent(source="error", content=f"search: {exc}")
+            )
+
+    async def _handle_analytics(self, argument: str) -> None:
+        """Handle !analytics [DAYS]: report over the whole ledger, off the event loop."""
+        from analytics import analytics_command
+
+        try:
+            report = await self._in_thread(analytics_command, self.shield.ledger_path, argument)
+            self.state.thought_stream.append(ThoughtEvent(source="analytics", content=report))
+        except Exception as exc:
+            self.state.thought_stream.append(
+                ThoughtEvent(source="error", content=f"analytics: {exc}")
+            )
+
+    async def _handle_snapshot(self) -> None:
+        """Handle !snapshot: Merkle snapshot of cwd, diffed and checked against the ledger, off the event loop."""
+        from workspace_snapshot import SnapshotStore, check_ledger, describe
+
+        def snapshot_and_check() -> str:
+            snapshot, diff = SnapshotStore(self.shield.ledger_path.parent).resnapshot(Path.cwd())
+            return describe(snapshot, diff, check_ledger(snapshot, self.shield.ledger_path))
+
+        try:
+            report = await self._in_thread(snapshot_and_check)
+            self.state.thought_stream.append(ThoughtEvent(source="snapshot", content=report))
+        except Exception as exc:
+            self.state.thought_stream.append(
+                ThoughtEvent(source="error", content=f"snapshot: {exc}")
+            )
+
     async def _handle_shell(self, command: str) -> None:
         """Handle shell command execution."""
+        self.state.last_shell_command = command
         try:
             completed = self.agent.execute_command(command, cwd=Path.cwd())
             self.state.last_stdout = completed.stdout
             self.state.last_stderr = completed.stderr
             self.state.last_exit_code = completed.returncode
+            if self.memory is not None:
+                self.memory.remember_command(
+                    command=command,
+                    output=(completed.stdout or "") + (completed.stderr or ""),
+                    exit_code=completed.returncode,
+                )
 
             if completed.stdout:
                 self.state.thought_stream.append(
-                    ThoughtEvent(source="shell[stdout]", content=completed.stdout.strip()[:500])
+                    ThoughtEvent(source="shell[stdout]", content=completed.stdout.strip())
                 )
             if completed.stderr:
                 self.state.thought_stream.append(
-                    ThoughtEvent(source="shell[stderr]", content=completed.stderr.strip()[:500])
+                    ThoughtEvent(source="shell[stderr]", content=completed.stderr.strip())
                 )
         except Exception as exc:
             self.state.last_stderr = str(exc)
+            self.state.last_exit_code = None
             self.state.thought_stream.append(
                 ThoughtEvent(source="error", content=f"agent: {exc}")
             )
+        if self._prefetcher is not None:
+            # Speculate on the likely follow-up while the user reads the output.
+            if self.state.last_exit_code != 0:
+                self._prefetcher.speculate("fix", self._fix_prompt())
+            self._prefetcher.speculate("explain", self._explain_prompt())
 
     def _update_widgets(self) -> None:
         """Refresh all widgets from state."""
         stream_widget = self.query_one("#stream", ThoughtStreamWidget)
-        stream_widget.stream = self.state.thought_stream
+        stream_widget.sync(self.state.thought_stream)
 
         status_widget = self.query_one("#status", StatusBarWidget)
         status_widget.command = self.state.last_command
         status_widget.exit_code = self.state.last_exit_code
 
+    def action_stream_page_up(self) -> None:
+        self.query_one("#stream", ThoughtStreamWidget).scroll_page_up(animate=False)
+
+    def action_stream_page_down(self) -> None:
+        self.query_one("#stream", ThoughtStreamWidget).scroll_page_down(animate=False)
+
     def action_clear_stream(self) -> None:
         """Clear the thought stream."""
         self.state.thought_stream.clear()
         self._update_widgets()
 
 
-def run_tui(shield: EntropyShield, kernel: Kernel, agent: DeterministicAgent) -> None:
+def run_tui(
+    shield: EntropyShield,
+    kernel: Kernel,
+    agent: DeterministicAgent,
+    memory: Optional["SemanticMemory"] = None,
+    reuse_threshold: Optional[float] = None,
+    deadlines: Optional[Dict[str, float]] = None,
+    prefetch: bool = False,
+    token_budgets: Optional[Dict[str, int]] = None,
+    resume: int = 0,
+) -> None:
     """Launch the Textual TUI."""
-    app = AxiomTUI(shield, kernel, agent)
+    app = AxiomTUI(
+        shield,
+        kernel,
+        agent,
+        memory=memory,
+        reuse_threshold=reuse_threshold,
+        deadlines=deadlines,
+        prefetch=prefetch,
+        token_budgets=token_budgets,
+        resume=resume,
+    )
     app.run()
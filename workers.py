@@ -0,0 +1,488 @@
+"""Workers module: run verified commands on executor worker processes.
+
+One machine's DeterministicAgent caps how many shell commands run at
+once. With ``--workers-listen ADDRESS`` a dashboard also accepts worker
+processes (``main.py --worker ADDRESS``) on this host or on others:
+
+- A worker connects, and both sides prove they hold the shared key
+  (HMAC-SHA256 over a fresh nonce each way, ``<log-dir>/workers.key``).
+  The worker then registers its name and capacity (concurrent commands).
+- ``DeterministicAgent.execute_command`` verifies a command locally and
+  sends it to the worker with the most free slots. With no free slot
+  the command runs locally, as before.
+- The worker verifies the command again under its own invariants and
+  resource profile, runs it and replies with its outputs and the ledger
+  events it produced. The orchestrator appends those to its ledger with
+  their original timestamps and a ``worker`` field, and keeps the
+  outputs in its own blob store when it has one.
+
+Background jobs (``!job``) stream their output and still run locally.
+
+The wire format is newline-delimited JSON as in daemon.py. Traffic is
+authenticated but not encrypted: listen on a Unix socket path, or use
+TCP only on a trusted network or through an SSH tunnel.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import itertools
+import json
+import logging
+import os
+import secrets
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional, Tuple
+
+from deterministic_agent import DeterministicAgent, Invariant
+from entropy_shield import EntropyShield, LedgerEvent
+
+if TYPE_CHECKING:
+    from blob_store import BlobStore
+    from resource_limits import ResourceGovernor
+
+logger = logging.getLogger("orchestrator")
+
+HANDSHAKE_TIMEOUT = 10.0
+RECONNECT_DELAY = 2.0
+
+
+class WorkerError(RuntimeError):
+    """Raised for a bad address or key, a failed handshake, or a worker lost mid-command."""
+
+
+def parse_address(text: str) -> Tuple[int, Any]:
+    """``HOST:PORT`` for TCP; ``unix:PATH`` or any path containing ``/`` for a Unix socket."""
+
+    if text.startswith("unix:") or "/" in text or os.sep in text:
+        family = getattr(socket, "AF_UNIX", None)
+        if family is None:
+            raise WorkerError("Unix socket addresses are not available on this platform; use HOST:PORT")
+        return family, text[5:] if text.startswith("unix:") else text
+    host, separator, port = text.rpartition(":")
+    if not separator or not port.isdigit():
+        raise WorkerError(f"Invalid worker address '{text}'; expected HOST:PORT or a socket path")
+    return socket.AF_INET, (host or "127.0.0.1", int(port))
+
+
+def load_key(path: Path, *, create: bool = False) -> bytes:
+    """Read the shared worker key; with ``create`` a new one is written (mode 0600) if missing."""
+
+    if create and not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            pass  # created concurrently
+        else:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(secrets.token_hex(32) + "\n")
+            logger.info("Created worker key %s; copy it to worker hosts", path)
+    try:
+        key = path.read_text(encoding="utf-8").strip()
+    except OSError as exc:
+        raise WorkerError(f"Cannot read worker key {path}: {exc}") from None
+    if not key:
+        raise WorkerError(f"Worker key {path} is empty")
+    return key.encode("utf-8")
+
+
+def _mac(key: bytes, role: str, nonce: Any) -> str:
+    # The role prefix stops one side's proof being replayed as the other's.
+    return hmac.new(key, f"{role}:{nonce}".encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+class _Channel:
+    """Newline-delimited JSON messages over one socket; sends are serialized."""
+
+    def __init__(self, sock: socket.socket) -> None:
+        self.sock = sock
+        self._rfile = sock.makefile("rb")
+        self._send_lock = threading.Lock()
+
+    def send(self, message: Dict[str, Any]) -> None:
+        line = (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._send_lock:
+            self.sock.sendall(line)
+
+    def receive(self) -> Optional[Dict[str, Any]]:
+        """The next message, or None once the peer has closed the connection."""
+
+        raw = self._rfile.readline()
+        return json.loads(raw) if raw else None
+
+    def close(self) -> None:
+        self._rfile.close()
+        self.sock.close()
+
+
+# ---------------------------------------------------------------------------
+# Orchestrator side
+# ---------------------------------------------------------------------------
+
+
+@dataclass
+class _RemoteWorker:
+    name: str
+    capacity: int
+    channel: _Channel
+    # request id -> (future, command)
+    in_flight: Dict[int, Tuple["Future[subprocess.CompletedProcess[str]]", str]] = field(default_factory=dict)
+    dispatched: int = 0
+    completed: int = 0
+    failed: int = 0
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class WorkerPool:
+    """Accepts worker registrations and runs verified commands on them."""
+
+    def __init__(
+        self, address: str, *, shield: EntropyShield, key: bytes, blobs: Optional["BlobStore"] = None
+    ) -> None:
+        self.address = address
+        self._shield = shield
+        self._key = key
+        self._blobs = blobs
+        self._lock = threading.Lock()
+        self._workers: Dict[str, _RemoteWorker] = {}
+        self._ids = itertools.count(1)
+        self._server: Optional[socketserver.BaseServer] = None
+        self._socket_path: Optional[Path] = None
+
+    # Lifecycle ----------------------------------------------------------------
+
+    def start(self) -> None:
+        """Listen in a background thread; ``address`` is updated with the bound port."""
+
+        family, target = parse_address(self.address)
+        handler = self._make_handler()
+        if family == socket.AF_INET:
+            self._server = _TCPServer(target, handler)
+            host, port = self._server.server_address[:2]
+            self.address = f"{host}:{port}"
+        else:
+            path = Path(target)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if path.exists():
+                path.unlink()
+            self._server = socketserver.ThreadingUnixStreamServer(str(path), handler)
+            self._server.daemon_threads = True  # type: ignore[attr-defined]
+            os.chmod(path, 0o600)
+            self._socket_path = path
+        threading.Thread(target=self._server.serve_forever, name="worker-pool", daemon=True).start()
+        logger.info("Accepting executor workers on %s", self.address)
+
+    def close(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        with self._lock:
+            workers = list(self._workers.values())
+        for worker in workers:
+            worker.channel.sock.shutdown(socket.SHUT_RDWR)
+        if self._socket_path is not None and self._socket_path.exists():
+            self._socket_path.unlink()
+
+    # Dispatch -----------------------------------------------------------------
+
+    def submit(self, command: str, cwd: Path) -> Optional["Future[subprocess.CompletedProcess[str]]"]:
+        """Send an already verified command to the least busy worker; None if none has a free slot."""
+
+        with self._lock:
+            free = [w for w in self._workers.values() if len(w.in_flight) < w.capacity]
+            if not free:
+                return None
+            worker = max(free, key=lambda w: (w.capacity - len(w.in_flight), -w.dispatched))
+            request_id = next(self._ids)
+            future: "Future[subprocess.CompletedProcess[str]]" = Future()
+            worker.in_flight[request_id] = (future, command)
+            worker.dispatched += 1
+        try:
+            worker.channel.send({"id": request_id, "op": "execute", "args": {"command": command, "cwd": str(cwd)}})
+        except OSError as exc:  # nothing ran; the caller runs the command elsewhere
+            logger.warning("Could not send command to worker %s: %s", worker.name, exc)
+            with self._lock:
+                worker.in_flight.pop(request_id, None)
+            return None
+        logger.info("Command sent to worker %s: %s", worker.name, command)
+        return future
+
+    def execute(self, command: str, cwd: Path) -> Optional[subprocess.CompletedProcess[str]]:
+        """Run a verified command on a worker and wait; None if no worker has a free slot."""
+
+        future = self.submit(command, cwd)
+        return future.result() if future is not None else None
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {
+                    "name": w.name,
+                    "capacity": w.capacity,
+                    "running": len(w.in_flight),
+                    "completed": w.completed,
+                    "failed": w.failed,
+                }
+                for w in self._workers.values()
+            ]
+
+    # Connections --------------------------------------------------------------
+
+    def _make_handler(self) -> type:
+        pool = self
+
+        class _WorkerHandler(socketserver.BaseRequestHandler):
+            def handle(self) -> None:
+                worker = pool._handshake(self.request)
+                if worker is None:
+                    return
+                try:
+                    while True:
+                        message = worker.channel.receive()
+                        if message is None:
+                            break
+                        pool._resolve(worker, message)
+                except (OSError, ValueError) as exc:
+                    logger.warning("Worker %s connection failed: %s", worker.name, exc)
+                finally:
+                    pool._drop(worker)
+
+        return _WorkerHandler
+
+    def _handshake(self, sock: socket.socket) -> Optional[_RemoteWorker]:
+        channel = _Channel(sock)
+        nonce = secrets.token_hex(16)
+        sock.settimeout(HANDSHAKE_TIMEOUT)
+        try:
+            channel.send({"op": "challenge", "nonce": nonce})
+            hello = channel.receive()
+            if (
+                not hello
+                or hello.get("op") != "register"
+                or not hmac.compare_digest(str(hello.get("mac", "")), _mac(self._key, "worker", nonce))
+            ):
+                logger.warning("Rejected worker connection from %s: authentication failed", sock.getpeername() or "?")
+                channel.send({"op": "rejected", "error": "authentication failed"})
+                return None
+            capacity = max(1, int(hello.get("capacity") or 1))
+            with self._lock:
+                name = str(hello.get("name") or "worker")
+                if name in self._workers:
+                    name = f"{name}#{next(self._ids)}"
+                worker = _RemoteWorker(name=name, capacity=capacity, channel=channel)
+                self._workers[name] = worker
+            channel.send({"op": "registered", "name": name, "mac": _mac(self._key, "orchestrator", hello.get("nonce"))})
+        except (OSError, ValueError, TypeError) as exc:
+            logger.warning("Worker handshake failed: %s", exc)
+            return None
+        sock.settimeout(None)
+        logger.info("Worker %s registered (capacity %d)", name, capacity)
+        return worker
+
+    def _resolve(self, worker: _RemoteWorker, message: Dict[str, Any]) -> None:
+        with self._lock:
+            entry = worker.in_flight.pop(message.get("id"), None)  # type: ignore[arg-type]
+        if entry is None:
+            logger.warning("Worker %s replied to unknown request %r", worker.name, message.get("id"))
+            return
+        future, command = entry
+        if not message.get("ok"):
+            worker.failed += 1
+            future.set_exception(WorkerError(f"Worker {worker.name}: {message.get('error')}"))
+            return
+        try:
+            result = message["result"]
+            events = [
+                LedgerEvent(timestamp=e["timestamp"], kind=e["kind"], payload=e["payload"]) for e in result["events"]
+            ]
+            if self._blobs is not None:
+                for event in events:
+                    if event.kind == "command":
+                        for name in ("stdout", "stderr"):
+                            digest = self._blobs.put_text(result[name])
+                            if digest is not None:
+                                event.payload[f"{name}_hash"] = digest
+            self._shield.merge_events(events, worker=worker.name)
+            completed = subprocess.CompletedProcess(command, result["exit_code"], result["stdout"], result["stderr"])
+        except Exception as exc:  # malformed reply or ledger failure: surface it to the caller
+            worker.failed += 1
+            future.set_exception(WorkerError(f"Worker {worker.name}: bad reply: {exc}"))
+            return
+        worker.completed += 1
+        future.set_result(completed)
+
+    def _drop(self, worker: _RemoteWorker) -> None:
+        with self._lock:
+            if self._workers.get(worker.name) is worker:
+                del self._workers[worker.name]
+            pending = list(worker.in_flight.values())
+            worker.in_flight.clear()
+        for future, command in pending:
+            # Not retried elsewhere: the command may already have had side effects.
+            future.set_exception(WorkerError(f"Worker {worker.name} disconnected while running '{command}'"))
+        logger.info("Worker %s left (%d command(s) lost)", worker.name, len(pending))
+
+
+# ---------------------------------------------------------------------------
+# Worker side
+# ---------------------------------------------------------------------------
+
+
+class _EventBuffer(EntropyShield):
+    """Stands in for the ledger on a worker: events are sent back, not written."""
+
+    def __init__(self) -> None:  # no ledger file on the worker
+        self.events: List[LedgerEvent] = []
+
+    def _append(self, event: LedgerEvent) -> None:
+        self.events.append(event)
+
+
+@dataclass
+class WorkerConfig:
+    address: str
+    key: bytes
+    name: str = field(default_factory=lambda: f"{socket.gethostname()}-{os.getpid()}")
+    capacity: int = field(default_factory=lambda: os.cpu_count() or 1)
+    # Run every command here instead of the orchestrator's cwd (for other hosts).
+    root: Optional[Path] = None
+
+
+class ExecutorWorker:
+    """Connects to a WorkerPool and runs the commands it sends."""
+
+    def __init__(
+        self,
+        config: WorkerConfig,
+        *,
+        invariants: Optional[Iterable[Invariant]] = None,
+        governor: Optional["ResourceGovernor"] = None,
+    ) -> None:
+        self.config = config
+        self._invariants = list(invariants) if invariants is not None else None
+        self._governor = governor
+        self._executor = ThreadPoolExecutor(max_workers=config.capacity, thread_name_prefix="worker")
+        self._channel: Optional[_Channel] = None
+        self._closed = threading.Event()
+
+    def run_forever(self) -> None:
+        """Serve until ``close()``, reconnecting after connection errors.
+
+        Authentication failures raise WorkerError instead of retrying.
+        """
+
+        while not self._closed.is_set():
+            try:
+                self.serve_once()
+            except OSError as exc:
+                logger.warning("Worker connection to %s failed: %s", self.config.address, exc)
+            if self._closed.wait(RECONNECT_DELAY):
+                break
+
+    def serve_once(self) -> None:
+        """Connect, register and run commands until the orchestrator disconnects."""
+
+        channel = self._connect()
+        self._channel = channel
+        try:
+            while True:
+                message = channel.receive()
+                if message is None:
+                    logger.info("Orchestrator at %s closed the connection", self.config.address)
+                    return
+                if message.get("op") == "execute":
+                    self._executor.submit(self._execute, channel, message)
+        finally:
+            self._channel = None
+            channel.close()
+
+    def close(self) -> None:
+        self._closed.set()
+        channel = self._channel
+        if channel is not None:
+            try:
+                channel.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._executor.shutdown(wait=True)
+
+    def _connect(self) -> _Channel:
+        family, target = parse_address(self.config.address)
+        if family == socket.AF_INET:
+            sock = socket.create_connection(target, timeout=HANDSHAKE_TIMEOUT)
+        else:
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.settimeout(HANDSHAKE_TIMEOUT)
+            sock.connect(target)
+        channel = _Channel(sock)
+        try:
+            challenge = channel.receive()
+            if not challenge or challenge.get("op") != "challenge":
+                raise WorkerError(f"Unexpected greeting from {self.config.address}: {challenge!r}")
+            nonce = secrets.token_hex(16)
+            channel.send(
+                {
+                    "op": "register",
+                    "name": self.config.name,
+                    "capacity": self.config.capacity,
+                    "nonce": nonce,
+                    "mac": _mac(self.config.key, "worker", challenge.get("nonce")),
+                }
+            )
+            reply = channel.receive()
+            if not reply or reply.get("op") != "registered":
+                raise WorkerError(f"Orchestrator rejected this worker: {(reply or {}).get('error', 'no reply')}")
+            if not hmac.compare_digest(str(reply.get("mac", "")), _mac(self.config.key, "orchestrator", nonce)):
+                raise WorkerError(f"Orchestrator at {self.config.address} failed authentication")
+        except BaseException:
+            channel.close()
+            raise
+        sock.settimeout(None)
+        logger.info("Registered with %s as %s (capacity %d)", self.config.address, reply["name"], self.config.capacity)
+        return channel
+
+    def _execute(self, channel: _Channel, message: Dict[str, Any]) -> None:
+        request_id = message.get("id")
+        try:
+            args = message["args"]
+            cwd = self.config.root or Path(args["cwd"])
+            if not cwd.is_dir():
+                raise WorkerError(f"Working directory {cwd} does not exist on worker {self.config.name}")
+            buffer = _EventBuffer()
+            agent = DeterministicAgent(entropy_shield=buffer, invariants=self._invariants, governor=self._governor)
+            start = time.perf_counter()
+            completed = agent.execute_command(args["command"], cwd)
+            logger.info(
+                "Ran %s (exit %s, %.1fs)", args["command"], completed.returncode, time.perf_counter() - start
+            )
+            reply: Dict[str, Any] = {
+                "id": request_id,
+                "ok": True,
+                "result": {
+                    "exit_code": completed.returncode,
+                    "stdout": completed.stdout,
+                    "stderr": completed.stderr,
+                    "events": [event.to_dict() for event in buffer.events],
+                },
+            }
+        except Exception as exc:  # rejected by an invariant, bad cwd, ...: reported, not hidden
+            logger.warning("Worker command failed: %s", exc)
+            reply = {"id": request_id, "ok": False, "error": str(exc)}
+        try:
+            channel.send(reply)
+        except OSError as exc:
+            logger.warning("Could not return result of request %s: %s", request_id, exc)
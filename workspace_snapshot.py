@@ -0,0 +1,338 @@
+"""Workspace_Snapshot module: Merkle snapshots of a directory tree.
+
+The ledger exists to keep the terminal narrative aligned with the file
+system, but checking that alignment used to mean hashing files one by
+one. A snapshot records ``(mtime_ns, size, sha256)`` for every file and
+folds them into a Merkle tree of directory hashes:
+
+- Re-snapshotting reuses the stored hash of any file whose stat is
+  unchanged; only changed files are read, on a process pool when there
+  are many of them.
+- Two snapshots are diffed top-down and identical subtrees are skipped
+  by comparing their directory hashes.
+- ``check_ledger`` compares the latest ``file_change``/``file_batch``
+  hash the ledger holds for each path under the root with the disk.
+
+File hashes are plain SHA-256 of the content, the same digest the
+DeterministicAgent records, so the two can be compared directly.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+logger = logging.getLogger("tools")
+
+DEFAULT_IGNORED_DIRS = frozenset({".git", ".hg", ".svn", "__pycache__", "node_modules", ".venv", "venv"})
+PARALLEL_THRESHOLD = 64
+
+# rel path -> (mtime_ns, size, sha256)
+FileTable = Dict[str, Tuple[int, int, str]]
+
+
+def hash_file(path: str) -> Optional[str]:
+    digest = hashlib.sha256()
+    try:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+def _hash_batch(paths: List[str]) -> List[Optional[str]]:
+    return [hash_file(p) for p in paths]
+
+
+@dataclass
+class Snapshot:
+    root: str
+    created: str
+    files: FileTable
+    dir_hashes: Dict[str, str] = field(default_factory=dict)
+    # Directory -> files directly in it, and directory -> its subdirectories (rel paths).
+    dir_files: Dict[str, List[str]] = field(default_factory=dict)
+    subdirs: Dict[str, Set[str]] = field(default_factory=dict)
+
+    @property
+    def root_hash(self) -> str:
+        return self.dir_hashes.get("", hashlib.sha256(b"").hexdigest())
+
+    def compute_tree(self) -> None:
+        """Fold file hashes into directory hashes, bottom-up, and index the tree."""
+
+        files_in: Dict[str, List[Tuple[str, str, str]]] = {"": []}
+        dir_files: Dict[str, List[str]] = {}
+        subdirs: Dict[str, Set[str]] = {}
+        for rel, (_, _, digest) in self.files.items():
+            parent, _, name = rel.rpartition("/")
+            files_in.setdefault(parent, []).append((name, "f", digest))
+            dir_files.setdefault(parent, []).append(rel)
+            # Register the chain of ancestors once.
+            directory = parent
+            while directory:
+                grand = directory.rpartition("/")[0]
+                siblings = subdirs.setdefault(grand, set())
+                if directory in siblings:
+                    break
+                siblings.add(directory)
+                directory = grand
+
+        directories = set(files_in) | set(subdirs) | {d for ds in subdirs.values() for d in ds}
+        hashes: Dict[str, str] = {}
+        # Deepest directories first, so children are hashed before parents.
+        for directory in sorted(directories, key=lambda d: d.count("/") + 1 if d else 0, reverse=True):
+            entries = list(files_in.get(directory, ()))
+            entries.extend((sub.rpartition("/")[2], "d", hashes[sub]) for sub in subdirs.get(directory, ()))
+            material = "".join(f"{name}\0{kind}\0{digest}\n" for name, kind, digest in sorted(entries))
+            hashes[directory] = hashlib.sha256(material.encode("utf-8")).hexdigest()
+        self.dir_hashes = hashes
+        self.dir_files = dir_files
+        self.subdirs = subdirs
+
+    def to_json(self) -> str:
+        return json.dumps(
+            {"root": self.root, "created": self.created, "root_hash": self.root_hash, "files": self.files},
+            sort_keys=True,
+        )
+
+    @classmethod
+    def from_json(cls, text: str) -> "Snapshot":
+        data = json.loads(text)
+        snapshot = cls(
+            root=data["root"],
+            created=data["created"],
+            files={rel: tuple(entry) for rel, entry in data["files"].items()},
+        )
+        snapshot.compute_tree()
+        return snapshot
+
+
+def _walk(root: Path, ignored_dirs: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+    ignored = frozenset(ignored_dirs)
+    found: Dict[str, Tuple[int, int]] = {}
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in ignored:
+                        stack.append(Path(entry.path))
+                elif entry.is_file(follow_symlinks=False):
+                    st = entry.stat(follow_symlinks=False)
+                    rel = Path(entry.path).relative_to(root).as_posix()
+                    found[rel] = (st.st_mtime_ns, st.st_size)
+            except OSError:
+                continue
+    return found
+
+
+def take_snapshot(
+    root: Path,
+    *,
+    previous: Optional[Snapshot] = None,
+    ignored_dirs: Iterable[str] = DEFAULT_IGNORED_DIRS,
+    max_workers: Optional[int] = None,
+) -> Snapshot:
+    """Snapshot ``root``, rehashing only files whose stat changed since ``previous``."""
+
+    root = root.resolve()
+    stats = _walk(root, ignored_dirs)
+    reusable = previous.files if previous is not None and previous.root == str(root) else {}
+
+    files: FileTable = {}
+    to_hash: List[str] = []
+    for rel, (mtime_ns, size) in stats.items():
+        old = reusable.get(rel)
+        if old is not None and old[0] == mtime_ns and old[1] == size:
+            files[rel] = old
+        else:
+            to_hash.append(rel)
+
+    paths = [str(root / rel) for rel in to_hash]
+    if len(paths) >= PARALLEL_THRESHOLD:
+        workers = max_workers or os.cpu_count() or 1
+        chunk = max(16, len(paths) // (workers * 4))
+        batches = [paths[i : i + chunk] for i in range(0, len(paths), chunk)]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            digests = [d for batch in pool.map(_hash_batch, batches) for d in batch]
+    else:
+        digests = [hash_file(p) for p in paths]
+
+    for rel, digest in zip(to_hash, digests):
+        if digest is not None:  # vanished or unreadable between walk and hash
+            mtime_ns, size = stats[rel]
+            files[rel] = (mtime_ns, size, digest)
+
+    logger.debug("Snapshot of %s: %d files, %d rehashed", root, len(files), len(to_hash))
+    snapshot = Snapshot(root=str(root), created=datetime.now(timezone.utc).isoformat(), files=files)
+    snapshot.compute_tree()
+    return snapshot
+
+
+@dataclass
+class SnapshotDiff:
+    added: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    modified: List[str] = field(default_factory=list)
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.modified)
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> SnapshotDiff:
+    """Diff two snapshots top-down, skipping subtrees whose directory hashes match.
+
+    Only directories whose hash differs are entered, and only the files
+    directly in those are compared, so a small change in a large tree
+    costs in proportion to its depth rather than to the number of files.
+    """
+
+    diff = SnapshotDiff()
+    if old.root_hash == new.root_hash:
+        return diff
+
+    stack = [""]
+    while stack:
+        directory = stack.pop()
+        if directory in old.dir_hashes and old.dir_hashes.get(directory) == new.dir_hashes.get(directory):
+            continue
+        for rel in set(old.dir_files.get(directory, ())) | set(new.dir_files.get(directory, ())):
+            before, after = old.files.get(rel), new.files.get(rel)
+            if before is None:
+                diff.added.append(rel)
+            elif after is None:
+                diff.removed.append(rel)
+            elif before[2] != after[2]:
+                diff.modified.append(rel)
+        stack.extend(old.subdirs.get(directory, set()) | new.subdirs.get(directory, set()))
+    diff.added.sort()
+    diff.removed.sort()
+    diff.modified.sort()
+    return diff
+
+
+# ---------------------------------------------------------------------------
+# Persistence and ledger alignment
+# ---------------------------------------------------------------------------
+
+
+class SnapshotStore:
+    """Keeps the latest snapshot per root under ``<log_dir>/snapshots``."""
+
+    def __init__(self, log_dir: Path) -> None:
+        self._dir = log_dir / "snapshots"
+
+    def _path_for(self, root: Path) -> Path:
+        key = hashlib.sha256(str(root.resolve()).encode("utf-8")).hexdigest()[:16]
+        return self._dir / f"{key}.json"
+
+    def load(self, root: Path) -> Optional[Snapshot]:
+        path = self._path_for(root)
+        if not path.exists():
+            return None
+        try:
+            return Snapshot.from_json(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError, KeyError) as exc:
+            logger.warning("Ignoring unreadable snapshot %s: %s", path, exc)
+            return None
+
+    def save(self, snapshot: Snapshot) -> Path:
+        self._dir.mkdir(parents=True, exist_ok=True)
+        path = self._path_for(Path(snapshot.root))
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(snapshot.to_json(), encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+    def resnapshot(self, root: Path) -> Tuple[Snapshot, Optional[SnapshotDiff]]:
+        """Take an incremental snapshot, persist it, and diff it with the last one."""
+
+        previous = self.load(root)
+        current = take_snapshot(root, previous=previous)
+        self.save(current)
+        return current, diff_snapshots(previous, current) if previous is not None else None
+
+
+@dataclass
+class LedgerDrift:
+    path: str
+    ledger_hash: Optional[str]
+    disk_hash: Optional[str]
+
+
+def check_ledger(snapshot: Snapshot, ledger_path: Path) -> List[LedgerDrift]:
+    """Paths under the snapshot root whose disk state differs from the ledger.
+
+    For each path, the last recorded ``after_hash`` (from ``file_change``
+    or ``file_batch`` events) is compared with the snapshot's hash; a
+    ``None`` on either side means "absent".
+    """
+
+    root = Path(snapshot.root)
+    expected: Dict[str, Optional[str]] = {}
+    if ledger_path.exists():
+        with ledger_path.open("r", encoding="utf-8") as f:
+            for line in f:
+                if '"file_' not in line:
+                    continue  # cheap pre-filter before decoding
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if event.get("kind") == "file_change":
+                    changes = [event.get("payload", {})]
+                elif event.get("kind") == "file_batch":
+                    changes = event.get("payload", {}).get("changes", [])
+                else:
+                    continue
+                for change in changes:
+                    try:
+                        rel = Path(change["path"]).resolve().relative_to(root).as_posix()
+                    except (KeyError, ValueError):
+                        continue
+                    expected[rel] = change.get("after_hash")
+
+    drift = []
+    for rel, ledger_hash in sorted(expected.items()):
+        entry = snapshot.files.get(rel)
+        disk_hash = entry[2] if entry is not None else None
+        if disk_hash != ledger_hash:
+            drift.append(LedgerDrift(path=rel, ledger_hash=ledger_hash, disk_hash=disk_hash))
+    return drift
+
+
+def describe(snapshot: Snapshot, diff: Optional[SnapshotDiff], drift: List[LedgerDrift], *, limit: int = 10) -> str:
+    """Human-readable summary for the dashboards' Thought Stream."""
+
+    lines = [f"root={snapshot.root} files={len(snapshot.files)} merkle={snapshot.root_hash[:16]}"]
+    if diff is None:
+        lines.append("first snapshot of this root; nothing to compare")
+    elif diff.is_empty():
+        lines.append("no changes since last snapshot")
+    else:
+        for label, paths in (("added", diff.added), ("removed", diff.removed), ("modified", diff.modified)):
+            if paths:
+                shown = ", ".join(paths[:limit]) + (f" (+{len(paths) - limit})" if len(paths) > limit else "")
+                lines.append(f"{label} {len(paths)}: {shown}")
+    if drift:
+        lines.append(f"ledger drift in {len(drift)} path(s):")
+        for item in drift[:limit]:
+            lines.append(f"  {item.path}: ledger={str(item.ledger_hash)[:12]} disk={str(item.disk_hash)[:12]}")
+    else:
+        lines.append("ledger and disk agree for every recorded path")
+    return "\n".join(lines)